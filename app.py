@@ -1,7 +1,299 @@
+import hashlib
+import io
+import time
+
 import streamlit as st
-import pyperclip
-from utils.helpers import *
+from utils.helpers import (
+    GROQ_MODEL, create_adapt_prompt, create_budgeted_prompt, extract_text_from_pdf, extract_text_from_url
+)
+from utils.completion_cache import get_completion_cache
+from utils.dedup import get_posting_index
+from utils.history import PAGE_SIZE as HISTORY_PAGE_SIZE, get_history_store, sources_fingerprint
+from utils.http_client import http_client_stats
+from utils.ingest import ingest_sources
+from utils.length_guard import length_guard_stats
+from utils.jobs import ACTIVE as JOB_ACTIVE, get_generation_service
+from utils.ollama_engine import last_timings, preload
+from utils.prompt_budget import estimate_tokens
+from utils.rate_limit import get_rate_limiter
+from utils.retry import retry_stats
+from utils.routing import routing_stats
+from utils.scoring import UPWORK_CHAR_LIMIT, rank_variants
+from utils.singleflight import singleflight_stats
+from utils.tracing import recent_traces, span, start_metrics_server
+
+
+# Profile ingestion is memoized across reruns and sessions: keyed on the URL
+# and on the uploaded PDF's content hash, with TTL and size-bounded eviction.
+INGEST_CACHE_TTL = 60 * 60  # seconds
+INGEST_CACHE_ENTRIES = 128
+
+# How often a running generation is polled for new text
+JOB_POLL_INTERVAL = 0.5  # seconds
+
+# Traces listed in the profiling panel
+PROFILE_TRACES = 5
+
+# Most alternatives one generation can ask for
+MAX_VARIANTS = 4
+
+# Prometheus-style /metrics, when UPW_METRICS_PORT is set
+start_metrics_server()
+
+
+@st.cache_data(ttl=INGEST_CACHE_TTL, max_entries=INGEST_CACHE_ENTRIES, show_spinner=False)
+def cached_url_text(url, _misses):
+    """Memoized extract_text_from_url; errors are raised so they are never cached."""
+    _misses.append(url)
+    content = extract_text_from_url(url)
+    if content.startswith("Error"):
+        raise ValueError(content)
+    return content
+
+
+@st.cache_data(ttl=INGEST_CACHE_TTL, max_entries=INGEST_CACHE_ENTRIES, show_spinner=False)
+def cached_pdf_text(content_hash, _pdf_bytes, _misses):
+    """Memoized extract_text_from_pdf keyed on the file's SHA-256."""
+    _misses.append(content_hash)
+    content = extract_text_from_pdf(io.BytesIO(_pdf_bytes))
+    if content.startswith("Error"):
+        raise ValueError(content)
+    return content
+
+
+OLLAMA_MODELS = ["llama2", "codellama", "mistral", "neural-chat", "starling-lm"]
+
+
+def show_ollama_status(ollama_url, model):
+    """Load the selected model in the background and show how far along it is."""
+    warmup = preload(ollama_url, model)
+    if warmup["status"] == "ready":
+        st.caption(f"🟢 {model} loaded ({warmup['load_seconds']:.1f}s load) and kept warm")
+    elif warmup["status"] in ("checking", "loading"):
+        st.caption(f"⏳ Loading {model} into memory...")
+    elif warmup["status"] == "missing":
+        st.caption(f"⚠️ {warmup['error']}")
+    else:
+        st.caption("🔴 Ollama not reachable")
+
+
+def show_profile(limit):
+    """Per-stage timing breakdown of the last few traced requests."""
+    traces = recent_traces(limit)
+    if not traces:
+        st.caption("No requests traced yet")
+    for trace in traces:
+        depth = {}
+        rows = []
+        for stage in trace["spans"]:
+            depth[stage["span"]] = depth.get(stage["parent"], -1) + 1
+            rows.append({
+                "stage": "  " * depth[stage["span"]] + stage["name"],
+                "ms": round(stage["duration"] * 1000, 1),
+                "chars": stage.get("chars"),
+                "tokens": stage.get("tokens"),
+                "retries": stage.get("retries", 0),
+                "provider": stage.get("provider"),
+                "error": stage["error"],
+            })
+        st.caption(f"{trace['spans'][0]['name']} • {len(rows)} stages")
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_generation_progress(job_id):
+    """Poll a running job, showing its text as it streams in."""
+    job = get_generation_service().get(job_id)
+    if job is None or job["status"] not in JOB_ACTIVE:
+        st.rerun()
+    if job["status"] == "queued":
+        st.info(f"⏳ Waiting for a free {job['provider'].title()} slot ({job['position']} ahead of you)")
+    elif job["retry_in"] is not None:
+        st.info(f"⏳ {job['provider'].title()} asked us to slow down - retrying in {job['retry_in']:.0f}s")
+    elif job["condensing"]:
+        st.info(f"✂️ Condensing to fit Upwork's {UPWORK_CHAR_LIMIT}-character limit...")
+    elif job["variants"] is not None:
+        for number, (column, text) in enumerate(zip(st.columns(len(job["variants"])), job["variants"]), start=1):
+            column.caption(f"Variant {number} • {len(text)} characters")
+            column.markdown(text + " ▌")
+    else:
+        st.markdown(job["text"] + " ▌")
+    if st.button("⏹️ Stop"):
+        get_generation_service().cancel(job_id)
+        st.rerun()
+
+
+def show_proposal(generation, job, result, condensed_from=None):
+    """Final proposal with metrics and actions; links it to the posting once."""
+    route_info = generation["route_info"]
+    if condensed_from:
+        st.caption(f"✂️ Condensed from {condensed_from} characters to fit Upwork's limit")
+    if generation["provider"] == "auto" and route_info:
+        hedge_note = " after hedging" if route_info["hedged"] else ""
+        st.caption(f"⚡ Served by {route_info['provider']}{hedge_note}")
+    served_by_ollama = generation["provider"] == "ollama" or (
+        generation["provider"] == "auto" and route_info.get("provider", "").startswith("ollama/")
+    )
+    if served_by_ollama:
+        ollama_timings = last_timings(generation["ollama_url"], generation["ollama_model"])
+        # Nothing new when the answer came from the completion cache
+        if ollama_timings and ollama_timings != generation["timings_before"]:
+            st.caption(
+                f"🦙 Load {ollama_timings['load']:.1f}s • prompt {ollama_timings['prompt_eval']:.1f}s "
+                f"({ollama_timings['prompt_tokens']} tokens) • generation {ollama_timings['generation']:.1f}s "
+                f"({ollama_timings['tokens_per_second'] or 0} tokens/s)"
+            )
+
+    # Link the proposal to this posting for future near-duplicates, and keep it in the history
+    if result and not generation["recorded"]:
+        if generation["provider"] == "auto":
+            served_by, model = route_info.get("provider", "auto"), None
+        else:
+            served_by, model = generation["provider"], generation["model"] or GROQ_MODEL
+        posting_index = get_posting_index()
+        if posting_index is not None:
+            posting_index.record(generation["job_description"], result, served_by, model)
+        history = get_history_store()
+        if history is not None:
+            history.record(
+                generation["job_description"], result, prompt=generation["prompt"],
+                sources_hash=generation["sources_hash"], provider=served_by, model=model, seed=generation["seed"],
+                latency=job["running_for"], prompt_tokens=generation["prompt_tokens"],
+                output_tokens=estimate_tokens(result, model)
+            )
+        generation["recorded"] = True
+
+    # Metrics
+    word_count = len(result.split())
+    char_count = len(result)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("📝 Words", word_count)
+    col2.metric("📊 Characters", f"{char_count}/{UPWORK_CHAR_LIMIT}")
+
+    if char_count <= UPWORK_CHAR_LIMIT:
+        col3.metric("✅ Status", "Perfect Length")
+    else:
+        col3.metric("⚠️ Status", f"{char_count - UPWORK_CHAR_LIMIT} over limit")
+
+    # Proposal text
+    st.text_area(
+        "Your proposal:",
+        result,
+        height=400,
+        help="Copy this directly into Upwork"
+    )
+
+    # Action buttons
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.download_button(
+            "💾 Download",
+            result,
+            file_name="upwork_proposal.txt",
+            use_container_width=True
+        )
 
+    # with col2:
+    #     if st.button("🔄 Generate Another", use_container_width=True):
+    #         st.rerun()
+        # st.button("📋 Copy Text", use_container_width=True,
+        #           help="Select all text above and Ctrl+C")
+
+    # Analysis
+    if char_count <= UPWORK_CHAR_LIMIT:
+        st.success("✅ Ready to submit on Upwork!")
+    else:
+        st.warning("⚠️ Please shorten before submitting")
+
+
+def show_variants(generation, job):
+    """Variants side by side, best-scoring first, each with a button to pick it."""
+    texts = [text.strip() or None for text in job["variants"]]
+    ranked = rank_variants(texts, generation["job_description"])
+    failed = [error for error in job["variant_errors"] or [] if error]
+    if not ranked:
+        st.error(f"❌ No variant came back: {failed[0]}" if failed
+                 else "❌ Every variant came back empty - try generating again")
+        return
+    if failed:
+        st.caption(f"⚠️ {len(failed)} of {len(texts)} variants failed: {failed[0]}")
+
+    for rank, (column, entry) in enumerate(zip(st.columns(len(ranked)), ranked), start=1):
+        with column:
+            st.markdown(f"**{'⭐ ' if rank == 1 else ''}Variant {entry['index'] + 1}** • score {entry['score']:.2f}")
+            length_note = "over the limit" if entry["over_limit"] else "characters"
+            st.caption(
+                f"{entry['chars']}/{UPWORK_CHAR_LIMIT} {length_note} • "
+                f"{entry['keyword_coverage']:.0%} of the posting's key terms"
+            )
+            if job["condensed_from"] and job["condensed_from"][entry["index"]]:
+                st.caption(f"✂️ Condensed from {job['condensed_from'][entry['index']]} characters")
+            if entry["banned_phrases"]:
+                st.caption(f"🚫 {', '.join(entry['banned_phrases'])}")
+            st.text_area(f"Variant {entry['index'] + 1}", texts[entry["index"]], height=400,
+                         label_visibility="collapsed")
+            if st.button("✅ Use this one", key=f"use_variant_{entry['index']}", use_container_width=True):
+                generation["chosen"] = entry["index"]
+                st.rerun()
+
+
+def show_history(store):
+    """Search or page through past proposals; any of them can be adapted for the current posting."""
+    query = st.text_input("🔎 Search past proposals", placeholder="e.g. power bi dashboard")
+    # before_id of every page shown so far (search pages by offset, so only their count matters)
+    if query != st.session_state.get("history_query"):
+        st.session_state["history_query"] = query
+        st.session_state["history_cursors"] = [None]
+    cursors = st.session_state["history_cursors"]
+
+    started = time.perf_counter()
+    if query:
+        entries = store.search(query, HISTORY_PAGE_SIZE + 1, offset=(len(cursors) - 1) * HISTORY_PAGE_SIZE)
+    else:
+        entries = store.page(cursors[-1], HISTORY_PAGE_SIZE + 1)
+    elapsed = time.perf_counter() - started
+    has_more = len(entries) > HISTORY_PAGE_SIZE
+    entries = entries[:HISTORY_PAGE_SIZE]
+    st.caption(f"{len(store)} proposals saved • page {len(cursors)} • {elapsed * 1000:.1f} ms")
+
+    for entry in entries:
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created_at"]))
+        with st.expander(f"{created} • {entry['provider']} • {entry['chars']} chars • "
+                         f"{entry['job_description'][:80]}"):
+            if entry.get("snippet"):
+                st.markdown(entry["snippet"])
+            st.text_area("Proposal", entry["proposal"], height=250, key=f"history_text_{entry['id']}",
+                         label_visibility="collapsed")
+            if st.button("♻️ Adapt for this posting", key=f"history_adapt_{entry['id']}"):
+                st.session_state["history_draft"] = entry["proposal"]
+                st.rerun()
+
+    col1, col2, col3 = st.columns(3)
+    if len(cursors) > 1 and col1.button("◀ Newer", use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    if has_more and col2.button("Older ▶", use_container_width=True):
+        cursors.append(entries[-1]["id"])
+        st.rerun()
+    if col3.button("📤 Export all", use_container_width=True):
+        export = io.StringIO()
+        count = store.export_jsonl(export)
+        st.download_button(f"💾 Download {count} proposals (JSONL)", export.getvalue(),
+                           file_name="proposal_history.jsonl", on_click="ignore")
+
+
+def show_generation_error(provider, error):
+    st.error(f"❌ Generation failed: {error}")
+
+    # Provider-specific help
+    if provider == "groq" and "unauthorized" in error.lower():
+        st.info("💡 Check your Groq API key at https://console.groq.com/")
+    elif provider == "huggingface" and "401" in error:
+        st.info("💡 Check your HF token at https://huggingface.co/settings/tokens")
+    elif provider == "ollama":
+        st.info("💡 Make sure Ollama is running: `ollama serve`")
 
 # Page configuration
 st.set_page_config(
@@ -54,7 +346,7 @@ with (st.sidebar):
 
     provider = st.selectbox(
         "Select LLM Provider",
-        ["groq", "huggingface", "ollama"],
+        ["groq", "huggingface", "ollama", "auto"],
         help="All options are completely free!"
     )
 
@@ -72,6 +364,16 @@ with (st.sidebar):
         #     help="Get free key at https://console.groq.com/"
         # )
         st.markdown("**Get your free key:** https://console.groq.com/", unsafe_allow_html=True)
+
+        # Headroom learned from Groq's x-ratelimit-* headers
+        headroom = get_rate_limiter(api_key).snapshot()
+        if headroom["requests"]["remaining"] is not None:
+            st.caption(
+                f"Rate limit headroom: {headroom['requests']['remaining']} requests • "
+                f"{headroom['tokens']['remaining']} tokens"
+            )
+        if headroom["blocked_for"]:
+            st.caption(f"⏳ Paused by Groq for {headroom['blocked_for']:.0f}s")
         st.markdown('</div>', unsafe_allow_html=True)
 
     elif provider == "huggingface":
@@ -101,6 +403,26 @@ with (st.sidebar):
         st.markdown("**Get free token:** https://huggingface.co/settings/tokens")
         st.markdown('</div>', unsafe_allow_html=True)
 
+    elif provider == "auto":
+        st.markdown('<div class="provider-card">', unsafe_allow_html=True)
+        st.markdown('**⚡ Fastest Available** <span class="free-badge">FREE</span>', unsafe_allow_html=True)
+        st.markdown("• Routes to the quickest healthy provider")
+        st.markdown("• Hedges slow starts with a second provider")
+        st.markdown("• Skips providers that keep failing")
+        api_key = st.secrets.get("groq_api_key")
+
+        ollama_url = st.text_input("Ollama URL", value="http://localhost:11434")
+        selected_model = st.selectbox("Ollama model", OLLAMA_MODELS, index=0)
+        show_ollama_status(ollama_url, selected_model)
+
+        for route_name, route_stats in routing_stats().items():
+            p50 = f"{route_stats['p50_ttft']:.1f}s" if route_stats["p50_ttft"] is not None else "n/a"
+            st.caption(
+                f"{route_name}: first token p50 {p50} • "
+                f"{route_stats['error_rate']:.0%} errors • circuit {route_stats['circuit']}"
+            )
+        st.markdown('</div>', unsafe_allow_html=True)
+
     else:  # ollama
         st.markdown('<div class="provider-card">', unsafe_allow_html=True)
         st.markdown('**🦙 Ollama** <span class="free-badge">100% FREE</span>', unsafe_allow_html=True)
@@ -111,8 +433,8 @@ with (st.sidebar):
 
         ollama_url = st.text_input("Ollama URL", value="http://localhost:11434")
 
-        model_options = ["llama2", "codellama", "mistral", "neural-chat", "starling-lm"]
-        selected_model = st.selectbox("Model", model_options, index=0)
+        selected_model = st.selectbox("Model", OLLAMA_MODELS, index=0)
+        show_ollama_status(ollama_url, selected_model)
 
         st.markdown("**Setup Instructions:**")
         st.code("""
@@ -127,6 +449,50 @@ ollama serve
         """, language="bash")
         st.markdown('</div>', unsafe_allow_html=True)
 
+    st.markdown("---")
+    deterministic = st.checkbox(
+        "🎯 Deterministic mode",
+        help="Fix the seed so prompts and sampling are reproducible; repeats are served from cache"
+    )
+    seed = int(st.number_input("Seed", min_value=0, value=42, step=1)) if deterministic else None
+    if deterministic:
+        cache_stats = get_completion_cache().stats()
+        st.caption(
+            f"Completion cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits • "
+            f"{cache_stats['misses']} misses"
+        )
+
+    with st.expander("🔌 Connection pool"):
+        pool_stats = http_client_stats()
+        st.caption(
+            f"{pool_stats['requests']} requests • {pool_stats['handshakes']} handshakes • "
+            f"{pool_stats['reused']} reused connections"
+        )
+        for host, host_stats in pool_stats["hosts"].items():
+            st.caption(f"{host}: {host_stats['reused']}/{host_stats['requests']} reused")
+        job_stats = get_generation_service().stats()
+        st.caption(
+            f"Generation service: {job_stats['running']} running • {job_stats['queued']} queued • "
+            f"{job_stats['abandoned']} abandoned"
+        )
+        for flight_name, flights in singleflight_stats().items():
+            if flights["coalesced"]:
+                st.caption(f"Shared {flight_name} requests: {flights['coalesced']} of {flights['calls']} calls")
+        guarded = length_guard_stats()
+        if guarded["guarded"]:
+            st.caption(
+                f"Length guard: {guarded['sentence'] + guarded['limit']} of {guarded['guarded']} streams stopped "
+                f"at the limit • {guarded['condensed']} condensed • {guarded['trimmed']} trimmed"
+            )
+        for retry_provider, retries in retry_stats().items():
+            st.caption(
+                f"{retry_provider}: {retries['retries']} retries ({retries['waited']:.1f}s waiting) • "
+                f"{retries['gave_up']} gave up"
+            )
+
+    with st.expander("⏱️ Profiling"):
+        show_profile(PROFILE_TRACES)
+
     st.markdown("---")
     st.markdown("### 💡 Pro Tips")
     st.info("""
@@ -154,31 +520,25 @@ with col1:
             f'<div class="char-counter {"good" if char_count > 200 else "warning"}">Characters: {char_count}</div>',
             unsafe_allow_html=True)
 
+# Reposts and near-clones of postings we already wrote a proposal for; the
+# index (and numpy) is only loaded once there is a posting to look up
+near_duplicates = []
+if jd_input:
+    posting_index = get_posting_index()
+    if posting_index is not None:
+        near_duplicates = [match for match in posting_index.find_similar(jd_input) if match["proposals"]]
+
 with col2:
     st.markdown("### 📂 Your Background")
 
-    sources = ""
-
-    # URL input
-    link = st.text_input("Portfolio/LinkedIn URL", placeholder="https://...")
-    if link and link.startswith(('http://', 'https://')):
-        with st.spinner("Extracting profile..."):
-            url_content = extract_text_from_url(link)
-            if not url_content.startswith("Error"):
-                sources += url_content
-                st.success(f"✅ Extracted ({len(url_content)} chars)")
-            else:
-                st.error(url_content)
-
-    # PDF upload
-    pdf = st.file_uploader("Upload Resume", type="pdf")
-    if pdf:
-        pdf_content = extract_text_from_pdf(pdf)
-        if not pdf_content.startswith("Error"):
-            sources += "\n\n" + pdf_content
-            st.success(f"✅ Processed ({len(pdf_content)} chars)")
-        else:
-            st.error(pdf_content)
+    # Source inputs; everything is fetched and parsed at once below
+    links = st.text_area(
+        "Portfolio, GitHub, LinkedIn or case-study URLs",
+        height=100,
+        placeholder="https://... (one per line)"
+    )
+    urls = [line.strip() for line in links.splitlines() if line.strip().startswith(('http://', 'https://'))]
+    uploaded_pdfs = st.file_uploader("Upload Resume or case studies", type="pdf", accept_multiple_files=True)
 
     # Manual input
     manual = st.text_area(
@@ -186,8 +546,38 @@ with col2:
         height=150,
         placeholder="Add key achievements, technologies, metrics..."
     )
-    if manual:
-        sources += "\n\n" + manual
+
+    sources = ""
+    if urls or uploaded_pdfs or manual:
+        misses = []  # URLs and PDF hashes that were not cached yet
+        pdfs = [(uploaded.name, uploaded.getvalue()) for uploaded in uploaded_pdfs or []]
+        # By position: two uploads can share a file name
+        pdf_hashes = [hashlib.sha256(pdf_bytes).hexdigest() for _, pdf_bytes in pdfs]
+
+        def parse_pdf(pdf_bytes):
+            return cached_pdf_text(hashlib.sha256(pdf_bytes).hexdigest(), pdf_bytes, misses)
+
+        with st.spinner(f"Extracting {len(urls) + len(pdfs)} sources..." if urls or pdfs else "Merging..."):
+            ingested = ingest_sources(
+                urls, pdfs, [manual] if manual else [],
+                fetch_url=lambda url: cached_url_text(url, misses), parse_pdf=parse_pdf
+            )
+        sources = ingested["text"]
+
+        # Reports are in input order: the URLs, then the PDFs
+        for index, source in enumerate(ingested["sources"]):
+            if source["kind"] == "text":
+                continue
+            name = source["name"]
+            if source["status"] == "ok":
+                missed = pdf_hashes[index - len(urls)] in misses if source["kind"] == "pdf" else name in misses
+                cached_note = "" if missed else " • cached"
+                trimmed_note = f", {source['used']} used" if source["used"] < source["chars"] else ""
+                st.success(f"✅ {name} ({source['chars']} chars{trimmed_note}){cached_note}")
+            elif source["status"] == "timeout":
+                st.warning(f"⏳ {name} is taking too long - continuing without it for now")
+            else:
+                st.error(f"{name}: {source['error']}")
 
 # Preview
 if sources:
@@ -201,9 +591,51 @@ if sources:
             label_visibility="hidden"
         )
 
+# Previous proposal for a near-duplicate posting: reuse it as-is or adapt it
+prior_proposal = None
+if st.session_state.get("history_draft"):
+    prior_proposal = st.session_state["history_draft"]
+    st.info("♻️ Adapting a proposal from your history to this posting")
+    if st.button("✖️ Write from scratch instead"):
+        del st.session_state["history_draft"]
+        st.rerun()
+elif near_duplicates:
+    match = near_duplicates[0]
+    with st.expander(f"♻️ You've answered a similar posting before ({match['similarity']:.0%} match)",
+                     expanded=True):
+        st.text_area("Previous proposal", match["proposals"][0]["proposal"], height=250)
+        st.download_button(
+            "💾 Download previous proposal",
+            match["proposals"][0]["proposal"],
+            file_name="upwork_proposal.txt"
+        )
+        reuse_mode = st.radio(
+            "Generate by",
+            ["Adapting this draft", "Writing from scratch"],
+            horizontal=True,
+            help="Adapting sends a much shorter prompt built around the previous proposal"
+        )
+        if reuse_mode == "Adapting this draft":
+            prior_proposal = match["proposals"][0]["proposal"]
+
 # Generation
 st.markdown("### 🚀 Generate Proposal")
 
+variant_count = st.slider(
+    "🔀 Variants",
+    min_value=1,
+    max_value=MAX_VARIANTS,
+    value=1,
+    help="Generate several alternatives at once from the same prompt and compare them side by side, "
+         "ranked by length, coverage of the posting's key terms and stock phrases"
+)
+length_guard = st.checkbox(
+    "✂️ Stop at Upwork's limit",
+    value=True,
+    help=f"End generation at a sentence end just before {UPWORK_CHAR_LIMIT} characters instead of paying for "
+         "text that would be cut, and condense anything still over the limit"
+)
+
 # Validation
 can_generate = True
 errors = []
@@ -225,91 +657,112 @@ for error in errors:
 # Generate button
 if st.button("🆓 Generate FREE Proposal", type="primary", disabled=not can_generate):
     if can_generate:
-        with st.spinner(f"Generating proposal using {provider.title()}..."):
-            try:
-                # Create prompt
-                prompt = create_upwork_prompt(jd_input, sources)
+        try:
+            # Traced end to end; the job continues this trace in the background
+            with span("generate", provider=provider):
+                notes = []
+
+                # Create prompt sized to the model's context window; in auto
+                # mode budget for Ollama, the smaller of the routed contexts
+                budget_provider = "ollama" if provider == "auto" else provider
+                budget_model = None if provider == "groq" else selected_model
+                if prior_proposal:
+                    prompt, budget = create_adapt_prompt(jd_input, prior_proposal, budget_provider, budget_model)
+                    notes.append("♻️ Adapting your previous proposal")
+                else:
+                    prompt, budget = create_budgeted_prompt(
+                        jd_input, sources, budget_provider, budget_model, seed=seed
+                    )
+                max_tokens = budget["max_tokens"]
+                notes.append(
+                    f"🧮 ~{budget['prompt_tokens']} prompt tokens (job {budget['jd_tokens']}, "
+                    f"background {budget['background_tokens']}, instructions {budget['instruction_tokens']}) • "
+                    f"{max_tokens} output tokens of {budget['context_window']} context"
+                )
+                if budget["background_chunks_used"] is not None:
+                    notes.append(
+                        f"🔎 Using the {budget['background_chunks_used']} of {budget['background_chunks_total']} "
+                        f"background sections most relevant to this job"
+                    )
 
-                # Generate based on provider
+                # Provider arguments for get_free_completion
+                route_info = {}
                 if provider == "groq":
-                    result = get_free_completion(prompt, "groq", api_key=api_key)
+                    job_kwargs = {"api_key": api_key, "max_tokens": max_tokens}
                 elif provider == "huggingface":
-                    result = get_free_completion(
-                        prompt, "huggingface",
-                        hf_token=hf_token,
-                        model_name=selected_model
-                    )
+                    job_kwargs = {"hf_token": hf_token, "model_name": selected_model, "max_tokens": max_tokens}
+                elif provider == "auto":
+                    candidates = [{"provider": "ollama", "model": selected_model, "ollama_url": ollama_url,
+                                   "max_tokens": max_tokens}]
+                    if api_key:
+                        candidates.insert(0, {"provider": "groq", "api_key": api_key, "max_tokens": max_tokens})
+                    job_kwargs = {"candidates": candidates, "route_info": route_info}
                 else:  # ollama
-                    result = get_free_completion(
-                        prompt, "ollama",
-                        model=selected_model,
-                        ollama_url=ollama_url
-                    )
-
-                # Display results
-                st.markdown("---")
-                st.markdown("### 🎯 Generated Proposal")
-
-                # Metrics
-                word_count = len(result.split())
-                char_count = len(result)
-
-                col1, col2, col3 = st.columns(3)
-                col1.metric("📝 Words", word_count)
-                col2.metric("📊 Characters", f"{char_count}/5000")
-
-                if char_count <= 5000:
-                    col3.metric("✅ Status", "Perfect Length")
-                else:
-                    col3.metric("⚠️ Status", f"{char_count - 5000} over limit")
-
-                # Proposal text
-                st.text_area(
-                    "Your proposal:",
-                    result,
-                    height=400,
-                    help="Copy this directly into Upwork"
-                )
-
-                # Action buttons
-                col1, col2, col3 = st.columns(3)
-
-                with col1:
-                    st.download_button(
-                        "💾 Download",
-                        result,
-                        file_name="upwork_proposal.txt",
-                        use_container_width=True
-                    )
+                    job_kwargs = {"model": selected_model, "ollama_url": ollama_url, "max_tokens": max_tokens}
+                if length_guard:
+                    job_kwargs["length_limit"] = UPWORK_CHAR_LIMIT
+
+                # Runs in the background service; this script run returns at once
+                service = get_generation_service()
+                previous = st.session_state.get("generation")
+                if previous:
+                    service.cancel(previous["job_id"])
+                uses_ollama = provider in ("ollama", "auto")
+                st.session_state["generation"] = {
+                    "job_id": service.submit(provider, prompt, seed=seed, variants=variant_count, **job_kwargs),
+                    "provider": provider,
+                    "model": budget_model,
+                    "job_description": jd_input,
+                    "notes": notes,
+                    "route_info": route_info,
+                    "ollama_url": ollama_url if uses_ollama else None,
+                    "ollama_model": selected_model if uses_ollama else None,
+                    "timings_before": last_timings(ollama_url, selected_model) if uses_ollama else None,
+                    "prompt": prompt,
+                    "prompt_tokens": budget["prompt_tokens"],
+                    "sources_hash": sources_fingerprint(sources),
+                    "seed": seed,
+                    "recorded": False,
+                    "chosen": None,  # index of the variant picked, in variants mode
+                }
+
+        except Exception as e:
+            st.error(f"❌ Generation failed: {str(e)}")
+
+# Generated proposal, possibly still streaming in from an earlier run
+generation = st.session_state.get("generation")
+if generation:
+    job = get_generation_service().get(generation["job_id"])
+    if job is None:
+        del st.session_state["generation"]
+    else:
+        # Display results
+        st.markdown("---")
+        st.markdown("### 🎯 Generated Proposal")
+        for note in generation["notes"]:
+            st.caption(note)
+
+        if job["status"] in JOB_ACTIVE:
+            show_generation_progress(generation["job_id"])
+        elif job["status"] == "done" and job["variants"] is not None:
+            if generation["chosen"] is None:
+                show_variants(generation, job)
+            else:
+                chosen = generation["chosen"]
+                show_proposal(generation, job, job["variants"][chosen].strip(), job["condensed_from"][chosen])
+        elif job["status"] == "done":
+            show_proposal(generation, job, job["text"].strip(), job["condensed_from"])
+        elif job["status"] == "error":
+            show_generation_error(generation["provider"], job["error"])
+        else:
+            st.info("⏹️ Generation stopped")
 
-                # with col2:
-                #     if st.button("🔄 Generate Another", use_container_width=True):
-                #         st.rerun()
-                #
-                # with col3:
-                #     # Use a simple approach with instructions
-                #     if st.button("📋 Select Text", use_container_width=True):
-                #         pyperclip.copy(result)
-                #         st.success('Text copied successfully!')
-                    # st.button("📋 Copy Text", use_container_width=True,
-                    #           help="Select all text above and Ctrl+C")
-
-                # Analysis
-                if char_count <= 5000:
-                    st.success("✅ Ready to submit on Upwork!")
-                else:
-                    st.warning("⚠️ Please shorten before submitting")
-
-            except Exception as e:
-                st.error(f"❌ Generation failed: {str(e)}")
-
-                # Provider-specific help
-                if provider == "groq" and "unauthorized" in str(e).lower():
-                    st.info("💡 Check your Groq API key at https://console.groq.com/")
-                elif provider == "huggingface" and "401" in str(e):
-                    st.info("💡 Check your HF token at https://huggingface.co/settings/tokens")
-                elif provider == "ollama":
-                    st.info("💡 Make sure Ollama is running: `ollama serve`")
+# Past proposals, searchable
+history_store = get_history_store()
+if history_store is not None and len(history_store):
+    st.markdown("---")
+    with st.expander("🗂️ Proposal History"):
+        show_history(history_store)
 
 # Footer
 st.markdown("---")
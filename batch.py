@@ -0,0 +1,230 @@
+"""Headless batch proposal generation.
+
+Reads job postings from a JSONL or CSV file, builds prompts sized to the
+model's context window (create_budgeted_prompt) against a shared background
+and runs get_free_completion concurrently. Postings that are near-duplicates of ones
+answered before can reuse or adapt the earlier proposal (--near-duplicates),
+and generated proposals are kept in the searchable history (utils.history).
+Every finished item is appended to the
+output JSONL immediately, so an interrupted run can be resumed with
+--resume and only the missing postings are generated.
+
+Example:
+    python batch.py jobs.jsonl --background me.txt --provider groq --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.dedup import DEFAULT_THRESHOLD, get_posting_index
+from utils.history import get_history_store, sources_fingerprint
+from utils.helpers import GROQ_MODEL, create_adapt_prompt, create_budgeted_prompt, fit_to_limit, get_free_completion
+from utils.ingest import ingest_sources
+from utils.prompt_budget import estimate_tokens
+from utils.scoring import UPWORK_CHAR_LIMIT
+from utils.tracing import span
+
+JD_FIELDS = ("job_description", "description", "jd", "text")
+
+
+def load_jobs(path):
+    """Return [(id, job_description)] from a JSONL or CSV file."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for index, row in enumerate(rows, start=1):
+        jd = next((row[field] for field in JD_FIELDS if row.get(field)), None)
+        if not jd:
+            raise SystemExit(f"{path}: row {index} has none of the fields {', '.join(JD_FIELDS)}")
+        jobs.append((str(row.get("id") or index), jd))
+    return jobs
+
+
+def load_background(args):
+    """Build the shared sources string the same way app.py does."""
+    pdfs = []
+    for path in args.background_pdf:
+        with open(path, "rb") as f:
+            pdfs.append((path, f.read()))
+    texts = []
+    for path in args.background:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+
+    ingested = ingest_sources(args.background_url, pdfs, texts)
+    for source in ingested["sources"]:
+        if source["status"] != "ok":
+            print(f"{source['name']}: {source['error']}", file=sys.stderr)
+    return ingested["text"]
+
+
+def completed_ids(path):
+    """IDs already generated successfully in an earlier run."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn final line from a crash
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def _ends_cleanly(path):
+    """False if a crash left a partial last line we must not append onto."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return True
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def provider_kwargs(args):
+    """get_free_completion's provider arguments from the command line, with each provider's defaults."""
+    if args.provider == "groq":
+        return {"api_key": args.api_key or os.environ.get("GROQ_API_KEY")}
+    if args.provider == "huggingface":
+        return {"hf_token": args.hf_token or os.environ.get("HF_TOKEN"),
+                "model_name": args.model or "microsoft/DialoGPT-medium"}
+    return {"model": args.model or "llama2", "ollama_url": args.ollama_url}
+
+
+def percentile(values, pct):
+    """The pct-th percentile (nearest rank) of values, 0.0 when there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def generate_one(job_id, jd, sources, args, kwargs):
+    with span("batch_item", id=job_id, provider=args.provider):
+        return _generate_one(job_id, jd, sources, args, kwargs)
+
+
+def _generate_one(job_id, jd, sources, args, kwargs):
+    started = time.perf_counter()
+    record = {"id": job_id, "provider": args.provider}
+    index = get_posting_index()
+    try:
+        match = None
+        if index is not None and args.near_duplicates != "regenerate":
+            matches = [m for m in index.find_similar(jd, args.duplicate_threshold) if m["proposals"]]
+            match = matches[0] if matches else None
+
+        if match and args.near_duplicates == "reuse":
+            record["proposal"] = match["proposals"][0]["proposal"]
+        else:
+            # Same budgeting as the app: the prompt fits the context and leaves room for max_tokens
+            model = kwargs.get("model_name") or kwargs.get("model") or GROQ_MODEL
+            if match:
+                prompt, budget = create_adapt_prompt(jd, match["proposals"][0]["proposal"], args.provider, model)
+            else:
+                prompt, budget = create_budgeted_prompt(jd, sources, args.provider, model, seed=args.seed)
+            proposal = get_free_completion(
+                prompt, args.provider, seed=args.seed, **dict(kwargs, max_tokens=budget["max_tokens"])
+            )
+            if kwargs.get("length_limit") and len(proposal) > kwargs["length_limit"]:
+                record["condensed_from"] = len(proposal)
+                proposal = fit_to_limit(proposal, args.provider, kwargs["length_limit"], seed=args.seed, **kwargs)
+            record["proposal"] = proposal
+            if index is not None:
+                index.record(jd, record["proposal"], args.provider, model)
+            history = get_history_store()
+            if history is not None:
+                history.record(
+                    jd, proposal, prompt=prompt, sources_hash=sources_fingerprint(sources), provider=args.provider,
+                    model=model, seed=args.seed, latency=round(time.perf_counter() - started, 3),
+                    prompt_tokens=budget["prompt_tokens"],
+                    output_tokens=estimate_tokens(proposal, model)
+                )
+        if match:
+            record["near_duplicate_of"] = match["posting_id"]
+            record["similarity"] = match["similarity"]
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["latency"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Upwork proposals for many job postings at once.")
+    parser.add_argument("jobs", help="JSONL or CSV file of job postings")
+    parser.add_argument("-o", "--output", default="proposals.jsonl", help="results file (JSONL, appended)")
+    parser.add_argument("--background", action="append", default=[], help="text file with your background")
+    parser.add_argument("--background-url", action="append", default=[], help="portfolio/LinkedIn URL")
+    parser.add_argument("--background-pdf", action="append", default=[], help="resume PDF")
+    parser.add_argument("--provider", choices=["groq", "huggingface", "ollama"], default="groq")
+    parser.add_argument("--api-key", help="Groq API key (default: $GROQ_API_KEY)")
+    parser.add_argument("--hf-token", help="Hugging Face token (default: $HF_TOKEN)")
+    parser.add_argument("--model", help="model name for Hugging Face or Ollama")
+    parser.add_argument("--ollama-url", default="http://localhost:11434")
+    parser.add_argument("--seed", type=int, help="deterministic mode seed")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="concurrent generations")
+    parser.add_argument("--resume", action="store_true", help="skip postings already in the output file")
+    parser.add_argument("--near-duplicates", choices=["regenerate", "adapt", "reuse"], default="regenerate",
+                        help="what to do with postings similar to ones answered before")
+    parser.add_argument("--duplicate-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Jaccard similarity above which a posting counts as a near-duplicate")
+    parser.add_argument("--no-length-guard", action="store_true",
+                        help=f"let proposals run past Upwork's {UPWORK_CHAR_LIMIT}-character limit")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.jobs)
+    if args.resume:
+        done = completed_ids(args.output)
+        skipped = len(jobs)
+        jobs = [job for job in jobs if job[0] not in done]
+        skipped -= len(jobs)
+        if skipped:
+            print(f"Resuming: {skipped} postings already done", file=sys.stderr)
+
+    sources = load_background(args)
+    kwargs = provider_kwargs(args)
+    if not args.no_length_guard:
+        kwargs["length_limit"] = UPWORK_CHAR_LIMIT
+    latencies = []
+    failures = 0
+
+    started = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        if not _ends_cleanly(args.output):
+            out.write("\n")
+        futures = [pool.submit(generate_one, job_id, jd, sources, args, kwargs) for job_id, jd in jobs]
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            latencies.append(record["latency"])
+            if record["status"] != "ok":
+                failures += 1
+                print(f"[{record['id']}] failed: {record['error']}", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    print(f"Generated {total - failures}/{total} proposals in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.2f} items/s, {args.workers} workers)")
+    if latencies:
+        print(f"Latency: mean {sum(latencies) / total:.2f}s • p50 {percentile(latencies, 50):.2f}s • "
+              f"p95 {percentile(latencies, 95):.2f}s • max {max(latencies):.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Offline benchmark suite.
+
+Runs every benchmark against local stand-in servers (no network, no API
+keys) and writes the results as JSON, so runs on different commits or
+machines can be compared with --compare.
+
+Examples:
+    python -m benchmarks -o bench.json
+    python -m benchmarks --profile slow --scenario flaky --only completion
+    python -m benchmarks -o new.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+# Keep the benchmark's caches away from the user's and start every run cold
+os.environ["UPW_CACHE_DIR"] = tempfile.mkdtemp(prefix="upw-bench-")
+
+from benchmarks.fixtures import HTML_FIXTURES  # noqa: E402
+from benchmarks.stubs import PROFILES, SCENARIOS, StubServer  # noqa: E402
+from benchmarks import suite  # noqa: E402
+from benchmarks.suite import SCHEMA_VERSION, git_commit  # noqa: E402
+
+
+def compare(results, baseline):
+    """Print the p50 change of every case present in both runs."""
+    print(f"\n{'case':45s} {'baseline':>11s} {'now':>11s} {'change':>8s}")
+    for name, stats in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        change = (stats["p50"] - before["p50"]) / before["p50"] * 100 if before["p50"] else 0.0
+        print(f"{name:45s} {before['p50'] * 1000:9.2f}ms {stats['p50'] * 1000:9.2f}ms {change:+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the proposal pipeline against local stub APIs.")
+    parser.add_argument("-o", "--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("-n", "--iterations", type=int, default=20, help="iterations per I/O-bound case")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="stub latency profile")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="happy", help="injected API failures")
+    parser.add_argument("--output-tokens", type=int, default=200, help="tokens per stub completion")
+    parser.add_argument("--only", action="append", help="run cases whose name contains this (repeatable)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    with StubServer(args.profile, args.scenario, args.output_tokens, fixtures=HTML_FIXTURES) as stub:
+        started = time.time()
+        results = suite.run(stub, args.iterations, args.only, log=lambda line: print(line, file=sys.stderr))
+        requests_served = dict(stub.state.counts)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started": round(started, 3),
+            "profile": args.profile,
+            "scenario": args.scenario,
+            "iterations": args.iterations,
+            "output_tokens": args.output_tokens,
+            "stub_requests": requests_served,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
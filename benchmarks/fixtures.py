@@ -0,0 +1,95 @@
+"""Deterministic HTML pages and PDFs for the extraction benchmarks.
+
+Everything is generated in memory so the suite needs no checked-in binaries
+and no network: HTML fixtures look like portfolio/profile pages (navigation,
+inline scripts and styles, long project write-ups), PDFs are minimal but
+valid text PDFs with one résumé-like page per entry.
+"""
+import random
+
+WORDS = ("python sql pandas dashboard pipeline analytics client revenue forecast model churn cohort tableau "
+         "airflow spark warehouse stakeholder report automation insight metric growth retention experiment "
+         "delivered reduced improved built designed migrated scaled optimized launched").split()
+
+
+def _sentences(rng, count):
+    out = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+        out.append(" ".join(words).capitalize() + f", improving results by {rng.randint(10, 90)}%.")
+    return out
+
+
+def html_page(projects, seed=0):
+    """A profile page with `projects` write-ups plus the usual page chrome."""
+    rng = random.Random(seed)
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Portfolio</title>",
+        "<style>" + "body{margin:0} .card{padding:1rem}" * 50 + "</style>",
+        "<script>" + "window.dataLayer=window.dataLayer||[];" * 100 + "</script>",
+        "</head><body><nav><ul>" + "".join(f"<li><a href='#p{i}'>Project {i}</a></li>" for i in range(projects)),
+        "</ul></nav><main><h1>Data Analyst &amp; Engineer</h1>",
+    ]
+    for i in range(projects):
+        parts.append(f"<section id='p{i}' class='card'><h2>Project {i}</h2>")
+        parts.extend(f"<p>{sentence}</p>" for sentence in _sentences(rng, 6))
+        parts.append("<pre>SELECT client, SUM(revenue) FROM sales GROUP BY client;</pre></section>")
+    parts.append("<footer><script>console.log('bye')</script>&copy; 2024</footer></body></html>")
+    return "".join(parts)
+
+
+HTML_FIXTURES = {
+    "profile-small.html": html_page(3, seed=1),
+    "profile-medium.html": html_page(40, seed=2),
+    "profile-large.html": html_page(600, seed=3),
+}
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """Minimal PDF with one Helvetica text page per string in pages."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {font} 0 R >> >> >>")
+        lines = " T* ".join(f"({_escape(line)}) Tj" for line in text.split("\n"))
+        content = f"BT /F1 10 Tf 12 TL 50 750 Td {lines} ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def resume_pdf(page_count, seed=0):
+    rng = random.Random(seed)
+    return make_pdf(["\n".join(_sentences(rng, 40)) for _ in range(page_count)])
+
+
+PDF_FIXTURES = {
+    "resume-2p.pdf": resume_pdf(2, seed=1),
+    "resume-30p.pdf": resume_pdf(30, seed=2),
+}
+
+JOB_DESCRIPTION = (
+    "We need an experienced data analyst to audit our sales reporting. Our weekly revenue dashboard in "
+    "Tableau takes two days to refresh and the numbers don't match finance. You will trace the SQL "
+    "pipeline, fix the joins, automate the refresh with Airflow and document everything. "
+) * 4
+
+_background_rng = random.Random(7)
+BACKGROUND = "\n\n".join(" ".join(_sentences(_background_rng, 5)) for _ in range(60))
@@ -0,0 +1,506 @@
+"""Concurrent load test of app.py against the local stub APIs.
+
+The app runs under a real `streamlit run` server in a subprocess, with the
+providers pointed at benchmarks.stubs through UPW_GROQ_API_URL and
+UPW_HF_API_URL. Each simulated user is a headless client speaking
+Streamlit's websocket protocol the way the browser does: it opens the page,
+pastes a job description, enters a portfolio URL, uploads a résumé PDF
+through the upload endpoint, clicks Generate, and keeps re-running the
+progress fragment on its timer until the proposal is displayed.
+
+Concurrency is stepped up level by level (--levels); each level reports
+sessions per second, generation and end-to-end latency percentiles and the
+server process's peak thread count and resident memory. The saturation point
+is the last level before throughput stops growing by SATURATION_GAIN.
+
+(Streamlit's AppTest cannot be used here: each run swaps process-wide
+runtime, secrets and config objects, so concurrent sessions break each other,
+and it cannot upload files.)
+
+Examples:
+    python -m benchmarks.loadtest --levels 1,2,4,8,16 -o load.json
+    python -m benchmarks.loadtest --provider ollama --profile local --inputs shared
+    python -m benchmarks.loadtest -o new.json --compare load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from benchmarks.fixtures import HTML_FIXTURES, JOB_DESCRIPTION, _sentences, resume_pdf
+from benchmarks.stubs import PROFILES, SCENARIOS, StubServer
+from benchmarks.suite import SCHEMA_VERSION, git_commit, percentile
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PROVIDERS = ("groq", "huggingface", "ollama", "auto")
+DEFAULT_LEVELS = "1,2,4,8,16,32"
+SATURATION_GAIN = 0.1  # a level must add 10% throughput to count as scaling
+SESSION_TIMEOUT = 120.0  # seconds a user waits for each step
+SERVER_START_TIMEOUT = 60.0
+SAMPLE_INTERVAL = 0.2  # seconds between server thread/memory samples
+
+# Widget labels in app.py
+PROVIDER_SELECT = "Select LLM Provider"
+HF_TOKEN = "HF Token"
+OLLAMA_URL = "Ollama URL"
+JOB_DESCRIPTION_INPUT = "Paste Upwork Job Description"
+URL_INPUT = "Portfolio, GitHub, LinkedIn or case-study URLs"
+PDF_INPUT = "Upload Resume or case studies"
+GENERATE = "🆓 Generate FREE Proposal"
+PROPOSAL_METRIC = "📝 Words"
+
+SHARED_PDF = resume_pdf(2, seed=1)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """`streamlit run app.py` in a subprocess; use as a context manager."""
+
+    def __init__(self, env, port=None):
+        self.port = port or _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(os.environ, **env)
+        self.process = None
+
+    def start(self):
+        # st.secrets are read from .streamlit/secrets.toml in the working directory
+        workdir = tempfile.mkdtemp(prefix="upw-load-")
+        os.makedirs(os.path.join(workdir, ".streamlit"))
+        with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+            f.write('groq_api_key = "load-test"\n')
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+             "--server.port", str(self.port), "--server.address", "127.0.0.1",
+             "--server.enableXsrfProtection", "false", "--server.fileWatcherType", "none",
+             "--browser.gatherUsageStats", "false", "--logger.level", "error"],
+            cwd=workdir, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise Exception(f"Streamlit exited: {self.process.stderr.read().decode(errors='replace')}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise Exception(f"Streamlit did not start within {SERVER_START_TIMEOUT:.0f}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def usage(self):
+        """(threads, resident MB) of the server process; Nones where /proc is unavailable."""
+        threads = memory = None
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("Threads:"):
+                        threads = int(line.split()[1])
+                    elif line.startswith("VmRSS:"):
+                        memory = int(line.split()[1]) / 1024
+        except (OSError, ValueError):
+            pass
+        return threads, memory
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class Session:
+    """One browser tab: a websocket session that reruns the script with widget values."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.ws = None
+        self.session_id = None
+        self.widgets = {}  # label -> (element type, widget id)
+        self.states = {}  # widget id -> WidgetState, resent on every rerun like the browser does
+        self.fragment_id = None
+        self.running = False
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+        self.ws = await websocket_connect(self.base_url.replace("http", "ws", 1) + "/_stcore/stream")
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    async def _receive(self, timeout):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        data = await asyncio.wait_for(self.ws.read_message(), timeout)
+        if data is None:
+            raise Exception("Server closed the session")
+        msg = ForwardMsg()
+        msg.ParseFromString(data)
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id
+        elif kind == "session_status_changed":
+            self.running = msg.session_status_changed.script_is_running
+        elif kind == "script_finished":
+            self.running = False
+        elif kind == "auto_rerun":
+            self.fragment_id = msg.auto_rerun.fragment_id
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            element_type = element.WhichOneof("type")
+            widget = getattr(element, element_type)
+            if hasattr(widget, "id") and hasattr(widget, "label") and widget.id:
+                self.widgets[widget.label] = (element_type, widget.id)
+        return msg
+
+    def _send_rerun(self, trigger=None, fragment_id=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        msg = BackMsg()
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        if trigger:
+            msg.rerun_script.widget_states.widgets.add(id=self.widget_id(trigger), trigger_value=True)
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+            msg.rerun_script.is_auto_rerun = True
+        self.running = True
+        self.ws.write_message(msg.SerializeToString(), binary=True)
+
+    async def rerun(self, trigger=None):
+        """Rerun the script; returns the elements it rendered."""
+        self._send_rerun(trigger)
+        elements = []
+        while True:
+            msg = await self._receive(SESSION_TIMEOUT)
+            if msg.WhichOneof("type") == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                elements.append(msg.delta.new_element)
+            elif msg.WhichOneof("type") == "script_finished":
+                return elements
+
+    def click(self, label):
+        """Press a button; follow the rerun it starts with wait_for."""
+        self._send_rerun(trigger=label)
+
+    def widget_id(self, label):
+        if label not in self.widgets:
+            raise Exception(f"No widget labelled {label!r} on the page")
+        return self.widgets[label][1]
+
+    def set_value(self, label, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        widget_id = self.widget_id(label)
+        self.states[widget_id] = WidgetState(id=widget_id, **value)
+
+    async def upload(self, label, name, data):
+        """Upload a file the way the browser does and select it in the uploader."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from tornado.httpclient import AsyncHTTPClient
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        request = BackMsg()
+        request.file_urls_request.request_id = uuid.uuid4().hex
+        request.file_urls_request.file_names.append(name)
+        request.file_urls_request.session_id = self.session_id
+        self.ws.write_message(request.SerializeToString(), binary=True)
+        while True:
+            msg = await self._receive(SESSION_TIMEOUT)
+            if (msg.WhichOneof("type") == "file_urls_response"
+                    and msg.file_urls_response.response_id == request.file_urls_request.request_id):
+                break
+        urls = msg.file_urls_response.file_urls[0]
+
+        boundary = uuid.uuid4().hex
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+                f"Content-Type: application/pdf\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        url = urls.upload_url if urls.upload_url.startswith("http") else self.base_url + "/" + urls.upload_url.lstrip("/")
+        await AsyncHTTPClient().fetch(url, method="PUT", body=body, request_timeout=SESSION_TIMEOUT,
+                                      headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+        widget_id = self.widget_id(label)
+        state = WidgetState(id=widget_id)
+        state.file_uploader_state_value.max_file_id = 1
+        state.file_uploader_state_value.uploaded_file_info.add(
+            file_id=urls.file_id, name=name, size=len(data), file_urls=urls)
+        self.states[widget_id] = state
+
+    async def wait_for(self, label, fail_on_error=True):
+        """Follow reruns (re-running the progress fragment on its timer) until an element labelled label appears."""
+        deadline = time.monotonic() + SESSION_TIMEOUT
+        interval = None
+        while time.monotonic() < deadline:
+            try:
+                msg = await self._receive(interval or SESSION_TIMEOUT)
+            except asyncio.TimeoutError:
+                if self.fragment_id and not self.running:
+                    self._send_rerun(fragment_id=self.fragment_id)
+                continue
+            if msg.WhichOneof("type") == "auto_rerun":
+                interval = msg.auto_rerun.interval
+            if msg.WhichOneof("type") != "delta" or msg.delta.WhichOneof("type") != "new_element":
+                continue
+            element = msg.delta.new_element
+            element_type = element.WhichOneof("type")
+            if getattr(getattr(element, element_type), "label", None) == label:
+                return
+            if fail_on_error and element_type == "exception":
+                raise Exception(f"{element.exception.type}: {element.exception.message}")
+            if fail_on_error and element_type == "alert" and element.alert.body.startswith("❌"):
+                raise Exception(element.alert.body)
+        raise Exception(f"No {label!r} after {SESSION_TIMEOUT:.0f}s")
+
+
+def session_inputs(number, stub, inputs):
+    """Job description, profile URL and PDF for one simulated user.
+
+    "unique" inputs miss every cache and the near-duplicate index; "shared"
+    inputs are identical across users, so after the first session the
+    extraction caches serve them and later postings are adapted from the
+    first proposal.
+    """
+    url = f"{stub.base_url}/fixtures/profile-medium.html"
+    if inputs == "shared":
+        return JOB_DESCRIPTION, url, SHARED_PDF
+    rng = random.Random(number)
+    job_description = " ".join(_sentences(rng, 12))
+    return job_description, f"{url}?session={number}", resume_pdf(2, seed=number)
+
+
+async def run_session(number, app, stub, provider, inputs):
+    """One user's visit; returns its timings and outcome."""
+    from streamlit.proto.Alert_pb2 import Alert
+
+    job_description, url, pdf = session_inputs(number, stub, inputs)
+    result = {"ok": False, "error": None}
+    session = Session(app.base_url)
+    started = time.perf_counter()
+    try:
+        await session.connect()
+        await session.rerun()
+        result["page_load"] = time.perf_counter() - started
+
+        if provider != "groq":
+            session.set_value(PROVIDER_SELECT, string_value=provider)
+            await session.rerun()
+        if provider == "huggingface":
+            session.set_value(HF_TOKEN, string_value="load-test")
+        if provider in ("ollama", "auto"):
+            session.set_value(OLLAMA_URL, string_value=stub.ollama_url)
+
+        ingest_started = time.perf_counter()
+        session.set_value(JOB_DESCRIPTION_INPUT, string_value=job_description)
+        session.set_value(URL_INPUT, string_value=url)
+        await session.upload(PDF_INPUT, "resume.pdf", pdf)
+        elements = await session.rerun()
+        result["ingest"] = time.perf_counter() - ingest_started
+        alerts = [e.alert for e in elements if e.WhichOneof("type") == "alert"]
+        if any(alert.format == Alert.ERROR for alert in alerts):
+            raise Exception("; ".join(alert.body for alert in alerts if alert.format == Alert.ERROR))
+        if sum(alert.format == Alert.SUCCESS for alert in alerts) < 2:
+            raise Exception("Profile URL or résumé was not ingested")
+
+        clicked = time.perf_counter()
+        session.click(GENERATE)
+        await session.wait_for(PROPOSAL_METRIC)
+        result["generation"] = time.perf_counter() - clicked
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    finally:
+        session.close()
+    result["total"] = time.perf_counter() - started
+    return result
+
+
+def _latency(values):
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4),
+    }
+
+
+async def run_level(concurrency, sessions, app, stub, provider, inputs, first_session):
+    """Run `sessions` users with `concurrency` of them active at a time."""
+    threads_before, memory_before = app.usage()
+    samples = []
+    numbers = iter(range(first_session, first_session + sessions))
+    results = []
+
+    async def user():
+        for number in numbers:
+            results.append(await run_session(number, app, stub, provider, inputs))
+
+    async def sample():
+        while True:
+            samples.append(app.usage())
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    sampler = asyncio.ensure_future(sample())
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    threads = [t for t, _ in samples if t is not None]
+    memory = [m for _, m in samples if m is not None]
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(ok) / elapsed, 3) if elapsed else None,
+        "generation": _latency([r["generation"] for r in ok]),
+        "total": _latency([r["total"] for r in ok]),
+        "page_load": _latency([r["page_load"] for r in results if "page_load" in r]),
+        "ingest": _latency([r["ingest"] for r in results if "ingest" in r]),
+        "server_threads_start": threads_before,
+        "server_threads_peak": max(threads) if threads else None,
+        "server_memory_mb_start": round(memory_before, 1) if memory_before is not None else None,
+        "server_memory_mb_peak": round(max(memory), 1) if memory else None,
+    }
+
+
+def saturation_point(levels):
+    """Concurrency beyond which more users stop adding throughput (None if still scaling)."""
+    best = None
+    for level in levels:
+        throughput = level["sessions_per_second"] or 0.0
+        if best is not None and throughput < best["sessions_per_second"] * (1 + SATURATION_GAIN):
+            return best["concurrency"]
+        if best is None or throughput > best["sessions_per_second"]:
+            best = dict(level, sessions_per_second=throughput)
+    return None
+
+
+def _format(level):
+    def ms(stats, key):
+        return f"{stats[key] * 1000:7.0f}" if stats else "    n/a"
+    generation = level["generation"]
+    return (f"{level['concurrency']:5d} users {level['completed']:4d}/{level['sessions']:<4d} ok "
+            f"{level['sessions_per_second'] or 0:6.2f} sessions/s  generation p50 {ms(generation, 'p50')} "
+            f"p95 {ms(generation, 'p95')} p99 {ms(generation, 'p99')} ms  "
+            f"threads {level['server_threads_peak']}  rss {level['server_memory_mb_peak']} MB")
+
+
+def compare(levels, baseline):
+    """Print the throughput and p95 change per concurrency level present in both runs."""
+    before = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    print(f"\n{'users':>5s} {'baseline':>10s} {'now':>10s} {'change':>8s} {'p95 change':>11s}")
+    for level in levels:
+        old = before.get(level["concurrency"])
+        if not old or not old["sessions_per_second"]:
+            continue
+        now = level["sessions_per_second"] or 0
+        change = (now - old["sessions_per_second"]) / old["sessions_per_second"] * 100
+        p95 = ""
+        if level["generation"] and old["generation"]:
+            p95 = f"{(level['generation']['p95'] - old['generation']['p95']) / old['generation']['p95'] * 100:+10.1f}%"
+        print(f"{level['concurrency']:5d} {old['sessions_per_second']:8.2f}/s {now:8.2f}/s {change:+7.1f}% {p95}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test app.py with concurrent sessions against stub APIs.")
+    parser.add_argument("-o", "--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--levels", default=DEFAULT_LEVELS, help="comma-separated concurrent users per level")
+    parser.add_argument("--rounds", type=int, default=3, help="sessions per level = concurrency x rounds")
+    parser.add_argument("--provider", choices=PROVIDERS, default="groq", help="provider the users pick")
+    parser.add_argument("--inputs", choices=("unique", "shared"), default="unique",
+                        help="unique inputs per user (cold caches) or the same inputs for everyone")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="stub latency profile")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="happy", help="injected API failures")
+    parser.add_argument("--output-tokens", type=int, default=200, help="tokens per stub completion")
+    parser.add_argument("--port", type=int, help="port for the Streamlit server (default: any free port)")
+    parser.add_argument("--compare", help="earlier load test JSON to compare against")
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+
+    with StubServer(args.profile, args.scenario, args.output_tokens, fixtures=HTML_FIXTURES) as stub:
+        env = {
+            "UPW_GROQ_API_URL": stub.groq_url,
+            "UPW_HF_API_URL": stub.hf_url,
+            # A fresh cache directory: every run starts cold
+            "UPW_CACHE_DIR": tempfile.mkdtemp(prefix="upw-load-cache-"),
+        }
+        with AppServer(env, args.port) as app:
+            started = time.time()
+            results = []
+            first_session = 0
+            loop = asyncio.new_event_loop()
+            try:
+                for concurrency in levels:
+                    sessions = concurrency * args.rounds
+                    results.append(loop.run_until_complete(run_level(
+                        concurrency, sessions, app, stub, args.provider, args.inputs, first_session)))
+                    first_session += sessions
+                    print(_format(results[-1]), file=sys.stderr)
+            finally:
+                loop.close()
+        requests_served = dict(stub.state.counts)
+
+    saturated_at = saturation_point(results)
+    print(f"Throughput saturates at {saturated_at} concurrent users" if saturated_at
+          else "Throughput still scaling at the highest level", file=sys.stderr)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "started": round(started, 3),
+            "provider": args.provider,
+            "inputs": args.inputs,
+            "profile": args.profile,
+            "scenario": args.scenario,
+            "rounds": args.rounds,
+            "output_tokens": args.output_tokens,
+            "stub_requests": requests_served,
+        },
+        "saturation_concurrency": saturated_at,
+        "levels": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Cold-start profile of app.py with budget checks.
+
+Three measurements, each in a fresh interpreter so nothing is warm:
+
+    imports      app.py's own import statements under `python -X importtime`
+    first run    one full script run (Streamlit AppTest), the work before the
+                 first paint
+    cold start   `streamlit run` from process start to the first rendered page
+                 as a browser session sees it
+
+Each has a budget, and the first run must not load any of HEAVY_MODULES:
+parsers, provider clients and numpy are imported only when a session first
+needs them. Exits non-zero when a budget is exceeded, so it can gate CI.
+
+Examples:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --cold-start-budget-ms 4000 -o startup.json
+"""
+import argparse
+import ast
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.loadtest import APP, AppServer, Session
+from benchmarks.suite import SCHEMA_VERSION, git_commit
+
+# Must stay unloaded until a session uploads a PDF, fetches a URL or generates
+HEAVY_MODULES = ("requests", "urllib3", "numpy", "PyPDF2", "bs4", "lxml", "pandas", "pyarrow", "http.server")
+
+IMPORT_BUDGET_MS = 500
+FIRST_RUN_BUDGET_MS = 750
+COLD_START_BUDGET_MS = 4000
+TOP_IMPORTS = 10
+APP_IMPORTS_MARK = "-- app.py imports --\n"
+
+FIRST_RUN = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+started = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=60)
+at.secrets["groq_api_key"] = "startup-profile"
+at.run()
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "exception": [e.message for e in at.exception],
+    "heavy_modules": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def app_imports(path=APP):
+    """app.py's top-level import statements, as source."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def _python(code, env, importtime=False):
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(args, capture_output=True, text=True, env=env,
+                          cwd=os.path.dirname(APP), check=False)
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+def profile_imports(env):
+    """Time app.py's imports; returns totals, the slowest top-level imports and heavy modules loaded."""
+    # Interpreter start-up imports come first; count only what app.py pulls in
+    code = "\n".join([f"import sys; sys.stderr.write({APP_IMPORTS_MARK!r})"] + app_imports() + [
+        "import json, sys",
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))",
+    ])
+    started = time.perf_counter()
+    result = _python(code, env, importtime=True)
+    wall = time.perf_counter() - started
+    if result.returncode:
+        raise Exception(f"Importing app.py's modules failed:\n{result.stderr[-2000:]}")
+    rows = parse_importtime(result.stderr.split(APP_IMPORTS_MARK, 1)[-1])
+    top_level = [row for row in rows if row[3] == 0]
+    total_us = sum(row[2] for row in top_level)
+    slowest = sorted(top_level, key=lambda row: -row[2])[:TOP_IMPORTS]
+    return {
+        "ms": round(total_us / 1000, 1),
+        "process_ms": round(wall * 1000, 1),
+        "modules": len(rows),
+        "slowest": [{"module": name, "ms": round(cumulative / 1000, 1)} for name, _, cumulative, _ in slowest],
+        "heavy_modules": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def profile_first_run(env):
+    """One script run in a fresh interpreter; returns its time and the heavy modules it loaded."""
+    result = _python(FIRST_RUN.format(app=APP, heavy=HEAVY_MODULES), env)
+    if result.returncode:
+        raise Exception(f"First script run failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    if report["exception"]:
+        raise Exception(f"app.py raised on its first run: {report['exception'][0]}")
+    return {"ms": round(report["seconds"] * 1000, 1), "heavy_modules": report["heavy_modules"]}
+
+
+def profile_cold_start(env):
+    """Process start to first rendered page under `streamlit run`, then a second (warm) session."""
+    async def render(base_url):
+        session = Session(base_url)
+        try:
+            await session.connect()
+            await session.rerun()
+        finally:
+            session.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        started = time.perf_counter()
+        with AppServer(env) as app:
+            listening = time.perf_counter()
+            loop.run_until_complete(render(app.base_url))
+            first = time.perf_counter()
+            loop.run_until_complete(render(app.base_url))
+            second = time.perf_counter()
+            threads, memory = app.usage()
+    finally:
+        loop.close()
+    return {
+        "ms": round((first - started) * 1000, 1),
+        "server_ready_ms": round((listening - started) * 1000, 1),
+        "first_render_ms": round((first - listening) * 1000, 1),
+        "warm_render_ms": round((second - first) * 1000, 1),
+        "server_threads": threads,
+        "server_memory_mb": round(memory, 1) if memory is not None else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile app.py's cold start and check it against budgets.")
+    parser.add_argument("-o", "--output", help="write results JSON here")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--first-run-budget-ms", type=float, default=FIRST_RUN_BUDGET_MS)
+    parser.add_argument("--cold-start-budget-ms", type=float, default=COLD_START_BUDGET_MS)
+    parser.add_argument("--skip-server", action="store_true", help="skip the `streamlit run` cold start")
+    args = parser.parse_args(argv)
+
+    # A fresh cache directory: nothing from earlier runs is loaded at startup
+    env = dict(os.environ, UPW_CACHE_DIR=tempfile.mkdtemp(prefix="upw-startup-"))
+    results = {"imports": profile_imports(env), "first_run": profile_first_run(env)}
+    if not args.skip_server:
+        results["cold_start"] = profile_cold_start(env)
+
+    budgets = {"imports": args.import_budget_ms, "first_run": args.first_run_budget_ms,
+               "cold_start": args.cold_start_budget_ms}
+    failures = []
+    for name, stats in results.items():
+        status = "ok" if stats["ms"] <= budgets[name] else "OVER BUDGET"
+        print(f"{name:12s} {stats['ms']:9.1f} ms   budget {budgets[name]:7.0f} ms   {status}", file=sys.stderr)
+        if status != "ok":
+            failures.append(f"{name} took {stats['ms']:.0f}ms (budget {budgets[name]:.0f}ms)")
+        if stats.get("heavy_modules"):
+            failures.append(f"{name} loaded {', '.join(stats['heavy_modules'])}")
+    for entry in results["imports"]["slowest"]:
+        print(f"    {entry['module']:40s} {entry['ms']:8.1f} ms", file=sys.stderr)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+
+    if args.output:
+        report = {
+            "schema": SCHEMA_VERSION,
+            "meta": {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform()},
+            "budgets_ms": budgets,
+            "results": results,
+            "failures": failures,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""Local stand-ins for the Groq, Ollama and Hugging Face HTTP APIs.
+
+One threaded server answers all three providers on 127.0.0.1:
+
+    POST /openai/v1/chat/completions   Groq (JSON or SSE stream)
+    POST /models/<model>               Hugging Face inference
+    POST /api/generate, /api/chat      Ollama (JSON or NDJSON stream)
+    GET  /api/tags                     Ollama model list
+    GET  /fixtures/<name>              HTML fixtures, for URL extraction
+
+Timing follows a latency profile (time to first token, tokens per second,
+jitter), and a scenario injects the failure modes the clients handle: Groq
+429s with Retry-After and 400s that force the model fallback, and Hugging
+Face 503 "model is loading" answers.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROFILES = {
+    # Hosted API on a good day
+    "fast": {"ttft": 0.05, "tokens_per_second": 800, "jitter": 0.1},
+    # Hosted API under load
+    "slow": {"ttft": 0.4, "tokens_per_second": 120, "jitter": 0.3},
+    # Local model on a laptop
+    "local": {"ttft": 0.2, "tokens_per_second": 40, "jitter": 0.2},
+    # No simulated latency: measures client overhead only
+    "instant": {"ttft": 0.0, "tokens_per_second": 0, "jitter": 0.0},
+}
+
+SCENARIOS = {
+    "happy": {},
+    # Every 4th Groq request is rate limited once, every 5th hits the 400 fallback,
+    # the first HF request per model gets a 503 while the model "loads"
+    "flaky": {"groq_429_every": 4, "groq_400_every": 5, "hf_loading": 1},
+}
+
+TOKENS = ("I've ", "spent ", "the ", "last ", "six ", "years ", "building ", "data ", "pipelines ", "that ",
+          "cut ", "reporting ", "time ", "by ", "60%, ", "and ", "here's ", "exactly ", "what ", "I'd ", "do. ")
+RETRY_AFTER = 0.05  # seconds the stub asks clients to wait
+
+
+def completion_tokens(count):
+    return [TOKENS[i % len(TOKENS)] for i in range(count)]
+
+
+class StubState:
+    """Profile, scenario and request counters shared by the handler threads."""
+
+    def __init__(self, profile="fast", scenario="happy", output_tokens=200, fixtures=None):
+        self.profile = PROFILES[profile]
+        self.scenario = SCENARIOS[scenario]
+        self.output_tokens = output_tokens
+        self.fixtures = fixtures or {}
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.loaded = set()
+
+    def hit(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return self.counts[name]
+
+    def delay(self, seconds):
+        if seconds <= 0:
+            return
+        with self.lock:
+            factor = 1 + self.rng.uniform(-1, 1) * self.profile["jitter"]
+        time.sleep(seconds * factor)
+
+    def token_gap(self):
+        rate = self.profile["tokens_per_second"]
+        return 1.0 / rate if rate else 0.0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set per server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content_type, frames, end=b""):
+        """Send frames with the profile's pacing using chunked transfer encoding."""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.state.delay(self.state.profile["ttft"])
+        gap = self.state.token_gap()
+        for frame in frames:
+            self.wfile.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+            self.wfile.flush()
+            if gap:
+                time.sleep(gap)
+        if end:
+            self.wfile.write(f"{len(end):x}\r\n".encode() + end + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _generate(self):
+        """Whole completion text after the full simulated generation time."""
+        tokens = completion_tokens(self.state.output_tokens)
+        self.state.delay(self.state.profile["ttft"] + len(tokens) * self.state.token_gap())
+        return "".join(tokens)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]  # a query string makes a fixture URL unique without changing the page
+        if path == "/api/tags":
+            self._send(200, {"models": [{"name": "llama2:latest"}, {"name": "mistral:latest"}]})
+        elif path.startswith("/fixtures/") and path[len("/fixtures/"):] in self.state.fixtures:
+            html = self.state.fixtures[path[len("/fixtures/"):]]
+            self._send(200, html.encode("utf-8"), "text/html; charset=utf-8")
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self._body()
+        if self.path == "/openai/v1/chat/completions":
+            self._groq(body)
+        elif self.path.startswith("/models/"):
+            self._huggingface(body, self.path[len("/models/"):])
+        elif self.path in ("/api/generate", "/api/chat"):
+            self._ollama(body)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _groq(self, body):
+        scenario = self.state.scenario
+        n = self.state.hit("groq")
+        limits = {
+            "x-ratelimit-limit-requests": "14400",
+            "x-ratelimit-remaining-requests": str(max(14400 - n, 0)),
+            "x-ratelimit-reset-requests": "6s",
+            "x-ratelimit-limit-tokens": "100000",
+            "x-ratelimit-remaining-tokens": "90000",
+            "x-ratelimit-reset-tokens": "1s",
+        }
+        if scenario.get("groq_429_every") and n % scenario["groq_429_every"] == 0:
+            self._send(429, {"error": {"message": "Rate limit reached"}},
+                       headers=dict(limits, **{"retry-after": str(RETRY_AFTER)}))
+            return
+        if (scenario.get("groq_400_every") and n % scenario["groq_400_every"] == 0
+                and body.get("model") != "mixtral-8x7b-32768"):
+            self._send(400, {"error": {"message": "context_length_exceeded"}}, headers=limits)
+            return
+
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": self._generate()}
+            self._send(200, {"choices": [{"message": message}]}, headers=limits)
+            return
+        frames = [b"data: " + json.dumps({"choices": [{"delta": {"content": token}}]}).encode() + b"\n\n"
+                  for token in completion_tokens(self.state.output_tokens)]
+        self._stream("text/event-stream", frames, end=b"data: [DONE]\n\n")
+
+    def _huggingface(self, body, model):
+        loading = self.state.scenario.get("hf_loading", 0)
+        if loading and self.state.hit(f"hf:{model}") <= loading:
+            self._send(503, {"error": f"Model {model} is currently loading", "estimated_time": RETRY_AFTER})
+            return
+        if not body.get("stream"):
+            sequences = body.get("parameters", {}).get("num_return_sequences", 1)
+            text = self._generate()  # sequences are sampled in one batch, so they share the generation time
+            self._send(200, [{"generated_text": body.get("inputs", "") + text} for _ in range(sequences)])
+            return
+        frames = [b"data: " + json.dumps({"token": {"text": token, "special": False}}).encode() + b"\n\n"
+                  for token in completion_tokens(self.state.output_tokens)]
+        self._stream("text/event-stream", frames)
+
+    def _ollama(self, body):
+        self.state.hit("ollama")
+        chat = self.path == "/api/chat"
+        timings = {"done": True, "load_duration": 0, "prompt_eval_count": 100, "prompt_eval_duration": 10 ** 7,
+                   "eval_count": self.state.output_tokens, "eval_duration": 10 ** 8, "total_duration": 2 * 10 ** 8}
+        if not chat and not body.get("prompt"):
+            self._send(200, dict(timings, response=""))  # warm-up request
+            return
+
+        def piece(text):
+            return {"message": {"role": "assistant", "content": text}} if chat else {"response": text}
+
+        if not body.get("stream"):
+            self._send(200, dict(timings, **piece(self._generate())))
+            return
+        frames = [json.dumps(dict(piece(token), done=False)).encode() + b"\n"
+                  for token in completion_tokens(self.state.output_tokens)]
+        self._stream("application/x-ndjson", frames, end=json.dumps(dict(timings, **piece(""))).encode() + b"\n")
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up mid-stream (cancelled hedges, closed streams) are expected
+
+
+class StubServer:
+    """Runs the stand-in APIs in a daemon thread; use as a context manager."""
+
+    def __init__(self, profile="fast", scenario="happy", output_tokens=200, fixtures=None, port=0):
+        self.state = StubState(profile, scenario, output_tokens, fixtures)
+        handler = type("Handler", (_Handler,), {"state": self.state})
+        self.server = _QuietServer(("127.0.0.1", port), handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.groq_url = f"{self.base_url}/openai/v1/chat/completions"
+        self.hf_url = f"{self.base_url}/models"
+        self.ollama_url = self.base_url
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
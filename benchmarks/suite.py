@@ -0,0 +1,201 @@
+"""Benchmark cases for prompt building, extraction and completions.
+
+Every case runs against in-memory fixtures and the local stub server, so
+results only depend on this code and the chosen latency profile. Caches are
+bypassed (no seed, use_cache=False, a throwaway cache directory) so each
+iteration does the full work.
+"""
+import functools
+import io
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import utils.helpers as helpers
+from benchmarks.fixtures import BACKGROUND, HTML_FIXTURES, JOB_DESCRIPTION, PDF_FIXTURES, _sentences
+from utils.history import HistoryStore
+from utils.html_extract import CHUNK_SIZE, _soup_text, extract_text_from_response
+from utils.ingest import ingest_sources
+from utils.scoring import UPWORK_CHAR_LIMIT, rank_variants
+
+SCHEMA_VERSION = 1
+VARIANTS = 3
+HISTORY_ENTRIES = 2000
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def summarize(samples, ttfts=None):
+    total = sum(samples)
+    result = {
+        "iterations": len(samples),
+        "mean": round(total / len(samples), 6),
+        "p50": round(percentile(samples, 50), 6),
+        "p95": round(percentile(samples, 95), 6),
+        "min": round(min(samples), 6),
+        "max": round(max(samples), 6),
+        "ops_per_second": round(len(samples) / total, 2) if total else None,
+    }
+    if ttfts:
+        result["ttft_p50"] = round(percentile(ttfts, 50), 6)
+        result["ttft_p95"] = round(percentile(ttfts, 95), 6)
+    return result
+
+
+def measure(func, iterations, warmup=1):
+    """Time func() `iterations` times; func may return a time-to-first-token."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    ttfts = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        ttft = func()
+        samples.append(time.perf_counter() - started)
+        if isinstance(ttft, float):
+            ttfts.append(ttft)
+    return summarize(samples, ttfts)
+
+
+def _drain(chunks):
+    """Consume a stream; returns seconds to the first chunk."""
+    started = time.perf_counter()
+    ttft = None
+    for _ in chunks:
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    return ttft if ttft is not None else time.perf_counter() - started
+
+
+@functools.lru_cache(maxsize=None)
+def history_store(entries=HISTORY_ENTRIES):
+    """A throwaway history of synthetic postings and proposals, built on first use."""
+    rng = random.Random(0)
+    store = HistoryStore(os.path.join(tempfile.mkdtemp(prefix="upw-bench-history-"), "history.sqlite3"))
+    for _ in range(entries):
+        store.record(" ".join(_sentences(rng, 8)), " ".join(_sentences(rng, 40)), provider="groq")
+    store.flush()
+    return store
+
+
+class _FixtureResponse:
+    """Just enough of a streamed response for extract_text_from_response; counts the bytes read."""
+
+    headers = {"Content-Type": "text/html; charset=utf-8"}
+
+    def __init__(self, content):
+        self.content = content
+        self.read = 0
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            chunk = self.content[start:start + chunk_size]
+            self.read += len(chunk)
+            yield chunk
+
+    def close(self):
+        pass
+
+
+def check_extraction():
+    """Raise unless the streaming engines match soup and stop reading at the text budget.
+
+    The fixtures are minified (no line breaks at all), the case that used to
+    read a page to max_bytes; a pretty-printed copy covers the other one.
+    """
+    pages = dict(HTML_FIXTURES)
+    pages["profile-large-pretty.html"] = HTML_FIXTURES["profile-large.html"].replace("><", ">\n  <")
+    for name, page in pages.items():
+        content = page.encode("utf-8")
+        expected = _soup_text(content, 8000)
+        for engine in ("lxml", "html.parser"):
+            response = _FixtureResponse(content)
+            if extract_text_from_response(response, engine=engine, budget=8000) != expected:
+                raise Exception(f"{engine} text differs from soup on {name}")
+            if len(content) > 8 * CHUNK_SIZE and response.read > 4 * CHUNK_SIZE:
+                raise Exception(f"{engine} read {response.read} of {len(content)} bytes of {name}")
+
+
+def cases(stub):
+    """(name, callable, kind) for every benchmark; kind picks the iteration count."""
+    provider_kwargs = {
+        "groq": {"api_key": "bench"},
+        "huggingface": {"hf_token": "bench", "model_name": "google/flan-t5-large"},
+        "ollama": {"model": "llama2", "ollama_url": stub.ollama_url},
+    }
+    prompt = helpers.create_upwork_prompt(JOB_DESCRIPTION, BACKGROUND, seed=1)
+
+    yield "prompt.create_upwork_prompt", lambda: helpers.create_upwork_prompt(JOB_DESCRIPTION, BACKGROUND, seed=1), "cpu"
+    yield ("prompt.create_budgeted_prompt", lambda: helpers.create_budgeted_prompt(
+        JOB_DESCRIPTION, BACKGROUND * 4, "ollama", "llama2", seed=1), "cpu")
+
+    for name in HTML_FIXTURES:
+        url = f"{stub.base_url}/fixtures/{name}"
+        yield f"url.extract[{name}]", lambda url=url: helpers.extract_text_from_url(url, use_cache=False), "io"
+
+    for name, data in PDF_FIXTURES.items():
+        yield f"pdf.extract[{name}]", lambda data=data: helpers.extract_text_from_pdf(io.BytesIO(data)), "io"
+
+    # Every fixture at once, as a freelancer with several pages and documents would
+    urls = [f"{stub.base_url}/fixtures/{name}" for name in HTML_FIXTURES]
+    yield (f"ingest.sources[{len(urls)}+{len(PDF_FIXTURES)}]", lambda: ingest_sources(
+        urls, list(PDF_FIXTURES.items())), "io")
+
+    for provider, kwargs in provider_kwargs.items():
+        yield (f"completion.{provider}", lambda provider=provider, kwargs=kwargs: helpers.get_free_completion(
+            prompt, provider, **kwargs), "network")
+        yield (f"completion.{provider}.stream", lambda provider=provider, kwargs=kwargs: _drain(
+            helpers.get_free_completion(prompt, provider, stream=True, **kwargs)), "network")
+        # Only differs from .stream once completions near the limit (--output-tokens 1200)
+        yield (f"completion.{provider}.guarded", lambda provider=provider, kwargs=kwargs: _drain(
+            helpers.get_free_completion(prompt, provider, stream=True, length_limit=UPWORK_CHAR_LIMIT, **kwargs)),
+            "network")
+
+    for provider, kwargs in provider_kwargs.items():
+        yield (f"variants.{provider}[{VARIANTS}]", lambda provider=provider, kwargs=kwargs: helpers.get_free_variants(
+            prompt, provider, count=VARIANTS, use_cache=False, **kwargs), "network")
+    yield ("variants.rank", lambda: rank_variants(
+        [helpers.create_upwork_prompt(JOB_DESCRIPTION, BACKGROUND, seed=seed) for seed in range(VARIANTS)],
+        JOB_DESCRIPTION), "cpu")
+
+    # The warm-up call builds the history
+    yield "history.record", lambda: history_store().record(JOB_DESCRIPTION, BACKGROUND, provider="groq"), "cpu"
+    yield "history.search", lambda: history_store().search("dashboard revenue"), "cpu"
+    yield "history.page[deep]", lambda: history_store().page(before_id=HISTORY_ENTRIES // 10), "cpu"
+
+    candidates = [dict(provider_kwargs["groq"], provider="groq"), dict(provider_kwargs["ollama"], provider="ollama")]
+    yield ("completion.auto.stream", lambda: _drain(helpers.get_free_completion(
+        prompt, "auto", stream=True, candidates=candidates)), "network")
+
+
+def run(stub, iterations, selected=None, log=None):
+    """Run the (selected) cases against a started stub server; returns {name: stats}."""
+    # Point every provider at the stub
+    helpers.GROQ_API_URL = stub.groq_url
+    helpers.HF_API_URL = stub.hf_url
+
+    if not selected or any(pattern in "url.extract" for pattern in selected):
+        check_extraction()
+
+    counts = {"cpu": iterations * 10, "io": iterations, "network": iterations}
+    results = {}
+    for name, func, kind in cases(stub):
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        results[name] = measure(func, counts[kind])
+        if log:
+            log(f"{name:45s} p50 {results[name]['p50'] * 1000:9.2f} ms   p95 {results[name]['p95'] * 1000:9.2f} ms")
+    return results
@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+
+import utils.routing as routing
+from utils.routing import COOL_DOWN, FAILURE_THRESHOLD, ProviderStats, route_completion
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(routing, "_stats", {})
+
+
+def fake_complete(behaviour):
+    """A get_free_completion stand-in: behaviour[provider] is (delay before the first chunk, chunks or error)."""
+    calls = []
+
+    def complete(prompt, provider, stream=True, seed=None, **kwargs):
+        calls.append(provider)
+        delay, outcome = behaviour[provider]
+
+        def chunks():
+            time.sleep(delay)
+            if isinstance(outcome, Exception):
+                raise outcome
+            yield from outcome
+
+        return chunks()
+
+    complete.calls = calls
+    return complete
+
+
+def candidates(*providers):
+    return [{"provider": provider, "model": "test"} for provider in providers]
+
+
+def trip(stats, now):
+    for _ in range(FAILURE_THRESHOLD):
+        stats.failure(now)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    stats = ProviderStats()
+    for _ in range(FAILURE_THRESHOLD - 1):
+        stats.failure(0.0)
+    assert stats.claim(0.0)
+    stats.failure(0.0)
+    assert not stats.available(1.0)
+    assert not stats.claim(COOL_DOWN - 1)
+    assert stats.snapshot()["error_rate"] == 1.0
+
+
+def test_half_open_allows_a_single_trial_request():
+    stats = ProviderStats()
+    trip(stats, 0.0)
+    assert stats.claim(COOL_DOWN)
+    assert stats.half_open
+    assert not stats.claim(COOL_DOWN)
+    assert not stats.available(COOL_DOWN + 1)
+
+
+def test_half_open_success_closes_the_breaker():
+    stats = ProviderStats()
+    trip(stats, 0.0)
+    assert stats.claim(COOL_DOWN)
+    stats.success(0.1, 0.2)
+    assert not stats.half_open
+    assert stats.claim(COOL_DOWN) and stats.claim(COOL_DOWN)
+    assert stats.snapshot()["circuit"] == "closed"
+
+
+def test_half_open_failure_trips_the_breaker_again():
+    stats = ProviderStats()
+    trip(stats, 0.0)
+    assert stats.claim(COOL_DOWN)
+    stats.failure(COOL_DOWN)
+    assert not stats.claim(COOL_DOWN + 1)
+    assert stats.claim(2 * COOL_DOWN)
+
+
+def test_cancelled_trial_lets_the_next_request_try():
+    stats = ProviderStats()
+    trip(stats, 0.0)
+    assert stats.claim(COOL_DOWN)
+    stats.release()
+    assert stats.claim(COOL_DOWN)
+
+
+def test_all_candidates_failing_raises_with_every_error():
+    complete = fake_complete({"a": (0, ValueError("a is down")), "b": (0, ValueError("b is down"))})
+    with pytest.raises(Exception, match="All providers failed") as failure:
+        list(route_completion(complete, "prompt", candidates("a", "b"), hedge=False))
+    assert "a is down" in str(failure.value) and "b is down" in str(failure.value)
+    assert sorted(complete.calls) == ["a", "b"]
+
+
+def test_no_candidate_available_raises():
+    routing._stats_for("a/test").open_until = time.monotonic() + COOL_DOWN
+    with pytest.raises(Exception, match="No provider available"):
+        list(route_completion(fake_complete({}), "prompt", candidates("a")))
+
+
+def test_failover_to_the_next_candidate():
+    complete = fake_complete({"a": (0, ValueError("a is down")), "b": (0, ["ok"])})
+    route_info = {}
+    assert list(route_completion(complete, "prompt", candidates("a", "b"), hedge=False,
+                                 route_info=route_info)) == ["ok"]
+    assert route_info["provider"] == "b/test"
+
+
+def test_slow_primary_is_hedged(monkeypatch):
+    monkeypatch.setattr(routing, "DEFAULT_HEDGE_AFTER", 0.05)
+    complete = fake_complete({"a": (1.0, ["slow"]), "b": (0, ["fast"])})
+    route_info = {}
+    assert list(route_completion(complete, "prompt", candidates("a", "b"), route_info=route_info)) == ["fast"]
+    assert route_info["provider"] == "b/test"
+    assert route_info["hedged"]
+
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    monkeypatch.setattr(routing, "DEFAULT_HEDGE_AFTER", 0.5)
+    complete = fake_complete({"a": (0, ["fast"]), "b": (0, ["unused"])})
+    route_info = {}
+    assert list(route_completion(complete, "prompt", candidates("a", "b"), route_info=route_info)) == ["fast"]
+    assert not route_info["hedged"]
+    assert complete.calls == ["a"]
+
+
+def test_only_one_concurrent_request_probes_a_half_open_candidate():
+    stats = routing._stats_for("a/test")
+    trip(stats, time.monotonic() - COOL_DOWN - 1)
+    complete = fake_complete({"a": (0.2, ["ok"])})
+    results = []
+
+    def route():
+        try:
+            results.extend(route_completion(complete, "prompt", candidates("a"), hedge=False))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=route) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert complete.calls == ["a"]
+    assert results.count("ok") == 1
+    assert sum(isinstance(result, Exception) for result in results) == 2
+    assert routing.routing_stats()["a/test"]["circuit"] == "closed"
@@ -0,0 +1,183 @@
+import threading
+import time
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+TIMEOUT = 5.0
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+class GatedStream:
+    """A source stream that yields one chunk per release() and records whether it was closed."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.gate = threading.Semaphore(0)
+        self.calls = 0
+        self.yielded = 0
+        self.closed = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        return self._generate()
+
+    def _generate(self):
+        try:
+            for chunk in self.chunks:
+                if not self.gate.acquire(timeout=TIMEOUT):
+                    raise AssertionError("never released")
+                self.yielded += 1
+                yield chunk
+        finally:
+            self.closed.set()
+
+    def release(self, count=1):
+        for _ in range(count):
+            self.gate.release()
+
+
+def consume(iterator, out):
+    try:
+        out.extend(iterator)
+    except Exception as e:
+        out.append(e)
+
+
+def test_concurrent_subscribers_get_identical_chunks():
+    group = SingleFlight("test")
+    source = GatedStream(["a", "b", "c"])
+    first, second = [], []
+    threads = [threading.Thread(target=consume, args=(group.stream("key", source), out)) for out in (first, second)]
+    for thread in threads:
+        thread.start()
+    source.release(3)
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert first == second == ["a", "b", "c"]
+    assert source.calls == 1
+    assert group.stats()["coalesced"] == 1
+
+
+def test_late_joiner_replays_the_buffered_prefix():
+    group = SingleFlight("test")
+    source = GatedStream(["a", "b", "c"])
+    leader = group.stream("key", source)
+    source.release(2)
+    assert [next(leader), next(leader)] == ["a", "b"]
+
+    late = group.stream("key", source)
+    source.release()
+    assert list(late) == ["a", "b", "c"]
+    assert list(leader) == ["c"]
+    assert source.calls == 1
+
+
+def test_stream_error_reaches_every_subscriber():
+    group = SingleFlight("test")
+    release = threading.Event()
+
+    def failing():
+        yield "a"
+        release.wait(TIMEOUT)
+        raise ValueError("upstream failed")
+
+    outputs = [[], []]
+    subscribers = [group.stream("key", failing) for _ in outputs]
+    threads = [threading.Thread(target=consume, args=(sub, out)) for sub, out in zip(subscribers, outputs)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    for out in outputs:
+        assert out[0] == "a"
+        assert isinstance(out[1], ValueError)
+
+
+def test_upstream_is_closed_once_the_last_subscriber_leaves():
+    group = SingleFlight("test")
+    source = GatedStream(["a", "b", "c", "d"])
+    first = group.stream("key", source)
+    second = group.stream("key", source)
+    source.release()
+    assert next(first) == "a"
+
+    first.close()
+    source.release()
+    wait_until(lambda: source.yielded == 2)
+    assert not source.closed.is_set()  # second is still listening
+
+    second.close()
+    source.release(2)
+    assert source.closed.wait(TIMEOUT)
+    assert source.yielded < 4
+    wait_until(lambda: group.stats()["in_flight"] == 0)
+
+
+def test_do_failure_reaches_every_waiter():
+    group = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        release.wait(TIMEOUT)
+        raise ValueError("leader failed")
+
+    errors = []
+
+    def call():
+        try:
+            group.do("key", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: group.stats()["calls"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert len(calls) == 1
+    assert len(errors) == 4
+    assert all(error is errors[0] for error in errors)
+
+
+@pytest.mark.parametrize("fails", [False, True])
+def test_do_releases_the_key_afterwards(fails):
+    group = SingleFlight("test")
+
+    def func():
+        if fails:
+            raise ValueError("failed")
+        return "result"
+
+    for _ in range(2):
+        try:
+            assert group.do("key", func) == "result"
+        except ValueError:
+            assert fails
+    stats = group.stats()
+    assert stats["executed"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_stream_releases_the_key_afterwards():
+    group = SingleFlight("test")
+    assert list(group.stream("key", lambda: iter(["a"]))) == ["a"]
+    wait_until(lambda: group.stats()["in_flight"] == 0)
+    assert list(group.stream("key", lambda: iter(["b"]))) == ["b"]
+    assert group.stats()["executed"] == 2
@@ -0,0 +1,124 @@
+"""Two-tier (memory LRU + on-disk SQLite) cache of finished completions.
+
+Keys cover the provider, model, a hash of the prompt, the sampling
+parameters and the seed, so only fully reproducible requests (deterministic
+mode) are worth caching.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.url_cache import DEFAULT_CACHE_DIR
+
+MEMORY_ENTRIES = int(os.environ.get("UPW_COMPLETION_CACHE_ENTRIES", 256))
+DISK_MAX_ENTRIES = int(os.environ.get("UPW_COMPLETION_CACHE_DISK_ENTRIES", 5000))
+
+
+def completion_key(provider, model, prompt, sampling, seed):
+    """Stable cache key for one completion request."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    material = json.dumps(
+        {"provider": provider, "model": model, "prompt": prompt_hash, "sampling": sampling, "seed": seed},
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """In-memory LRU in front of a SQLite table that survives restarts."""
+
+    def __init__(self, path=None, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_MAX_ENTRIES):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {"memory": 0, "disk": 0}
+        self._misses = 0
+        self._conn = None
+        try:
+            if path is None:
+                os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+                path = os.path.join(DEFAULT_CACHE_DIR, "completions.sqlite3")
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)"
+            )
+            self._conn.commit()
+        except (OSError, sqlite3.Error):
+            # Memory tier still works without a usable cache directory
+            self._conn = None
+
+    def _remember(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._hits["memory"] += 1
+                return self._memory[key]
+            if self._conn is not None:
+                row = self._conn.execute("SELECT text FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE completions SET last_access = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self._conn.commit()
+                    self._remember(key, row[0])
+                    self._hits["disk"] += 1
+                    return row[0]
+            self._misses += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            self._remember(key, text)
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?)", (key, text, time.time())
+            )
+            self._conn.execute(
+                """DELETE FROM completions WHERE key IN (
+                    SELECT key FROM completions ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.disk_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_hits": self._hits["memory"],
+                "disk_hits": self._hits["disk"],
+                "misses": self._misses,
+                "memory_entries": len(self._memory),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """Process-wide completion cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache()
+    return _cache
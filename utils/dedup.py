@@ -0,0 +1,230 @@
+"""Near-duplicate job posting detection with MinHash + LSH.
+
+Every job description that gets a proposal is stored with its MinHash
+signature in SQLite and linked to the proposals generated for it. The LSH
+band keys live in an indexed table next to it, so opening the index loads
+nothing and a lookup costs one signature computation plus BANDS index
+probes no matter how many postings are indexed; only the candidates'
+signatures are read back, to confirm them against the estimated Jaccard
+similarity threshold. numpy is imported on first use.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from utils.url_cache import DEFAULT_CACHE_DIR
+
+NUM_PERM = 128
+BANDS = 32  # x 4 rows: candidates from ~0.4 Jaccard upward
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+DEFAULT_THRESHOLD = float(os.environ.get("UPW_DUPLICATE_THRESHOLD", 0.7))
+
+_MERSENNE = (1 << 31) - 1
+_TOKEN = re.compile(r"[a-z0-9]+")
+_permutations = None
+
+
+def _hash_params():
+    """The (a, b) coefficients of the NUM_PERM hash functions, built on first use."""
+    global _permutations
+    if _permutations is None:
+        import numpy as np
+        rng = np.random.RandomState(20240101)  # fixed so signatures stay comparable across runs
+        _permutations = (rng.randint(1, _MERSENNE, size=NUM_PERM).astype(np.uint64),
+                         rng.randint(0, _MERSENNE, size=NUM_PERM).astype(np.uint64))
+    return _permutations
+
+
+def shingles(text):
+    """Hashed word 3-grams of the normalized text."""
+    import numpy as np
+
+    words = _TOKEN.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = (" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64))
+
+
+def minhash(text):
+    """NUM_PERM-value MinHash signature (uint32)."""
+    import numpy as np
+
+    values = shingles(text) % np.uint64(_MERSENNE)
+    if values.size == 0:
+        return np.full(NUM_PERM, _MERSENNE, dtype=np.uint32)
+    a, b = _hash_params()
+    hashed = (a[:, None] * values[None, :] + b[:, None]) % np.uint64(_MERSENNE)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    import numpy as np
+
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+def _band_keys(signature):
+    """(band, key) pairs; a key is a 64-bit hash of the band's rows (a collision only adds a candidate)."""
+    rows = signature.reshape(BANDS, ROWS)
+    return [(band, int.from_bytes(hashlib.blake2b(rows[band].tobytes(), digest_size=8).digest(), "big", signed=True))
+            for band in range(BANDS)]
+
+
+class PostingIndex:
+    """Persistent MinHash/LSH index of job postings and their proposals."""
+
+    def __init__(self, path=None, threshold=DEFAULT_THRESHOLD):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, "postings.sqlite3")
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS postings (
+                id INTEGER PRIMARY KEY,
+                text_hash TEXT UNIQUE NOT NULL,
+                job_description TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS posting_proposals (
+                id INTEGER PRIMARY KEY,
+                posting_id INTEGER NOT NULL REFERENCES postings (id),
+                proposal TEXT NOT NULL,
+                provider TEXT,
+                model TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS posting_proposals_posting ON posting_proposals (posting_id);
+            CREATE TABLE IF NOT EXISTS posting_bands (
+                band INTEGER NOT NULL,
+                key INTEGER NOT NULL,
+                posting_id INTEGER NOT NULL,
+                PRIMARY KEY (band, key, posting_id)
+            ) WITHOUT ROWID;"""
+        )
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            self._index_existing()
+
+    def _index_existing(self):
+        # One-off for indexes written before the band table existed
+        import numpy as np
+
+        with self._conn:
+            for posting_id, blob in self._conn.execute("SELECT id, signature FROM postings").fetchall():
+                self._insert_bands(posting_id, np.frombuffer(blob, dtype=np.uint32))
+            self._conn.execute("PRAGMA user_version = 1")
+
+    def _insert_bands(self, posting_id, signature):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO posting_bands (band, key, posting_id) VALUES (?, ?, ?)",
+            [(band, key, posting_id) for band, key in _band_keys(signature)],
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+
+    def add_posting(self, job_description):
+        """Index a posting (idempotent for identical text); returns its id."""
+        text_hash = hashlib.sha256(job_description.strip().encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM postings WHERE text_hash = ?", (text_hash,)).fetchone()
+            if row:
+                return row[0]
+            signature = minhash(job_description)
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO postings (text_hash, job_description, signature, created_at) VALUES (?, ?, ?, ?)",
+                    (text_hash, job_description, signature.tobytes(), time.time()),
+                )
+                self._insert_bands(cursor.lastrowid, signature)
+            return cursor.lastrowid
+
+    def add_proposal(self, posting_id, proposal, provider=None, model=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO posting_proposals (posting_id, proposal, provider, model, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (posting_id, proposal, provider, model, time.time()),
+            )
+            self._conn.commit()
+
+    def record(self, job_description, proposal, provider=None, model=None):
+        """Index a posting and link a generated proposal to it."""
+        posting_id = self.add_posting(job_description)
+        self.add_proposal(posting_id, proposal, provider, model)
+        return posting_id
+
+    def candidates(self, signature):
+        """{posting id: signature} of the postings sharing at least one LSH band with the signature."""
+        import numpy as np
+
+        keys = _band_keys(signature)
+        with self._lock:
+            # One primary-key probe per band
+            rows = self._conn.execute(
+                "SELECT id, signature FROM postings WHERE id IN ("
+                + " UNION ".join(["SELECT posting_id FROM posting_bands WHERE band = ? AND key = ?"] * len(keys))
+                + ")",
+                [value for pair in keys for value in pair],
+            ).fetchall()
+        return {posting_id: np.frombuffer(blob, dtype=np.uint32) for posting_id, blob in rows}
+
+    def find_similar(self, job_description, threshold=None, limit=3):
+        """Near-duplicate postings above the Jaccard threshold, most similar first.
+
+        Each match has "posting_id", "similarity", "job_description" and its
+        "proposals" (newest first).
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = minhash(job_description)
+        scored = sorted(
+            ((similarity(signature, other), pid) for pid, other in self.candidates(signature).items()),
+            reverse=True,
+        )
+        matches = []
+        with self._lock:
+            for score, posting_id in scored[:limit]:
+                if score < threshold:
+                    break
+                jd = self._conn.execute(
+                    "SELECT job_description FROM postings WHERE id = ?", (posting_id,)
+                ).fetchone()[0]
+                proposals = [
+                    {"proposal": p, "provider": provider, "model": model, "created_at": created}
+                    for p, provider, model, created in self._conn.execute(
+                        "SELECT proposal, provider, model, created_at FROM posting_proposals "
+                        "WHERE posting_id = ? ORDER BY created_at DESC",
+                        (posting_id,),
+                    )
+                ]
+                matches.append({"posting_id": posting_id, "similarity": score,
+                                "job_description": jd, "proposals": proposals})
+        return matches
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_posting_index():
+    """Process-wide posting index, or None when the cache directory is unusable."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = PostingIndex()
+                except (OSError, sqlite3.Error):
+                    return None
+    return _index
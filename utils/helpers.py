@@ -1,71 +1,203 @@
-import requests
-from bs4 import BeautifulSoup
-from PyPDF2 import PdfReader
+import hashlib
 import json
-import time
+import math
+import os
 import random
-
-def extract_text_from_url(url):
-    """Extract text content from a URL."""
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.completion_cache import completion_key, get_completion_cache
+from utils.html_extract import DEFAULT_MAX_BYTES, extract_text_from_response
+from utils.http_client import http_get, http_post
+from utils.length_guard import GUARD_MARGIN, guard_stream, record_fit, trim_to_limit
+from utils.ollama_engine import KEEP_ALIVE, model_options, record_timings
+from utils.pdf_extract import extract_pdf, read_bytes
+from utils.prompt_budget import (
+    MIN_OUTPUT_TOKENS, chars_per_token, context_window, estimate_tokens, plan_budget, truncate_to_tokens
+)
+from utils.rate_limit import get_rate_limiter
+from utils.routing import route_completion
+from utils.retry import RetryLater, RetryPolicy, send_with_retry
+from utils.scoring import UPWORK_CHAR_LIMIT
+from utils.singleflight import completion_flights, pdf_flights, url_flights
+from utils.tracing import annotate, bind, record_error, span, traced, traced_stream
+from utils.url_cache import get_url_cache, normalize_url
+
+
+def extract_text_from_url(url, use_cache=True, engine="auto", max_bytes=DEFAULT_MAX_BYTES):
+    """Extract text content from a URL.
+
+    Extracted text is kept in the on-disk URL cache together with the page's
+    ETag/Last-Modified, and later calls revalidate with a conditional GET so
+    an unchanged page is neither downloaded nor parsed again. The body is
+    streamed under a max_bytes cap and parsing stops once 8000 characters of
+    text are collected; engine="soup" restores the full BeautifulSoup parse.
+    Concurrent calls for the same URL share one fetch.
+    """
+    key = (normalize_url(url), use_cache, engine, max_bytes)
+    with span("url_fetch", url=key[0]) as stage:
+        text = url_flights.do(key, lambda: _extract_text_from_url(url, use_cache, engine, max_bytes))
+        stage.set(chars=len(text))
+        return text
+
+
+def _extract_text_from_url(url, use_cache, engine, max_bytes):
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        page = requests.get(url, headers=headers, timeout=10)
-        page.raise_for_status()
-        soup = BeautifulSoup(page.content, 'html.parser')
-
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.extract()
 
-        text = soup.get_text()
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
+        cache = get_url_cache() if use_cache else None
+        cached = cache.get(url) if cache else None
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        page = http_get(url, headers=headers, timeout=10, stream=True)
+        annotate(status=page.status_code)
+        if cached and page.status_code == 304:
+            page.close()
+            cache.touch(url)
+            annotate(cache="revalidated")
+            return cached['text']
 
-        return text[:8000]
+        try:
+            page.raise_for_status()
+        except Exception:
+            page.close()
+            raise
+
+        with span("html_parse", engine=engine) as stage:
+            text = extract_text_from_response(page, engine=engine, budget=8000, max_bytes=max_bytes)
+            stage.set(chars=len(text))
+
+        # Without validators the page can't be revalidated, so don't keep it
+        etag = page.headers.get('ETag')
+        last_modified = page.headers.get('Last-Modified')
+        if cache and (etag or last_modified):
+            cache.put(url, text, etag, last_modified)
+
+        return text
     except Exception as e:
+        record_error(e)
         return f"Error extracting URL content: {str(e)}"
 
 
-def extract_text_from_pdf(uploaded_file):
-    """Extract text from uploaded PDF file."""
+def extract_text_from_pdf(uploaded_file, parallel=None):
+    """Extract text from uploaded PDF file.
+
+    Each page is parsed once and parsing stops at the 8000-character budget;
+    slow, sparse documents are spread over a process pool (see utils.pdf_extract).
+    Concurrent calls for the same file contents share one parse.
+    """
+    with span("pdf_parse") as stage:
+        try:
+            data = read_bytes(uploaded_file)
+            stage.set(bytes=len(data))
+            key = (hashlib.sha256(data).hexdigest(), parallel)
+            result = pdf_flights.do(key, lambda: extract_pdf(data, budget=8000, parallel=parallel))
+            stage.set(chars=len(result["text"]), pages=result["pages"], pages_parsed=result["pages_parsed"],
+                      parallel=result["parallel"])
+            return result["text"]
+        except Exception as e:
+            record_error(e)
+            return f"Error reading PDF: {str(e)}"
+
+
+def _iter_sse_data(response):
+    """Yield the data payloads of a server-sent events stream."""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        line = line.decode('utf-8', errors='replace')
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            break
+        yield data
+
+
+def _stream_huggingface_completion(api_url, headers, payload, prompt):
+    """Yield completion tokens from the Hugging Face Inference API."""
+    response = None
     try:
-        reader = PdfReader(uploaded_file)
-        text = "\n".join([page.extract_text() for page in reader.pages if page.extract_text()])
-        return text[:8000]
+        payload = dict(payload, stream=True)
+        # 503 means the model is loading; the retry engine waits its estimated_time
+        response = send_with_retry(
+            "huggingface", lambda: http_post(api_url, headers=headers, json=payload, stream=True)
+        )
+
+        response.raise_for_status()
+
+        # Only text-generation-inference backed models stream; everything
+        # else answers with a single JSON body which we yield in one piece.
+        if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+            result = response.json()
+            if isinstance(result, list) and len(result) > 0:
+                result = result[0]
+            text = result.get('generated_text', '').replace(prompt, '').strip()
+            if text:
+                yield text
+            return
+
+        for data in _iter_sse_data(response):
+            chunk = json.loads(data)
+            if 'error' in chunk:
+                raise Exception(chunk['error'])
+            token = chunk.get('token') or {}
+            if token.get('special'):
+                continue
+            if token.get('text'):
+                yield token['text']
+
+    except RetryLater:
+        raise  # waited out by the generation service, see utils.retry
     except Exception as e:
-        return f"Error reading PDF: {str(e)}"
+        raise Exception(f"Hugging Face API error: {str(e)}")
+    finally:
+        if response is not None:
+            response.close()
 
 
-def get_huggingface_completion(hf_token, prompt, model_name="microsoft/DialoGPT-medium"):
-    """Generate completion using Hugging Face Inference API (FREE!)"""
-    try:
-        # Free Hugging Face models - no quota limits!
-        API_URL = f"https://api-inference.huggingface.co/models/{model_name}"
-        headers = {"Authorization": f"Bearer {hf_token}"}
-
-        # Random temperature for variety
-        temp = round(random.uniform(0.7, 0.9), 2)
-
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_length": 1200,
-                "temperature": temp,
-                "do_sample": True,
-                "top_p": round(random.uniform(0.85, 0.95), 2)
-            }
+# Overridable so benchmarks and load tests can point at local stand-ins
+HF_API_URL = os.environ.get("UPW_HF_API_URL", "https://api-inference.huggingface.co/models")
+
+
+def _huggingface_payload(prompt, sampling=None, seed=None, max_tokens=None):
+    # Random temperature for variety (reproducible when a seed is given)
+    sampling = sampling or sampling_params("huggingface", seed)
+
+    payload = {
+        "inputs": prompt,
+        "parameters": {
+            "max_length": max_tokens or 1200,
+            "temperature": sampling["temperature"],
+            "do_sample": True,
+            "top_p": sampling["top_p"]
         }
+    }
+    if seed is not None:
+        payload["parameters"]["seed"] = seed
+    return payload
 
-        response = requests.post(API_URL, headers=headers, json=payload)
 
-        if response.status_code == 503:
-            # Model is loading, wait and retry
-            time.sleep(20)
-            response = requests.post(API_URL, headers=headers, json=payload)
+def get_huggingface_completion(hf_token, prompt, model_name="microsoft/DialoGPT-medium", stream=False,
+                               sampling=None, seed=None, max_tokens=None):
+    """Generate completion using Hugging Face Inference API (FREE!)"""
+    # Free Hugging Face models - no quota limits!
+    API_URL = f"{HF_API_URL}/{model_name}"
+    headers = {"Authorization": f"Bearer {hf_token}"}
+
+    payload = _huggingface_payload(prompt, sampling, seed, max_tokens)
+
+    if stream:
+        return _stream_huggingface_completion(API_URL, headers, payload, prompt)
+
+    try:
+        # 503 means the model is loading; the retry engine waits its estimated_time
+        response = send_with_retry("huggingface", lambda: http_post(API_URL, headers=headers, json=payload))
 
         response.raise_for_status()
         result = response.json()
@@ -79,18 +211,31 @@ def get_huggingface_completion(hf_token, prompt, model_name="microsoft/DialoGPT-
         raise Exception(f"Hugging Face API error: {str(e)}")
 
 
-def get_groq_completion(api_key, prompt):
-    """Generate completion using Groq (FREE tier - very fast!)"""
+def get_huggingface_variants(hf_token, prompt, count, model_name="microsoft/DialoGPT-medium", seed=None,
+                             max_tokens=None):
+    """count sampled completions from a single Inference API request (num_return_sequences)."""
+    API_URL = f"{HF_API_URL}/{model_name}"
+    headers = {"Authorization": f"Bearer {hf_token}"}
+    payload = _huggingface_payload(prompt, seed=seed, max_tokens=max_tokens)
+    payload["parameters"]["num_return_sequences"] = count
+
     try:
-        url = "https://api.groq.com/openai/v1/chat/completions"
+        response = send_with_retry("huggingface", lambda: http_post(API_URL, headers=headers, json=payload))
+        response.raise_for_status()
+        result = response.json()
+        if not isinstance(result, list):
+            result = [result]
+        return [item.get('generated_text', '').replace(prompt, '').strip() for item in result]
 
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+    except Exception as e:
+        raise Exception(f"Hugging Face API error: {str(e)}")
+
+
+GROQ_API_URL = os.environ.get("UPW_GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_MODEL = "llama3-70b-8192"
 
-        # Enhanced system message for personable, conversational proposals
-        system_content = """You are a seasoned freelancer and Upwork proposal expert who writes in a natural, conversational tone. Your proposals feel like they're written by a real person who genuinely understands the client's pain points.
+# Enhanced system message for personable, conversational proposals
+GROQ_SYSTEM_PROMPT = """You are a seasoned freelancer and Upwork proposal expert who writes in a natural, conversational tone. Your proposals feel like they're written by a real person who genuinely understands the client's pain points.
 
 Key characteristics of your writing:
 • CONVERSATIONAL: Write like you're talking to a friend, not giving a corporate presentation
@@ -119,37 +264,121 @@ Structure: Problem acknowledgment → Personal connection → Specific solution
 Write proposals that make clients think: "This person really gets it and has been in my shoes."
 """
 
-        # Random temperature for more variety in responses
-        temp = round(random.uniform(0.75, 0.95), 2)
-
-        payload = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": system_content
-                },
-                {
-                    "role": "user",
-                    "content": prompt[:4000]
-                }
-            ],
-            "model": "llama3-70b-8192",
-            "temperature": temp,  # Randomized temperature
-            "max_tokens": 1200,
-            "top_p": round(random.uniform(0.85, 0.95), 2),  # Randomized top_p
-            "stream": False
-        }
 
-        response = requests.post(url, headers=headers, json=payload, timeout=45)
+def _groq_output_budget(prompt):
+    """Completion tokens that fit the context next to the system prompt and the
+    (no longer truncated) user prompt, capped at the usual 1200."""
+    used = estimate_tokens(GROQ_SYSTEM_PROMPT + prompt, GROQ_MODEL)
+    return max(min(1200, context_window("groq", GROQ_MODEL) - used), MIN_OUTPUT_TOKENS)
+
+
+def _post_groq(api_key, url, headers, payload, timeout, stream=False):
+    """POST to Groq through the per-key rate limiter and the retry engine."""
+    limiter = get_rate_limiter(api_key)
+    # Groq counts prompt and max_tokens against the token budget
+    estimate = sum(len(m["content"]) for m in payload["messages"]) // 4 + payload["max_tokens"]
+
+    def send():
+        limiter.acquire(estimate)
+        response = http_post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+        limiter.update(response.headers)
+        if response.status_code == 429:
+            limiter.penalize(response.headers.get("retry-after"))
+        return response
+
+    return send_with_retry("groq", send)
+
+
+def _stream_groq_completion(api_key, url, headers, payload):
+    """Yield completion tokens from Groq's server-sent events stream."""
+    response = None
+    try:
+        payload = dict(payload, stream=True)
+        response = _post_groq(api_key, url, headers, payload, timeout=45, stream=True)
 
         if response.status_code != 200:
-            print(f"Response Text: {response.text}")
+            annotate(status=response.status_code, response_body=response.text[:500])
 
         if response.status_code == 400:
             # Fallback to smaller model if needed
+            response.close()
             payload["model"] = "mixtral-8x7b-32768"
-            payload["max_tokens"] = 900
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            payload["max_tokens"] = min(payload["max_tokens"], 900)
+            response = _post_groq(api_key, url, headers, payload, timeout=30, stream=True)
+
+        response.raise_for_status()
+
+        for data in _iter_sse_data(response):
+            chunk = json.loads(data)
+
+            if 'error' in chunk:
+                error_msg = chunk.get('error', {})
+                if isinstance(error_msg, dict):
+                    raise Exception(error_msg.get('message', 'Unknown error'))
+                raise Exception(error_msg)
+
+            choices = chunk.get('choices') or []
+            if not choices:
+                continue
+            token = (choices[0].get('delta') or {}).get('content')
+            if token:
+                yield token
+
+    except RetryLater:
+        raise  # waited out by the generation service, see utils.retry
+    except Exception as e:
+        raise Exception(f"Groq API error: {str(e)}")
+    finally:
+        if response is not None:
+            response.close()
+
+
+def get_groq_completion(api_key, prompt, stream=False, sampling=None, seed=None, max_tokens=None):
+    """Generate completion using Groq (FREE tier - very fast!)"""
+    url = GROQ_API_URL
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    # Random temperature for more variety in responses (reproducible when a seed is given)
+    sampling = sampling or sampling_params("groq", seed)
+
+    payload = {
+        "messages": [
+            {
+                "role": "system",
+                "content": GROQ_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "model": GROQ_MODEL,
+        "temperature": sampling["temperature"],  # Randomized temperature
+        "max_tokens": max_tokens or _groq_output_budget(prompt),
+        "top_p": sampling["top_p"],  # Randomized top_p
+        "stream": False
+    }
+    if seed is not None:
+        payload["seed"] = seed
+
+    if stream:
+        return _stream_groq_completion(api_key, url, headers, payload)
+
+    try:
+        response = _post_groq(api_key, url, headers, payload, timeout=45)
+
+        if response.status_code != 200:
+            annotate(status=response.status_code, response_body=response.text[:500])
+
+        if response.status_code == 400:
+            # Fallback to smaller model if needed
+            payload["model"] = "mixtral-8x7b-32768"
+            payload["max_tokens"] = min(payload["max_tokens"], 900)
+            response = _post_groq(api_key, url, headers, payload, timeout=30)
 
         response.raise_for_status()
 
@@ -185,17 +414,9 @@ Write proposals that make clients think: "This person really gets it and has bee
         raise Exception(f"Groq API error: {str(e)}")
 
 
-def get_ollama_completion(prompt, model="llama2", ollama_url="http://localhost:11434"):
-    """Generate completion using local Ollama (100% FREE!)"""
-    try:
-        url = f"{ollama_url}/api/generate"
-
-        # Random temperature for variety
-        temp = round(random.uniform(0.7, 0.9), 2)
-
-        payload = {
-            "model": model,
-            "prompt": f"""You are a freelancer writing a personal, conversational Upwork proposal. Write like a real person who understands the client's challenges and has relevant experience to share.
+# Sent as the system message so it stays a fixed prefix Ollama can reuse
+# from its KV cache; the per-request prompt follows as the user message
+OLLAMA_SYSTEM_PROMPT = """You are a freelancer writing a personal, conversational Upwork proposal. Write like a real person who understands the client's challenges and has relevant experience to share.
 
 Key requirements:
 - Sound natural and conversational (use contractions, vary sentence length)
@@ -203,57 +424,299 @@ Key requirements:
 - Show genuine understanding of their specific challenge
 - Include concrete metrics and results from past work
 - Be confident but relatable, not boastful
-- End with a thoughtful question or clear next step
+- End with a thoughtful question or clear next step"""
 
-{prompt}
+OLLAMA_USER_SUFFIX = "\n\nWrite a winning, personable proposal:"
 
-Write a winning, personable proposal:""",
-            "stream": False,
-            "options": {
-                "temperature": temp,
-                "top_p": round(random.uniform(0.85, 0.95), 2),
-                "num_predict": 1000
-            }
-        }
+# A local server that refuses connections is almost always just not running
+OLLAMA_RETRY_POLICY = RetryPolicy(max_attempts=2)
+
+
+def _stream_ollama_completion(url, payload, ollama_url):
+    """Yield completion tokens from Ollama's newline-delimited JSON stream."""
+    response = None
+    try:
+        payload = dict(payload, stream=True)
+        response = send_with_retry(
+            "ollama", lambda: http_post(url, json=payload, timeout=60, stream=True), OLLAMA_RETRY_POLICY
+        )
+        response.raise_for_status()
 
-        response = requests.post(url, json=payload, timeout=60)
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if 'error' in chunk:
+                raise Exception(chunk['error'])
+            content = chunk.get('message', {}).get('content')
+            if content:
+                yield content
+            if chunk.get('done'):
+                record_timings(ollama_url, payload["model"], chunk)
+                break
+
+    except RetryLater:
+        raise  # waited out by the generation service, see utils.retry
+    except Exception as e:
+        raise Exception(f"Ollama error: {str(e)} - Make sure Ollama is running locally")
+    finally:
+        if response is not None:
+            response.close()
+
+
+def get_ollama_completion(prompt, model="llama2", ollama_url="http://localhost:11434", stream=False,
+                          sampling=None, seed=None, max_tokens=None, keep_alive=KEEP_ALIVE):
+    """Generate completion using local Ollama (100% FREE!)
+
+    Load, prompt processing and generation times of the request are kept in
+    utils.ollama_engine (see last_timings).
+    """
+    url = f"{ollama_url}/api/chat"
+
+    # Random temperature for variety (reproducible when a seed is given)
+    sampling = sampling or sampling_params("ollama", seed)
+
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": OLLAMA_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt + OLLAMA_USER_SUFFIX},
+        ],
+        "stream": False,
+        "keep_alive": keep_alive,
+        "options": dict(
+            model_options(model),
+            temperature=sampling["temperature"],
+            top_p=sampling["top_p"],
+            num_predict=max_tokens or 1000,
+        )
+    }
+    if seed is not None:
+        payload["options"]["seed"] = seed
+
+    if stream:
+        return _stream_ollama_completion(url, payload, ollama_url)
+
+    try:
+        response = send_with_retry("ollama", lambda: http_post(url, json=payload, timeout=60), OLLAMA_RETRY_POLICY)
         response.raise_for_status()
 
         result = response.json()
-        return result.get('response', '').strip()
+        record_timings(ollama_url, model, result)
+        return result.get('message', {}).get('content', '').strip()
 
     except Exception as e:
         raise Exception(f"Ollama error: {str(e)} - Make sure Ollama is running locally")
 
 
-def get_free_completion(prompt, provider="groq", **kwargs):
-    """Unified interface for all free LLM providers"""
+def sampling_params(provider, seed=None):
+    """Randomized temperature/top_p for a provider; reproducible when seeded."""
+    rng = random.Random(seed)
+    low, high = (0.75, 0.95) if provider == "groq" else (0.7, 0.9)
+    return {
+        "temperature": round(rng.uniform(low, high), 2),
+        "top_p": round(rng.uniform(0.85, 0.95), 2)
+    }
+
+
+def _cached_stream(chunks, cache, key):
+    """Pass chunks through and store the full text once the stream completes."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.put(key, "".join(parts).strip())
+
+
+def get_free_completion(prompt, provider="groq", stream=False, seed=None, use_cache=True, **kwargs):
+    """Unified interface for all free LLM providers.
+
+    Returns the completion, or with stream=True a generator of text chunks.
+    A seed makes sampling reproducible, and such completions are cached
+    unless use_cache is False. provider="auto" routes between
+    kwargs["candidates"], dicts of "provider" plus its keyword arguments
+    (see utils.routing). length_limit (characters) ends the completion near
+    that length; the result can still be slightly over (see fit_to_limit).
+    """
+    attrs = {"provider": provider, "prompt_chars": len(prompt)}
+    if stream:
+        # Opened inside the span, so the thread that pulls the provider's
+        # stream records its requests and retries there
+        def open_chunks():
+            chunks = _free_completion(prompt, provider, True, seed, use_cache, kwargs, attrs)
+            annotate(**attrs)
+            return chunks
+
+        return traced_stream("completion", open_chunks, **attrs)
+
+    with span("completion", **attrs) as stage:
+        result = _free_completion(prompt, provider, False, seed, use_cache, kwargs, attrs)
+        stage.set(**attrs, chars=len(result), tokens=estimate_tokens(result, attrs.get("model")))
+        return result
+
+
+def _free_completion(prompt, provider, stream, seed, use_cache, kwargs, attrs):
+    """get_free_completion without the tracing; fills attrs with what it learns."""
+    if provider == "auto":
+        # Fastest available: route across kwargs["candidates"], hedging slow starts
+        chunks = route_completion(
+            get_free_completion, prompt, kwargs.get('candidates', []),
+            seed=seed, hedge=kwargs.get('hedge', True), route_info=kwargs.get('route_info')
+        )
+        if kwargs.get('length_limit'):
+            chunks = guard_stream(chunks, kwargs['length_limit'])
+        return chunks if stream else "".join(chunks).strip()
 
     if provider == "huggingface":
-        hf_token = kwargs.get('hf_token')
-        model_name = kwargs.get('model_name', 'microsoft/DialoGPT-medium')
-        return get_huggingface_completion(hf_token, prompt, model_name)
-
+        model = kwargs.get('model_name', 'microsoft/DialoGPT-medium')
     elif provider == "groq":
-        api_key = kwargs.get('api_key')
-        return get_groq_completion(api_key, prompt)
-
+        model = GROQ_MODEL
     elif provider == "ollama":
         model = kwargs.get('model', 'llama2')
-        ollama_url = kwargs.get('ollama_url', 'http://localhost:11434')
-        return get_ollama_completion(prompt, model, ollama_url)
-
     else:
         raise Exception(f"Unknown provider: {provider}")
 
-
-def create_upwork_prompt(job_description, supporting_content):
-    """Create optimized prompt for natural, conversational Upwork proposals with substantial depth"""
-
-    # Limit content to avoid token issues
-    jd_preview = job_description[:2500] if job_description else "No job description provided"
-    content_preview = supporting_content[:2500] if supporting_content else "No supporting content provided"
-
+    sampling = sampling_params(provider, seed)
+    max_tokens = kwargs.get('max_tokens')
+    length_limit = kwargs.get('length_limit')
+    attrs.update(model=model, max_tokens=max_tokens, length_limit=length_limit, cached=False)
+
+    cache = key = None
+    if seed is not None and use_cache:
+        cache = get_completion_cache()
+        params = dict(sampling, max_tokens=max_tokens)
+        if length_limit:
+            params["length_limit"] = length_limit  # unguarded entries keep their keys
+        key = completion_key(provider, model, prompt, params, seed)
+        cached = cache.get(key)
+        if cached is not None:
+            attrs["cached"] = True
+            return iter([cached]) if stream else cached
+
+    def request(stream):
+        if provider == "huggingface":
+            hf_token = kwargs.get('hf_token')
+            return get_huggingface_completion(
+                hf_token, prompt, model, stream=stream, sampling=sampling, seed=seed, max_tokens=max_tokens
+            )
+        if provider == "groq":
+            api_key = kwargs.get('api_key')
+            return get_groq_completion(
+                api_key, prompt, stream=stream, sampling=sampling, seed=seed, max_tokens=max_tokens
+            )
+        # ollama
+        ollama_url = kwargs.get('ollama_url', 'http://localhost:11434')
+        return get_ollama_completion(
+            prompt, model, ollama_url, stream=stream, sampling=sampling, seed=seed, max_tokens=max_tokens
+        )
+
+    def complete():
+        if not length_limit:
+            return request(stream)
+        # Streamed from the provider even when a string is wanted: closing the
+        # stream at a sentence end near the limit stops generation there
+        chunks = guard_stream(request(True), length_limit)
+        return chunks if stream else "".join(chunks).strip()
+
+    # Identical requests already in flight (same prompt pasted by several
+    # users, or a rerun) share that request instead of sending their own;
+    # only with the same credential, so a bad key never gets another user's answer
+    credential = kwargs.get('api_key') or kwargs.get('hf_token') or ""
+    flight_key = completion_key(
+        provider, model, prompt,
+        {"max_tokens": max_tokens, "length_limit": length_limit, "ollama_url": kwargs.get('ollama_url'),
+         "credential": hashlib.sha256(credential.encode("utf-8")).hexdigest()}, seed
+    )
+    if stream:
+        result = completion_flights.stream(flight_key, complete)
+    else:
+        result = completion_flights.do(flight_key, complete)
+
+    if cache is None:
+        return result
+    if stream:
+        return _cached_stream(result, cache, key)
+    cache.put(key, result)
+    return result
+
+
+def variant_seeds(count, seed=None):
+    """One seed per variant: seed, seed+1, ... in deterministic mode, random otherwise.
+
+    Distinct seeds give each variant its own sampling parameters and keep
+    them from being coalesced into a single request.
+    """
+    if seed is not None:
+        return [seed + i for i in range(count)]
+    return [random.randrange(2 ** 31) for _ in range(count)]
+
+
+def get_free_variants(prompt, provider="groq", count=3, seed=None, use_cache=True, on_chunk=None,
+                      stop=None, **kwargs):
+    """count alternative completions of one prompt, generated at the same time.
+
+    Hugging Face returns them all from one request (num_return_sequences);
+    Groq's API only accepts n=1 and Ollama has no batching, so the other
+    providers get one concurrent streaming request per variant. on_chunk(i,
+    text) is called as variant i's text arrives, and a set stop event
+    abandons the remaining streams. Returns [{"seed", "text", "error"}]; a
+    variant that failed has text None, and if every variant fails the first
+    error is raised.
+    """
+    seeds = variant_seeds(count, seed)
+    results = [{"seed": variant_seed, "text": None, "error": None} for variant_seed in seeds]
+    # Only deterministic-mode variants are worth caching, as with single completions
+    use_cache = use_cache and seed is not None
+
+    with span("variants", provider=provider, count=count) as stage:
+        if provider == "huggingface" and count > 1:
+            texts = get_huggingface_variants(
+                kwargs.get('hf_token'), prompt, count, kwargs.get('model_name', 'microsoft/DialoGPT-medium'),
+                seed=seed, max_tokens=kwargs.get('max_tokens')
+            )
+            for index, result in enumerate(results):
+                result["text"] = texts[index] if index < len(texts) else None
+                if result["text"] is None:
+                    result["error"] = "The model returned fewer sequences than requested"
+                elif on_chunk:
+                    on_chunk(index, result["text"])
+        else:
+            def generate(index):
+                chunks = get_free_completion(prompt, provider, stream=True, seed=results[index]["seed"],
+                                             use_cache=use_cache, **kwargs)
+                parts = []
+                try:
+                    for chunk in chunks:
+                        if stop is not None and stop.is_set():
+                            break
+                        parts.append(chunk)
+                        if on_chunk:
+                            on_chunk(index, chunk)
+                finally:
+                    chunks.close()
+                return "".join(parts).strip()
+
+            with ThreadPoolExecutor(max_workers=count, thread_name_prefix="variant") as pool:
+                futures = [pool.submit(bind(generate), index) for index in range(count)]
+                for result, future in zip(results, futures):
+                    try:
+                        result["text"] = future.result()
+                    except Exception as e:
+                        result["error"] = str(e)
+
+        failed = [result["error"] for result in results if result["error"]]
+        stage.set(failed=len(failed))
+        if len(failed) == count:
+            raise Exception(failed[0])
+        return results
+
+
+def _prompt_sections(seed=None):
+    """Intro line and instruction block of the proposal prompt.
+
+    The opening, methodology and value proposition are picked at random;
+    a seed makes the picks reproducible.
+    """
     # Random conversation starters for variety
     openings = [
         "I've been in your shoes before - tight deadlines and high stakes are par for the course in data analysis.",
@@ -281,19 +744,14 @@ def create_upwork_prompt(job_description, supporting_content):
         "My compliance background means I naturally build in validation and documentation even when time is tight"
     ]
 
-    chosen_opening = random.choice(openings)
-    chosen_methodology = random.choice(methodologies)
-    chosen_value_prop = random.choice(value_props)
+    rng = random.Random(seed)
+    chosen_opening = rng.choice(openings)
+    chosen_methodology = rng.choice(methodologies)
+    chosen_value_prop = rng.choice(value_props)
 
-    prompt = f"""Write a comprehensive, natural, conversational Upwork proposal that demonstrates deep expertise while sounding genuinely human. This needs to be substantial and detailed.
+    intro = "Write a comprehensive, natural, conversational Upwork proposal that demonstrates deep expertise while sounding genuinely human. This needs to be substantial and detailed."
 
-**JOB POSTING:**
-{jd_preview}
-
-**MY BACKGROUND:**
-{content_preview}
-
-**WRITING STYLE REQUIREMENTS:**
+    instructions = f"""**WRITING STYLE REQUIREMENTS:**
 - Start with: "{chosen_opening}"
 - Write conversationally - use contractions, vary sentence length, sound human
 - Share experiences like you're telling stories to a colleague over coffee
@@ -349,7 +807,7 @@ def create_upwork_prompt(job_description, supporting_content):
    - Show you're thinking beyond just the basic requirements
 
 **CRITICAL REQUIREMENTS:**
-- **LENGTH**: 4000-5000+ characters (substantial and comprehensive)
+- **LENGTH**: 3500-4500 characters (substantial and comprehensive, but never over Upwork's {UPWORK_CHAR_LIMIT}-character limit)
 - **TONE**: Professional but conversational, like talking to a colleague
 - **FOCUS**: Their specific challenge, not generic data analysis capabilities  
 - **METRICS**: Include 3-4 specific numbers/results from your background
@@ -363,4 +821,200 @@ Make every sentence count - this is a high-stakes project that deserves a compre
 
 Write the complete, detailed proposal now:"""
 
-    return prompt
\ No newline at end of file
+    return intro, instructions
+
+
+def _render_prompt(intro, jd_preview, content_preview, instructions, background_first=False):
+    job = f"**JOB POSTING:**\n{jd_preview}"
+    background = f"**MY BACKGROUND:**\n{content_preview}"
+    first, second = (background, job) if background_first else (job, background)
+    return f"""{intro}
+
+{first}
+
+{second}
+
+{instructions}"""
+
+
+@traced("prompt_build")
+def create_upwork_prompt(job_description, supporting_content, seed=None):
+    """Create optimized prompt for natural, conversational Upwork proposals with substantial depth
+
+    The opening, methodology and value proposition are picked at random;
+    pass a seed to make the prompt reproducible.
+    """
+
+    # Limit content to avoid token issues
+    jd_preview = job_description[:2500] if job_description else "No job description provided"
+    content_preview = supporting_content[:2500] if supporting_content else "No supporting content provided"
+
+    intro, instructions = _prompt_sections(seed)
+    prompt = _render_prompt(intro, jd_preview, content_preview, instructions)
+    annotate(chars=len(prompt), tokens=estimate_tokens(prompt))
+    return prompt
+
+
+def _provider_overhead(provider):
+    """Prompt text a provider adds around ours (system message or wrapper)."""
+    if provider == "groq":
+        return GROQ_SYSTEM_PROMPT
+    if provider == "ollama":
+        return OLLAMA_SYSTEM_PROMPT + OLLAMA_USER_SUFFIX
+    return ""
+
+
+@traced("prompt_build")
+def create_budgeted_prompt(job_description, supporting_content, provider="groq", model=None, seed=None):
+    """Build the proposal prompt to fit the model's context window (see utils.prompt_budget).
+
+    Returns (prompt, report); report["max_tokens"] is the output budget to
+    pass to get_free_completion and the *_tokens entries are the estimated
+    counts actually used.
+    """
+    if model is None:
+        model = GROQ_MODEL if provider == "groq" else None
+
+    jd = job_description or "No job description provided"
+    content = supporting_content or "No supporting content provided"
+    intro, instructions = _prompt_sections(seed)
+
+    fixed_tokens = estimate_tokens(_render_prompt(intro, "", "", instructions) + _provider_overhead(provider), model)
+    plan = plan_budget(provider, model, fixed_tokens, estimate_tokens(jd, model), estimate_tokens(content, model))
+
+    jd_preview = truncate_to_tokens(jd, plan["jd_budget"], model)
+
+    # Too much background: keep the chunks most relevant to this job rather
+    # than whatever happens to come first
+    content_preview = content
+    chunks_used = chunks_total = None
+    if estimate_tokens(content, model) > plan["background_budget"]:
+        from utils.retrieval import select_relevant_context  # loads numpy, so only when needed
+
+        with span("background_select", budget=plan["background_budget"]) as stage:
+            content_preview, chunks_used, chunks_total = select_relevant_context(
+                content, jd, plan["background_budget"], model
+            )
+            stage.set(chunks=chunks_used, chunks_total=chunks_total)
+        if not content_preview:
+            content_preview = truncate_to_tokens(content, plan["background_budget"], model)
+    # Ollama reuses the KV cache of a matching prompt prefix, and the
+    # background changes far less often between requests than the posting
+    prompt = _render_prompt(intro, jd_preview, content_preview, instructions, background_first=provider == "ollama")
+
+    report = dict(
+        plan,
+        jd_tokens=estimate_tokens(jd_preview, model),
+        background_tokens=estimate_tokens(content_preview, model),
+        instruction_tokens=estimate_tokens(intro + instructions, model),
+        prompt_tokens=estimate_tokens(prompt, model),
+        jd_truncated=len(jd_preview) < len(jd),
+        background_truncated=content_preview != content,
+        background_chunks_used=chunks_used,
+        background_chunks_total=chunks_total,
+    )
+    annotate(provider=provider, model=model, chars=len(prompt), tokens=report["prompt_tokens"])
+    return prompt, report
+
+
+ADAPT_INSTRUCTIONS = """**ADAPT THE DRAFT:**
+- Keep the draft's voice, structure, stories and metrics wherever they still apply
+- Rewrite every reference to the old posting so it addresses the new one's specific needs
+- Remove anything that does not fit the new posting; do not invent new experience
+- Keep it 3500-4500 characters (Upwork's limit is 5000), conversational, with no generic phrases
+- End with a specific question about the new posting
+
+Write the adapted proposal now:"""
+
+
+@traced("prompt_build")
+def create_adapt_prompt(job_description, prior_proposal, provider="groq", model=None):
+    """Short prompt that adapts a proposal written for a near-duplicate posting.
+
+    Used instead of the full create_upwork_prompt template when the job is a
+    repost or near-clone (see utils.dedup). Returns (prompt, report) like
+    create_budgeted_prompt; the prior proposal is never cut, only the job
+    description is.
+    """
+    if model is None:
+        model = GROQ_MODEL if provider == "groq" else None
+
+    jd = job_description or "No job description provided"
+    intro = "Here is a proposal I wrote for a very similar Upwork posting. Adapt it to the new posting below."
+
+    def render(jd_preview):
+        return f"""{intro}
+
+**NEW JOB POSTING:**
+{jd_preview}
+
+**MY PREVIOUS PROPOSAL:**
+{prior_proposal}
+
+{ADAPT_INSTRUCTIONS}"""
+
+    fixed_tokens = estimate_tokens(render("") + _provider_overhead(provider), model)
+    plan = plan_budget(provider, model, fixed_tokens, estimate_tokens(jd, model), 0)
+    jd_preview = truncate_to_tokens(jd, plan["jd_budget"], model)
+    prompt = render(jd_preview)
+
+    report = dict(
+        plan,
+        jd_tokens=estimate_tokens(jd_preview, model),
+        background_tokens=estimate_tokens(prior_proposal, model),
+        instruction_tokens=estimate_tokens(intro + ADAPT_INSTRUCTIONS, model),
+        prompt_tokens=estimate_tokens(prompt, model),
+        jd_truncated=len(jd_preview) < len(jd),
+        background_truncated=False,
+        background_chunks_used=None,
+        background_chunks_total=None,
+    )
+    annotate(provider=provider, model=model, chars=len(prompt), tokens=report["prompt_tokens"], adapted=True)
+    return prompt, report
+
+
+CONDENSE_INSTRUCTIONS = """**CONDENSE THE DRAFT:**
+- It is {chars} characters; Upwork rejects proposals over {limit}, so bring it under {target}
+- Keep the voice, the strongest story with its metrics, and the closing question
+- Cut repetition and filler first; do not add anything new
+- If the draft stops mid-sentence, finish that thought briefly or drop it
+
+Write the condensed proposal now:"""
+
+
+@traced("condense")
+def fit_to_limit(text, provider="groq", limit=UPWORK_CHAR_LIMIT, seed=None, **kwargs):
+    """text if it fits the limit, otherwise a condensed rewrite that does.
+
+    Condensing is one short completion: the draft plus a few instructions,
+    no posting or background, with the output budgeted for the target length
+    and guarded like the original. If it fails or still overshoots, the
+    draft is cut at its last sentence end that fits (trim_to_limit). kwargs
+    are get_free_completion's provider arguments.
+    """
+    if len(text) <= limit:
+        return text
+    target = limit - GUARD_MARGIN
+    prompt = f"""Here is an Upwork proposal that is too long.
+
+**DRAFT PROPOSAL:**
+{text}
+
+{CONDENSE_INSTRUCTIONS.format(chars=len(text), limit=limit, target=target)}"""
+
+    model = GROQ_MODEL if provider == "groq" else kwargs.get('model') or kwargs.get('model_name')
+    kwargs = dict(kwargs, length_limit=limit, max_tokens=math.ceil(limit / chars_per_token(model)))
+    kwargs.pop('route_info', None)  # keeps describing the draft's provider
+    annotate(chars=len(text), limit=limit)
+    try:
+        condensed = get_free_completion(prompt, provider, seed=seed, **kwargs)
+    except Exception as e:
+        record_error(e)
+        condensed = ""
+    if condensed and len(condensed) <= limit:
+        record_fit("condensed")
+        annotate(outcome="condensed", condensed_chars=len(condensed))
+        return condensed
+    record_fit("trimmed")
+    annotate(outcome="trimmed")
+    return trim_to_limit(text, limit)
@@ -0,0 +1,235 @@
+"""Searchable history of generated proposals.
+
+Every finished proposal is kept in SQLite with the job description, a
+fingerprint of the background it was written from, the prompt, provider,
+model, latency and token counts. An FTS5 index over the job descriptions
+and proposals makes past answers searchable in milliseconds.
+
+Writes never block generation: record() only queues the entry, and a writer
+thread commits whatever has queued up in one transaction, every
+FLUSH_INTERVAL seconds or BATCH_SIZE entries. Reads go through their own
+connection (the database is in WAL mode, so they don't wait for the writer)
+and are paginated by id, so a page costs the same however deep it is;
+iter_entries streams the whole history for export.
+"""
+import atexit
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from utils.url_cache import DEFAULT_CACHE_DIR
+
+BATCH_SIZE = 64
+FLUSH_INTERVAL = 1.0  # seconds a recorded entry may wait for its batch
+PAGE_SIZE = 10
+EXPORT_BATCH = 500
+SNIPPET_WORDS = 24
+
+FIELDS = ("created_at", "job_description", "sources_hash", "prompt", "proposal", "provider", "model", "seed",
+          "latency", "prompt_tokens", "output_tokens", "chars")
+# Listing and search results leave out the (large) prompt
+SUMMARY_FIELDS = ("id", "created_at", "job_description", "proposal", "provider", "model", "latency",
+                  "output_tokens", "chars")
+
+_TERM = re.compile(r"\w+")
+
+
+def sources_fingerprint(sources):
+    """Short stable hash of the merged background text, or None without one."""
+    if not sources:
+        return None
+    return hashlib.sha256(sources.encode("utf-8")).hexdigest()[:16]
+
+
+def match_query(text):
+    """FTS5 query matching every word of text, the last one as a prefix.
+
+    Words are quoted, so punctuation and FTS5 operators in user input are
+    searched for literally instead of being parsed.
+    """
+    terms = _TERM.findall(text)
+    if not terms:
+        return None
+    return " ".join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+class HistoryStore:
+    """SQLite proposal history with an FTS5 index and a batching writer thread."""
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, "history.sqlite3")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._read_lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # separate, so record() never waits for a read
+        self._stats = {"recorded": 0, "written": 0, "batches": 0, "errors": 0}
+
+        self._writer = sqlite3.connect(path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.executescript(
+            """CREATE TABLE IF NOT EXISTS proposals (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                job_description TEXT NOT NULL,
+                sources_hash TEXT,
+                prompt TEXT,
+                proposal TEXT NOT NULL,
+                provider TEXT,
+                model TEXT,
+                seed INTEGER,
+                latency REAL,
+                prompt_tokens INTEGER,
+                output_tokens INTEGER,
+                chars INTEGER
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS proposals_fts USING fts5 (
+                job_description, proposal, content='proposals', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS proposals_fts_insert AFTER INSERT ON proposals BEGIN
+                INSERT INTO proposals_fts (rowid, job_description, proposal)
+                VALUES (new.id, new.job_description, new.proposal);
+            END;
+            CREATE TRIGGER IF NOT EXISTS proposals_fts_delete AFTER DELETE ON proposals BEGIN
+                INSERT INTO proposals_fts (proposals_fts, rowid, job_description, proposal)
+                VALUES ('delete', old.id, old.job_description, old.proposal);
+            END;"""
+        )
+        self._writer.commit()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.row_factory = sqlite3.Row
+
+        threading.Thread(target=self._write_loop, daemon=True, name="history-writer").start()
+        atexit.register(self.flush)
+
+    def record(self, job_description, proposal, **fields):
+        """Queue a finished proposal for writing; fields are the other FIELDS."""
+        entry = dict(fields, job_description=job_description, proposal=proposal)
+        entry.setdefault("created_at", time.time())
+        entry.setdefault("chars", len(proposal))
+        unknown = set(entry) - set(FIELDS)
+        if unknown:
+            raise Exception(f"Unknown history fields: {', '.join(sorted(unknown))}")
+        with self._stats_lock:
+            self._stats["recorded"] += 1
+        self._queue.put(tuple(entry.get(field) for field in FIELDS))
+
+    def flush(self):
+        """Wait until everything recorded so far is written."""
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Let a batch build up, but never hold an entry past flush_interval
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                with self._writer:
+                    self._writer.executemany(
+                        f"INSERT INTO proposals ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                        batch,
+                    )
+                with self._stats_lock:
+                    self._stats["written"] += len(batch)
+                    self._stats["batches"] += 1
+            except sqlite3.Error:
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _select(self, sql, params=()):
+        with self._read_lock:
+            return [dict(row) for row in self._reader.execute(sql, params)]
+
+    def page(self, before_id=None, limit=PAGE_SIZE):
+        """Newest entries first, limit per page; pass the last id of a page as before_id for the next."""
+        where = "WHERE id < ?" if before_id is not None else ""
+        params = (before_id, limit) if before_id is not None else (limit,)
+        return self._select(
+            f"SELECT {', '.join(SUMMARY_FIELDS)} FROM proposals {where} ORDER BY id DESC LIMIT ?", params
+        )
+
+    def search(self, text, limit=PAGE_SIZE, offset=0):
+        """Entries whose job description or proposal match every word of text, best match first.
+
+        Each result has a "snippet" of the proposal around the matched
+        words, with the matches in **bold**.
+        """
+        query = match_query(text)
+        if query is None:
+            return []
+        columns = ", ".join(f"p.{field}" for field in SUMMARY_FIELDS)
+        try:
+            return self._select(
+                f"SELECT {columns}, snippet(proposals_fts, 1, '**', '**', '…', {SNIPPET_WORDS}) AS snippet "
+                "FROM proposals_fts JOIN proposals AS p ON p.id = proposals_fts.rowid "
+                "WHERE proposals_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                (query, limit, offset),
+            )
+        except sqlite3.OperationalError:
+            return []
+
+    def get(self, entry_id):
+        """One entry with every field, or None."""
+        rows = self._select(f"SELECT id, {', '.join(FIELDS)} FROM proposals WHERE id = ?", (entry_id,))
+        return rows[0] if rows else None
+
+    def iter_entries(self, batch=EXPORT_BATCH):
+        """Every entry with every field, oldest first, read batch rows at a time."""
+        last_id = 0
+        while True:
+            rows = self._select(
+                f"SELECT id, {', '.join(FIELDS)} FROM proposals WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch)
+            )
+            yield from rows
+            if len(rows) < batch:
+                return
+            last_id = rows[-1]["id"]
+
+    def export_jsonl(self, out):
+        """Write the whole history to the text stream out as JSON lines; returns the number of entries."""
+        count = 0
+        for entry in self.iter_entries():
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+        return count
+
+    def __len__(self):
+        with self._read_lock:
+            return self._reader.execute("SELECT COUNT(*) FROM proposals").fetchone()[0]
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Process-wide proposal history, or None when the cache directory (or FTS5) is unusable."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = HistoryStore()
+                except (OSError, sqlite3.Error):
+                    return None
+    return _store
@@ -0,0 +1,261 @@
+"""Bounded, streaming HTML-to-text extraction.
+
+The response body is read incrementally under a hard byte cap and fed to an
+incremental parser that drops <script>/<style> content as it goes. Reading
+stops as soon as the cleaned text fills the character budget. lxml's parser
+is used when it is installed (imported on the first page, not at startup),
+otherwise the standard library's HTMLParser;
+the "soup" engine keeps the original download-everything BeautifulSoup path.
+"""
+import codecs
+from html.parser import HTMLParser
+
+from utils.tracing import annotate
+
+DEFAULT_TEXT_BUDGET = 8000
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+
+ENGINES = ("auto", "lxml", "html.parser", "soup")
+
+_SKIPPED_TAGS = {"script", "style"}
+_PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class _TextBudget:
+    """Whitespace-cleans text incrementally, exactly like the original extractor.
+
+    Only complete phrases (text followed by a line break or a double space)
+    are emitted, so the output matches soup.get_text() followed by the
+    line/phrase cleanup no matter how the text arrives.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.chunks = []
+        self.length = 0
+        # Text since the last line break or double space: no separator inside,
+        # kept as pieces so an unbroken run isn't re-scanned on every feed
+        self._pending = []
+        self._pending_length = 0
+
+    @property
+    def full(self):
+        # chunk lengths include the joining space, so this is joined length >= budget;
+        # pending text counts too, or a page without line breaks would be read to the end
+        return self.length + self._pending_length > self.budget
+
+    def feed(self, text):
+        if not text:
+            return
+        last = self._pending[-1][-1:] if self._pending else ""
+        if text.splitlines() == [text] and "  " not in last + text:
+            self._pending.append(text)
+            self._pending_length += len(text)
+            return
+
+        text = "".join(self._pending) + text
+        lines = text.splitlines(keepends=True)
+        tail = ""
+        if lines and lines[-1].splitlines() == [lines[-1]]:  # no line break yet
+            tail = lines.pop()
+        for line in lines:
+            self._add(line.split("  "))
+        phrases = tail.split("  ")
+        pending = phrases.pop()
+        self._add(phrases)
+        self._pending = [pending] if pending else []
+        self._pending_length = len(pending)
+
+    def _add(self, phrases):
+        for phrase in phrases:
+            if self.length > self.budget:
+                return
+            phrase = phrase.strip()
+            if phrase:
+                self.chunks.append(phrase)
+                self.length += len(phrase) + 1
+
+    def finish(self):
+        self._add(["".join(self._pending)])
+        self._pending = []
+        self._pending_length = 0
+        return " ".join(self.chunks)[:self.budget]
+
+
+class _VisibleText:
+    """Collects text outside <script>/<style>, the way BeautifulSoup builds strings.
+
+    Data is buffered until the next tag or comment; a run made only of ASCII
+    whitespace collapses to a single newline or space (except inside <pre> and
+    <textarea>), as in BeautifulSoup.endData.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self._skip = 0
+        self._preserve = 0
+        self._buffer = []
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        if not self._preserve and not text.strip(_ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        self.sink.feed(text)
+
+    def _open(self, tag):
+        self._flush()
+        if tag in _SKIPPED_TAGS:
+            self._skip += 1
+        elif tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve += 1
+
+    def _close(self, tag):
+        self._flush()
+        if tag in _SKIPPED_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in _PRESERVE_WHITESPACE_TAGS and self._preserve:
+            self._preserve -= 1
+
+    def _data(self, data):
+        if not self._skip:
+            self._buffer.append(data)
+
+
+class _StdlibParser(_VisibleText, HTMLParser):
+    """Incremental html.parser backend."""
+
+    def __init__(self, sink):
+        _VisibleText.__init__(self, sink)
+        HTMLParser.__init__(self, convert_charrefs=True)
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag)
+        self._close(tag)
+
+    def handle_endtag(self, tag):
+        self._close(tag)
+
+    def handle_data(self, data):
+        self._data(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+
+    def close(self):
+        HTMLParser.close(self)
+        self._flush()
+
+
+class _LxmlTarget(_VisibleText):
+    """lxml parser target (the faster backend)."""
+
+    def start(self, tag, attrib):
+        self._open(tag)
+
+    def end(self, tag):
+        self._close(tag)
+
+    def data(self, data):
+        self._data(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def pi(self, target, data=None):
+        self._flush()
+
+    def close(self):
+        self._flush()
+
+
+def _make_parser(engine, sink):
+    if engine in ("lxml", "auto"):
+        try:
+            from lxml import etree
+        except ImportError:  # optional faster backend
+            if engine == "lxml":
+                raise Exception("lxml is not installed")
+        else:
+            return etree.HTMLParser(target=_LxmlTarget(sink))
+    return _StdlibParser(sink)
+
+
+def _soup_text(content, budget):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.extract()
+
+    text = soup.get_text()
+    # Clean up whitespace
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)[:budget]
+
+
+def _charset(response):
+    """Declared charset, defaulting to UTF-8 rather than requests' ISO-8859-1 guess."""
+    content_type = response.headers.get("Content-Type", "")
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "charset" and value:
+            charset = value.strip("\"' ")
+            try:
+                codecs.lookup(charset)
+                return charset
+            except LookupError:
+                break
+    return "utf-8"
+
+
+def extract_text_from_response(response, engine="auto", budget=DEFAULT_TEXT_BUDGET, max_bytes=DEFAULT_MAX_BYTES):
+    """Extract cleaned visible text from a (preferably stream=True) response."""
+    if engine not in ENGINES:
+        raise Exception(f"Unknown HTML engine: {engine}")
+
+    if engine == "soup":
+        annotate(bytes=len(response.content))
+        return _soup_text(response.content, budget)
+
+    sink = _TextBudget(budget)
+    parser = _make_parser(engine, sink)
+    decoder = codecs.getincrementaldecoder(_charset(response))(errors="replace")
+
+    read = 0
+    try:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if not chunk:
+                continue
+            chunk = chunk[:max_bytes - read]
+            read += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if sink.full or read >= max_bytes:
+                break
+        else:
+            parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+    finally:
+        response.close()
+        annotate(bytes=read)
+
+    return sink.finish()
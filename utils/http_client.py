@@ -0,0 +1,145 @@
+"""Shared, pooled HTTP client for every network call the helpers make.
+
+A single requests.Session lives for the whole process, so Streamlit reruns
+and concurrent sessions all reuse the same keep-alive connections instead of
+paying a fresh TCP+TLS handshake per call. requests is imported when the
+session is first built, so pages that make no request never load it.
+"""
+import os
+import threading
+
+DEFAULT_POOL_CONNECTIONS = int(os.environ.get("UPW_HTTP_POOL_CONNECTIONS", 10))  # hosts kept pooled
+DEFAULT_POOL_MAXSIZE = int(os.environ.get("UPW_HTTP_POOL_MAXSIZE", 20))  # keep-alive connections per host
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("UPW_HTTP_CONNECT_TIMEOUT", 5))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("UPW_HTTP_READ_TIMEOUT", 60))
+
+_lock = threading.Lock()
+_session = None
+_config = {
+    "pool_connections": DEFAULT_POOL_CONNECTIONS,
+    "pool_maxsize": DEFAULT_POOL_MAXSIZE,
+    "connect_timeout": DEFAULT_CONNECT_TIMEOUT,
+    "read_timeout": DEFAULT_READ_TIMEOUT,
+}
+
+# host -> {"requests": n, "handshakes": n}; survives pool eviction
+_stats = {}
+
+
+def _record(host, field):
+    with _lock:
+        entry = _stats.setdefault(host, {"requests": 0, "handshakes": 0})
+        entry[field] += 1
+
+
+class _CountingMixin:
+    """Counts new connections (handshakes) and requests per pooled host."""
+
+    def _new_conn(self):
+        _record(self.host, "handshakes")
+        return super()._new_conn()
+
+    def urlopen(self, method, url, *args, **kwargs):
+        _record(self.host, "requests")
+        return super().urlopen(method, url, *args, **kwargs)
+
+
+def _build_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _CountingHTTPConnectionPool(_CountingMixin, HTTPConnectionPool):
+        pass
+
+    class _CountingHTTPSConnectionPool(_CountingMixin, HTTPSConnectionPool):
+        pass
+
+    class _PooledAdapter(HTTPAdapter):
+        """HTTPAdapter whose per-host pools report reuse statistics."""
+
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _CountingHTTPConnectionPool,
+                "https": _CountingHTTPSConnectionPool,
+            }
+
+    session = requests.Session()
+    adapter = _PooledAdapter(
+        pool_connections=_config["pool_connections"],
+        pool_maxsize=_config["pool_maxsize"],
+        pool_block=False,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def configure_http_client(pool_connections=None, pool_maxsize=None, connect_timeout=None, read_timeout=None):
+    """Change pool sizes or default timeouts; the session is rebuilt on next use."""
+    global _session
+    with _lock:
+        updates = {
+            "pool_connections": pool_connections,
+            "pool_maxsize": pool_maxsize,
+            "connect_timeout": connect_timeout,
+            "read_timeout": read_timeout,
+        }
+        _config.update({k: v for k, v in updates.items() if v is not None})
+        old, _session = _session, None
+    if old is not None:
+        old.close()
+
+
+def get_http_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _timeout(timeout):
+    if timeout is None:
+        return (_config["connect_timeout"], _config["read_timeout"])
+    if isinstance(timeout, (int, float)):
+        return (_config["connect_timeout"], timeout)
+    return timeout
+
+
+def http_request(method, url, timeout=None, **kwargs):
+    """Send a request through the shared pool.
+
+    A numeric timeout is treated as the read timeout; the connect timeout
+    always comes from the client configuration.
+    """
+    return get_http_session().request(method, url, timeout=_timeout(timeout), **kwargs)
+
+
+def http_get(url, timeout=None, **kwargs):
+    return http_request("GET", url, timeout=timeout, **kwargs)
+
+
+def http_post(url, timeout=None, **kwargs):
+    return http_request("POST", url, timeout=timeout, **kwargs)
+
+
+def http_client_stats():
+    """Return request, handshake and reuse counts, overall and per host."""
+    with _lock:
+        hosts = {host: dict(entry, reused=max(entry["requests"] - entry["handshakes"], 0))
+                 for host, entry in _stats.items()}
+        config = dict(_config)
+    total_requests = sum(h["requests"] for h in hosts.values())
+    total_handshakes = sum(h["handshakes"] for h in hosts.values())
+    return {
+        "requests": total_requests,
+        "handshakes": total_handshakes,
+        "reused": max(total_requests - total_handshakes, 0),
+        "hosts": hosts,
+        "config": config,
+    }
+
@@ -0,0 +1,198 @@
+"""Concurrent ingestion of a freelancer's background from many sources.
+
+URLs and PDFs are fetched and parsed at the same time on a shared, bounded
+thread pool: the work is network-bound, and slow, sparse PDFs already spread
+their pages over a process pool (utils.pdf_extract). At most PER_HOST
+requests go to one host at a time across every session in the process, so a
+list of case-study pages on one site doesn't hammer it; the rest wait in a
+per-host queue rather than in a pool worker, so they don't hold up other
+sessions' sources (submit_polite). Ingestion returns once everything is in or
+the deadline has passed, with whatever finished by then; sources still running
+are reported as timed out and keep going in the background, so their text is
+in the caches next time, while those still queued are dropped. The texts are
+merged with a fair share of the character budget each (fair_shares).
+"""
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from utils.helpers import extract_text_from_pdf, extract_text_from_url
+from utils.tracing import bind, span
+
+WORKERS = int(os.environ.get("UPW_INGEST_WORKERS", 8))
+PER_HOST = int(os.environ.get("UPW_INGEST_PER_HOST", 2))
+DEADLINE = 15.0  # seconds for all sources together
+SOURCES_BUDGET = 16000  # characters of merged background
+
+_pool = None
+_pool_lock = threading.Lock()
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def get_ingest_pool():
+    """Process-wide ingestion pool, shared by every session."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="ingest")
+    return _pool
+
+
+class _Host:
+    """Requests to one host: how many are running and those waiting for a slot."""
+
+    def __init__(self):
+        self.running = 0
+        self.waiting = deque()
+
+
+def submit_polite(host, fn, *args):
+    """Run fn(*args) on the ingest pool once host has a free slot; returns a Future.
+
+    Requests beyond PER_HOST wait in host's queue rather than in a pool
+    worker. Cancelling the future while it waits drops the request.
+    """
+    future = Future()
+    with _hosts_lock:
+        _hosts.setdefault(host, _Host()).waiting.append((future, fn, args))
+    _dispatch(host)
+    return future
+
+
+def _dispatch(host):
+    """Hand host's waiting requests to the pool while it has free slots."""
+    pool = get_ingest_pool()
+    while True:
+        with _hosts_lock:
+            state = _hosts[host]
+            if state.running >= PER_HOST or not state.waiting:
+                return
+            future, fn, args = state.waiting.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled while waiting
+            state.running += 1
+        pool.submit(_run_polite, host, future, fn, args)
+
+
+def _run_polite(host, future, fn, args):
+    try:
+        future.set_result(fn(*args))
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _hosts_lock:
+            _hosts[host].running -= 1
+        _dispatch(host)
+
+
+def _fetch_url(url):
+    text = extract_text_from_url(url)
+    if text.startswith("Error"):
+        raise Exception(text)
+    return text
+
+
+def _parse_pdf(data):
+    text = extract_text_from_pdf(io.BytesIO(data))
+    if text.startswith("Error"):
+        raise Exception(text)
+    return text
+
+
+def fair_shares(lengths, budget):
+    """Max-min fair split of budget characters between sources of the given lengths.
+
+    Every source gets an equal share; what shorter sources don't need is
+    shared among the longer ones, so nothing is cut while there is room.
+    """
+    shares = list(lengths)
+    remaining = budget
+    pending = sorted(range(len(lengths)), key=lambda index: lengths[index])
+    while pending:
+        share = remaining // len(pending)
+        if lengths[pending[0]] > share:
+            for index in pending:
+                shares[index] = share
+            break
+        remaining -= lengths[pending.pop(0)]
+    return shares
+
+
+def cut_text(text, limit):
+    """text cut to at most limit characters, at a word boundary where there is one nearby."""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    return cut[:space] if space > limit // 2 else cut
+
+
+def ingest_sources(urls=(), pdfs=(), texts=(), fetch_url=None, parse_pdf=None, deadline=DEADLINE,
+                   budget=SOURCES_BUDGET):
+    """Fetch urls and parse pdfs ((name, bytes) pairs) concurrently and merge them with texts.
+
+    fetch_url(url) and parse_pdf(data) return the text or raise; they
+    default to extract_text_from_url and extract_text_from_pdf. Returns
+    {"text", "sources"}: the merged background and one report per source in
+    input order, with its kind, name, status ("ok", "error" or "timeout"),
+    chars extracted, used (chars kept after the budget), seconds and error.
+    """
+    fetch_url = fetch_url or _fetch_url
+    parse_pdf = parse_pdf or _parse_pdf
+    started = time.monotonic()
+    deadline_at = started + deadline
+
+    def timed(load, *args):
+        load_started = time.monotonic()
+        return load(*args), time.monotonic() - load_started
+
+    reports = []
+    futures = {}
+    with span("ingest", urls=len(urls), pdfs=len(pdfs), texts=len(texts)) as stage:
+        pool = get_ingest_pool()
+        for url in urls:
+            reports.append({"kind": "url", "name": url})
+            futures[len(reports) - 1] = submit_polite(urlsplit(url).hostname or url, bind(timed), fetch_url, url)
+        for name, data in pdfs:
+            reports.append({"kind": "pdf", "name": name})
+            futures[len(reports) - 1] = pool.submit(bind(timed), parse_pdf, data)
+        wait(futures.values(), timeout=max(deadline_at - time.monotonic(), 0))
+
+        for index, report in enumerate(reports):
+            future = futures[index]
+            report.update(text="", error=None, seconds=None)
+            if not future.done():
+                future.cancel()  # still queued; a running fetch finishes in the background
+                report.update(status="timeout", error=f"not done after {deadline:g}s")
+            elif future.exception() is not None:
+                report.update(status="error", error=str(future.exception()))
+            else:
+                report["text"], report["seconds"] = future.result()
+                report["status"] = "ok"
+        for text in texts:
+            reports.append({"kind": "text", "name": "manual", "text": text, "status": "ok", "error": None,
+                            "seconds": 0.0})
+
+        extracted = [report.pop("text") for report in reports]
+        shares = fair_shares([len(text) for text in extracted], budget)
+        parts = []
+        for report, text, share in zip(reports, extracted, shares):
+            kept = cut_text(text, share)
+            report.update(chars=len(text), used=len(kept))
+            if kept:
+                parts.append(kept)
+        merged = "\n\n".join(parts)
+
+        stage.set(chars=len(merged), timed_out=sum(r["status"] == "timeout" for r in reports),
+                  failed=sum(r["status"] == "error" for r in reports))
+        if not stage.children:
+            # Nothing fetched or parsed (every source came from a cache, or
+            # there was only typed text): not worth a trace on every rerun
+            stage.discard()
+        return {"text": merged, "sources": reports}
@@ -0,0 +1,307 @@
+"""Background generation service, decoupled from the Streamlit script thread.
+
+Generations are submitted as jobs and run on an asyncio event loop in a
+daemon thread: a bounded queue feeds a fixed set of workers, and per-provider
+semaphores cap how many requests each provider sees at once. Provider calls
+are blocking, so each running job streams in a thread of the loop's executor
+while the script run that submitted it returns immediately. A provider
+asking to retry later doesn't hold that thread or the provider slot: the job
+waits on the loop and runs again (see utils.retry). The app polls
+the job by ID (a job outlives reruns) and its text grows as tokens arrive.
+Callers must heartbeat the jobs they watch - a reaper cancels jobs nobody
+has asked about for ABANDON_AFTER seconds (the session went away) and
+forgets finished jobs after RETAIN_FINISHED.
+"""
+import asyncio
+import contextlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.helpers import create_upwork_prompt, fit_to_limit, get_free_completion, get_free_variants
+from utils.retry import RetryLater, deferred_waits
+from utils.tracing import bind, span
+
+MAX_QUEUED = int(os.environ.get("UPW_JOB_QUEUE", 64))
+WORKERS = int(os.environ.get("UPW_JOB_WORKERS", 16))
+PROVIDER_LIMITS = {"groq": 8, "huggingface": 4, "ollama": 1, "auto": 8}
+DEFAULT_LIMIT = 4
+ABANDON_AFTER = 30.0  # seconds without a heartbeat
+RETAIN_FINISHED = 10 * 60.0  # seconds a finished job stays retrievable
+REAP_INTERVAL = 5.0
+
+ACTIVE = ("queued", "running")
+
+
+class Job:
+    """One generation request and what it has produced so far."""
+
+    def __init__(self, provider, prompt, seed, kwargs, variants=1):
+        self.id = uuid.uuid4().hex
+        self.provider = provider
+        self.prompt = prompt
+        self.seed = seed
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.chunks = []
+        # Variants mode: text pieces per variant, and each variant's outcome once done
+        self.variant_chunks = [[] for _ in range(variants)] if variants > 1 else None
+        self.variant_results = None
+        # Length guard: set while an over-limit text is condensed, and the
+        # length(s) it had before (per variant in variants mode)
+        self.condensing = False
+        self.condensed_from = None
+        self.error = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.heartbeat = self.created
+        # Set while waiting to retry: the provider's RetryLater and when it's due
+        self.resume = None
+        self.retry_at = None
+        self.cancelled = threading.Event()
+        self.run = bind(self._stream)  # the worker thread continues the submitter's trace
+
+    def _stream(self):
+        with span("job", provider=self.provider, queued_for=round(time.monotonic() - self.created, 6)):
+            if self.variant_chunks is not None:
+                self.variant_results = get_free_variants(
+                    self.prompt, self.provider, len(self.variant_chunks), seed=self.seed,
+                    on_chunk=lambda index, chunk: self.variant_chunks[index].append(chunk),
+                    stop=self.cancelled, **self.kwargs
+                )
+                self._fit_variants()
+                return
+            # Routed requests fail over instead of waiting, so only direct ones defer
+            waits = deferred_waits(self.resume) if self.provider != "auto" else contextlib.nullcontext()
+            with waits:
+                chunks = get_free_completion(self.prompt, self.provider, stream=True, seed=self.seed, **self.kwargs)
+                try:
+                    for chunk in chunks:
+                        if self.cancelled.is_set():
+                            return
+                        self.chunks.append(chunk)
+                finally:
+                    if hasattr(chunks, "close"):
+                        chunks.close()
+            text = "".join(self.chunks).strip()
+            if self._over_limit(text):
+                self.condensing = True
+                self.chunks = [self._fit(text)]
+                self.condensed_from = len(text)
+                self.condensing = False
+
+    def _over_limit(self, text):
+        limit = self.kwargs.get("length_limit")
+        return bool(limit) and len(text) > limit and not self.cancelled.is_set()
+
+    def _fit(self, text):
+        return fit_to_limit(text, self.provider, self.kwargs["length_limit"], seed=self.seed, **self.kwargs)
+
+    def _fit_variants(self):
+        self.condensed_from = [None] * len(self.variant_chunks)
+        for index, chunks in enumerate(self.variant_chunks):
+            text = "".join(chunks).strip()
+            if self._over_limit(text):
+                self.condensing = True
+                self.variant_chunks[index] = [self._fit(text)]
+                self.condensed_from[index] = len(text)
+        self.condensing = False
+
+    def snapshot(self, position=None):
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "provider": self.provider,
+            "status": self.status,
+            "text": "".join(self.chunks),
+            "variants": ["".join(chunks) for chunks in self.variant_chunks] if self.variant_chunks else None,
+            "variant_errors": [r["error"] for r in self.variant_results] if self.variant_results else None,
+            "condensing": self.condensing,
+            "condensed_from": self.condensed_from,
+            "retry_in": round(max(self.retry_at - now, 0.0), 1) if self.retry_at else None,
+            "error": self.error,
+            "position": position,
+            "queued_for": round((self.started or now) - self.created, 3),
+            "running_for": round((self.finished or now) - self.started, 3) if self.started else None,
+        }
+
+
+class GenerationService:
+    """Bounded, per-provider-limited job runner on a background event loop."""
+
+    def __init__(self, max_queued=MAX_QUEUED, workers=WORKERS, provider_limits=None):
+        self.provider_limits = dict(PROVIDER_LIMITS, **(provider_limits or {}))
+        self.max_queued = max_queued
+        self._jobs = {}
+        self._waiting = []  # queued job ids, for queue positions
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "rejected": 0, "done": 0, "error": 0, "cancelled": 0, "abandoned": 0}
+        self._loop = asyncio.new_event_loop()
+        # Streaming threads: one per job that can be running at once
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generation"))
+        self._ready = threading.Event()
+        threading.Thread(target=self._run_loop, args=(max_queued, workers), daemon=True,
+                         name="generation-service").start()
+        self._ready.wait()
+
+    def _run_loop(self, max_queued, workers):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._semaphores = {}
+        for _ in range(workers):
+            self._loop.create_task(self._worker())
+        self._loop.create_task(self._reaper())
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    def _semaphore(self, provider):
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(self.provider_limits.get(provider, DEFAULT_LIMIT))
+        return self._semaphores[provider]
+
+    def submit(self, provider, prompt=None, job_description=None, supporting_content=None, seed=None, variants=1,
+               **kwargs):
+        """Queue a generation and return its job ID.
+
+        Pass a ready prompt, or job_description/supporting_content to have
+        the job build it with create_upwork_prompt. kwargs are
+        get_free_completion's provider arguments. With variants > 1 the job
+        generates that many alternatives of the prompt at once (see
+        get_free_variants); the job holds one provider slot while they run.
+        """
+        if prompt is None:
+            prompt = create_upwork_prompt(job_description, supporting_content, seed=seed)
+        job = Job(provider, prompt, seed, kwargs, variants)
+        with self._lock:
+            # Jobs a worker has picked up but that wait for a provider slot count as queued too
+            accepted = len(self._waiting) < self.max_queued
+            if accepted:
+                self._jobs[job.id] = job
+                self._waiting.append(job.id)
+        if accepted:
+            accepted = asyncio.run_coroutine_threadsafe(self._enqueue(job), self._loop).result()
+        with self._lock:
+            if not accepted:
+                self._jobs.pop(job.id, None)
+                if job.id in self._waiting:
+                    self._waiting.remove(job.id)
+                self._stats["rejected"] += 1
+                raise Exception("Too many proposals are being generated right now - try again in a moment")
+            self._stats["submitted"] += 1
+        return job.id
+
+    async def _enqueue(self, job):
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def get(self, job_id, heartbeat=True):
+        """Snapshot of a job (None if unknown or expired); also counts as a heartbeat."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if heartbeat:
+                job.heartbeat = time.monotonic()
+            position = self._waiting.index(job_id) if job.status == "queued" else None
+            return job.snapshot(position)
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ACTIVE:
+                return False
+            job.cancelled.set()
+            if job.status == "queued":
+                self._finish(job, "cancelled")
+            return True
+
+    def _finish(self, job, status, error=None):
+        # Called with self._lock held
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+        if job.id in self._waiting:
+            self._waiting.remove(job.id)
+        self._stats[status] += 1
+
+    def stats(self):
+        with self._lock:
+            counts = {status: 0 for status in ACTIVE}
+            for job in self._jobs.values():
+                if job.status in counts:
+                    counts[job.status] += 1
+            return dict(self._stats, **counts)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        if job.cancelled.is_set() and job.status != "running":
+            return
+        async with self._semaphore(job.provider):
+            with self._lock:
+                if job.cancelled.is_set():
+                    if job.status == "running":  # cancelled while waiting to retry
+                        self._finish(job, "cancelled")
+                    return
+                job.status = "running"
+                job.started = job.started or time.monotonic()
+                job.retry_at = None
+                if job.id in self._waiting:
+                    self._waiting.remove(job.id)
+            try:
+                await self._loop.run_in_executor(None, job.run)
+            except RetryLater as e:
+                job.resume = e
+                job.retry_at = time.monotonic() + e.delay
+                self._loop.create_task(self._retry(job, e.delay))
+            except Exception as e:
+                with self._lock:
+                    self._finish(job, "error", str(e))
+            else:
+                with self._lock:
+                    self._finish(job, "cancelled" if job.cancelled.is_set() else "done")
+
+    async def _retry(self, job, delay):
+        # Waits on the loop: the executor thread and the provider slot are free meanwhile
+        await asyncio.sleep(delay)
+        await self._run(job)
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                for job_id, job in list(self._jobs.items()):
+                    if job.status in ACTIVE and now - job.heartbeat > ABANDON_AFTER:
+                        job.cancelled.set()
+                        self._stats["abandoned"] += 1
+                        if job.status == "queued":
+                            self._finish(job, "cancelled")
+                    elif job.status not in ACTIVE and now - job.finished > RETAIN_FINISHED:
+                        del self._jobs[job_id]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_generation_service():
+    """Process-wide generation service, shared by every session."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = GenerationService()
+    return _service
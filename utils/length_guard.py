@@ -0,0 +1,104 @@
+"""Keep streamed proposals inside Upwork's character limit.
+
+guard_stream watches a completion stream's length as it arrives. Once the
+text is within GUARD_MARGIN characters of the limit it ends the stream at the
+next sentence end, and at the latest when the limit itself is reached;
+closing the stream closes the provider request, so tokens past the limit are
+never generated. A text that still ends up over the limit (no sentence end
+in time, or a backend that answers in one piece) is condensed by the caller,
+see helpers.fit_to_limit; trim_to_limit is the last resort.
+"""
+import re
+import threading
+
+from utils.scoring import UPWORK_CHAR_LIMIT
+
+# Start looking for a place to stop this many characters before the limit:
+# a few sentences, so one nearly always ends in time
+GUARD_MARGIN = 600
+
+# A chunk this long is a whole answer from a backend that doesn't stream;
+# it is already paid for, so it is passed on whole rather than cut short
+WHOLE_CHUNK = GUARD_MARGIN
+
+# End of a sentence (with any closing quote or bracket) or of a paragraph.
+# The whitespace after it must be there already: a "." at the end of the text
+# so far may be the middle of a token ("3.5", "Node.js"), so that waits for
+# the next chunk
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*(?=\s)|\n\s*\n")
+
+# Characters before a chunk to search again: a sentence end held back at the
+# end of the text so far, completed by the whitespace the chunk starts with
+_LOOKBACK = 8
+
+_stats_lock = threading.Lock()
+_stats = {"guarded": 0, "sentence": 0, "limit": 0, "under": 0, "condensed": 0, "trimmed": 0}
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def record_fit(outcome):
+    """Count a text that was condensed or trimmed to fit (see helpers.fit_to_limit)."""
+    _record(outcome)
+
+
+def length_guard_stats():
+    """Streams guarded and how each ended: at a sentence end near the limit, at the limit, or under it.
+
+    "condensed" and "trimmed" count over-limit texts fixed afterwards.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def sentence_end(text, start=0):
+    """Index just past the first sentence end at or after start, or None."""
+    match = _SENTENCE_END.search(text, start)
+    return match.end() if match else None
+
+
+def guard_stream(chunks, limit=UPWORK_CHAR_LIMIT, margin=GUARD_MARGIN):
+    """Pass chunks through, ending the stream near limit at a sentence end."""
+    _record("guarded")
+    soft = limit - margin
+    text = ""
+    try:
+        for chunk in chunks:
+            if len(text) + len(chunk) <= soft or len(chunk) >= WHOLE_CHUNK:
+                text += chunk
+                yield chunk
+                if len(text) < limit:
+                    continue
+                _record("limit")
+                return
+
+            # Stop at the first sentence end past the soft limit; any earlier
+            # one complete in text would have stopped the stream already
+            combined = text + chunk
+            end = sentence_end(combined, max(soft, len(text) - _LOOKBACK))
+            if end is not None and end <= limit:
+                yield combined[len(text):end]
+                _record("sentence")
+                return
+            text = combined
+            yield chunk
+            if len(text) >= limit:
+                # No sentence end in time; what is over is condensed afterwards
+                _record("limit")
+                return
+        _record("under")
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def trim_to_limit(text, limit=UPWORK_CHAR_LIMIT):
+    """Cut text at its last sentence end that fits the limit (or at the limit itself)."""
+    if len(text) <= limit:
+        return text
+    # Searched in the whole text, so an end right at the limit sees what follows it
+    ends = [match.end() for match in _SENTENCE_END.finditer(text, 0, limit + 1) if match.end() <= limit]
+    return (text[:ends[-1]] if ends else text[:limit]).rstrip()
@@ -0,0 +1,134 @@
+"""Ollama model lifecycle: availability, warm-up, keep-alive and timings.
+
+A cold Ollama model is loaded on the first request that needs it, which can
+take longer than the generation timeout. preload() checks /api/tags and
+loads the model in a background thread as soon as it is selected, and every
+request passes keep_alive so the model (and its KV cache for the shared
+prompt prefix) stays resident between proposals. The timing fields Ollama
+returns with each response are kept per model, so load time can be told
+apart from prompt processing and generation time.
+"""
+import os
+import threading
+import time
+
+from utils.http_client import http_get, http_post
+from utils.prompt_budget import context_window
+from utils.rate_limit import parse_duration
+
+KEEP_ALIVE = os.environ.get("UPW_OLLAMA_KEEP_ALIVE", "30m")
+LOAD_TIMEOUT = 300  # seconds; large models can take minutes to load from disk
+RECHECK_AFTER = 30.0  # seconds before retrying a missing model or unreachable server
+
+_lock = threading.Lock()
+_warmups = {}
+_metrics = {}
+
+
+def _key(ollama_url, model):
+    return ollama_url.rstrip("/"), model
+
+
+def _keep_alive_seconds(keep_alive):
+    seconds = parse_duration(str(keep_alive))
+    return seconds if seconds is not None else 300.0
+
+
+def model_options(model):
+    """Options that decide how Ollama loads the model; the warm-up and every request send the same ones.
+
+    A request whose num_ctx differs from the loaded model's makes Ollama
+    reload it, which would throw the warm-up away.
+    """
+    return {"num_ctx": context_window("ollama", model)}
+
+
+def list_models(ollama_url, timeout=5):
+    """Names of the models pulled on the Ollama server ("llama2" and "llama2:latest")."""
+    response = http_get(f"{ollama_url.rstrip('/')}/api/tags", timeout=timeout)
+    response.raise_for_status()
+    names = set()
+    for entry in response.json().get("models", []):
+        name = entry.get("name") or entry.get("model") or ""
+        names.add(name)
+        if name.endswith(":latest"):
+            names.add(name[:-len(":latest")])
+    return names
+
+
+def timings(result):
+    """Seconds and token counts from the duration fields of a final Ollama response."""
+    def seconds(field):
+        return result.get(field, 0) / 1e9
+
+    eval_seconds = seconds("eval_duration")
+    return {
+        "load": round(seconds("load_duration"), 3),
+        "prompt_eval": round(seconds("prompt_eval_duration"), 3),
+        "generation": round(eval_seconds, 3),
+        "total": round(seconds("total_duration"), 3),
+        "prompt_tokens": result.get("prompt_eval_count", 0),
+        "output_tokens": result.get("eval_count", 0),
+        "tokens_per_second": round(result.get("eval_count", 0) / eval_seconds, 1) if eval_seconds else None,
+    }
+
+
+def record_timings(ollama_url, model, result):
+    """Keep the timings of a finished request; it also refreshed the keep-alive."""
+    metrics = timings(result)
+    with _lock:
+        _metrics[_key(ollama_url, model)] = dict(metrics, at=time.monotonic())
+        state = _warmups.get(_key(ollama_url, model))
+        if state is not None:
+            state["used_at"] = time.monotonic()
+    return metrics
+
+
+def last_timings(ollama_url, model):
+    """Timings of the most recent request to this model, or None."""
+    with _lock:
+        metrics = _metrics.get(_key(ollama_url, model))
+        return dict(metrics) if metrics else None
+
+
+def _warm_up(ollama_url, model, keep_alive, state):
+    try:
+        if model not in list_models(ollama_url):
+            state.update(status="missing", error=f"Model '{model}' is not pulled - run `ollama pull {model}`")
+            return
+        state["status"] = "loading"
+        # A request without a prompt just loads the model and holds it for keep_alive
+        response = http_post(
+            f"{ollama_url.rstrip('/')}/api/generate",
+            json={"model": model, "keep_alive": keep_alive, "stream": False, "options": model_options(model)},
+            timeout=LOAD_TIMEOUT,
+        )
+        response.raise_for_status()
+        load = timings(response.json())["load"]
+        state.update(status="ready", load_seconds=load, error=None, used_at=time.monotonic())
+    except Exception as e:
+        state.update(status="error", error=str(e))
+    finally:
+        state["checked_at"] = time.monotonic()
+
+
+def preload(ollama_url, model, keep_alive=KEEP_ALIVE):
+    """Start loading the model in the background unless it is (being) loaded already.
+
+    Returns a snapshot of the warm-up state: "status" is one of checking,
+    loading, ready, missing or error, with "load_seconds" once ready.
+    """
+    key = _key(ollama_url, model)
+    now = time.monotonic()
+    with _lock:
+        state = _warmups.get(key)
+        if state is not None:
+            busy = state["status"] in ("checking", "loading")
+            resident = state["status"] == "ready" and now - state["used_at"] < _keep_alive_seconds(keep_alive)
+            recently_failed = state["status"] in ("missing", "error") and now - state["checked_at"] < RECHECK_AFTER
+            if busy or resident or recently_failed:
+                return dict(state)
+        state = {"status": "checking", "load_seconds": None, "error": None, "used_at": 0.0, "checked_at": now}
+        _warmups[key] = state
+    threading.Thread(target=_warm_up, args=(ollama_url, model, keep_alive, state), daemon=True).start()
+    return dict(state)
@@ -0,0 +1,164 @@
+"""Early-exit, optionally page-parallel PDF text extraction.
+
+Every page is parsed exactly once and extraction stops as soon as the
+character budget is filled. The first BATCH_PAGES pages are always parsed
+in-process; most resumes fill the budget there. Only when they show sparse
+pages (little text per page, e.g. a design-heavy portfolio) and the pages
+still needed would take more than PARALLEL_MIN_SECONDS to parse one by one
+are those pages split between the workers of a process pool, one range and
+one copy of the PDF per worker. Per-page timings are reported alongside the
+text. PyPDF2 is imported on first use.
+
+The pool's workers come from a forkserver (spawn where there is none), never
+a fork of the server itself: the app process runs many threads, and a child
+forked while one of them holds a lock (logging, the import lock) can hang.
+"""
+import io
+import math
+import os
+import threading
+import time
+
+DEFAULT_TEXT_BUDGET = 8000
+# Estimated seconds of sequential parsing a process pool must save to be worth it
+PARALLEL_MIN_SECONDS = float(os.environ.get("UPW_PDF_PARALLEL_SECONDS", 1.0))
+BATCH_PAGES = 8
+MAX_WORKERS = min(os.cpu_count() or 1, 4)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if hasattr(source, "read"):
+        source.seek(0)
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _extract_pages(reader, start, stop):
+    results = []
+    for index in range(start, stop):
+        began = time.perf_counter()
+        text = reader.pages[index].extract_text() or ""
+        results.append((index, text, time.perf_counter() - began))
+    return results
+
+
+def _extract_page_range(data, start, stop):
+    """Process-pool worker: extract pages [start, stop) of a PDF given as bytes."""
+    from PyPDF2 import PdfReader
+
+    return _extract_pages(PdfReader(io.BytesIO(data)), start, stop)
+
+
+class _Collector:
+    """Joins page texts like the original extractor and tracks the budget."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.parts = []
+        self.length = -1  # no separator before the first part
+        self.timings = []
+
+    @property
+    def full(self):
+        return self.length >= self.budget
+
+    def add(self, results):
+        for index, text, seconds in results:
+            if self.full:
+                return
+            self.timings.append({"page": index + 1, "seconds": seconds, "chars": len(text)})
+            if text:
+                self.parts.append(text)
+                self.length += len(text) + 1
+
+    def text(self):
+        return "\n".join(self.parts)[:self.budget]
+
+
+def _pages_needed(collector, parsed):
+    """Pages still to parse to fill the budget, at the text per page seen so far."""
+    per_page = max(collector.length, 1) / parsed
+    return math.ceil((collector.budget - collector.length) / per_page)
+
+
+def extract_pdf(source, budget=DEFAULT_TEXT_BUDGET, parallel=None):
+    """Extract text from a PDF (file-like, bytes or path) with page-level timing.
+
+    parallel=None decides after the first BATCH_PAGES pages (see the module
+    docstring); True always fans the rest out to the pool, False never does.
+    Returns a dict with "text", "pages", "pages_parsed" (every page parsed,
+    including ones past the budget in a worker's range), "page_timings",
+    "parallel" (whether the pool was used) and "seconds".
+    """
+    from PyPDF2 import PdfReader
+
+    began = time.perf_counter()
+    data = read_bytes(source)
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+
+    collector = _Collector(budget)
+    parsed = 0
+    next_page = 0
+    while next_page < min(BATCH_PAGES, total) and not collector.full:
+        collector.add(_extract_pages(reader, next_page, next_page + 1))
+        parsed += 1
+        next_page += 1
+
+    used_pool = False
+    if not collector.full and next_page < total and MAX_WORKERS > 1 and parallel is not False:
+        wanted = min(total - next_page, math.ceil(_pages_needed(collector, parsed) * 1.25))
+        seconds_per_page = sum(timing["seconds"] for timing in collector.timings) / parsed
+        used_pool = parallel or wanted * seconds_per_page >= PARALLEL_MIN_SECONDS
+
+    if used_pool:
+        pool = _get_pool()
+        wanted = total - next_page if parallel else wanted
+        size = math.ceil(wanted / MAX_WORKERS)
+        futures = []
+        for start in range(next_page, next_page + wanted, size):
+            stop = min(start + size, next_page + wanted)
+            futures.append((stop - start, pool.submit(_extract_page_range, data, start, stop)))
+        next_page += wanted
+        # Ranges are consumed in page order; ones not started once the budget is full are dropped
+        for pages, future in futures:
+            if collector.full and future.cancel():
+                continue
+            parsed += pages
+            if not collector.full:
+                collector.add(future.result())
+
+    # Sequential for the rest (or everything past a too-low estimate)
+    while next_page < total and not collector.full:
+        collector.add(_extract_pages(reader, next_page, next_page + 1))
+        parsed += 1
+        next_page += 1
+
+    return {
+        "text": collector.text(),
+        "pages": total,
+        "pages_parsed": parsed,
+        "page_timings": collector.timings,
+        "parallel": used_pool,
+        "seconds": time.perf_counter() - began,
+    }
@@ -0,0 +1,108 @@
+"""Token estimates, context windows and budget allocation for prompts.
+
+Token counts are estimated from characters-per-token ratios per model
+family (no tokenizer download needed). The budget planner reserves the
+instruction block and provider overhead first, sizes the output to what is
+left of the context window, and shares the remainder between the job
+description and the background.
+"""
+import math
+
+# Context windows (tokens) of the models the app offers
+CONTEXT_WINDOWS = {
+    "llama3-70b-8192": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "llama2": 4096,
+    "codellama": 16384,
+    "mistral": 8192,
+    "neural-chat": 8192,
+    "starling-lm": 8192,
+    "microsoft/DialoGPT-medium": 1024,
+    "google/flan-t5-large": 512,
+    "EleutherAI/gpt-neo-2.7B": 2048,
+    "facebook/blenderbot-400M-distill": 128,
+}
+DEFAULT_CONTEXT = {"groq": 8192, "ollama": 4096, "huggingface": 1024}
+
+# Desired completion length per provider (the previous fixed settings)
+DEFAULT_OUTPUT_TOKENS = {"groq": 1200, "ollama": 1000, "huggingface": 1200}
+MIN_OUTPUT_TOKENS = 256
+
+# Job description + background: never more than this (more context rarely
+# improves the proposal but always costs latency and quota), never less than
+# the floor even when a tiny model can't fit the instructions
+MAX_CONTENT_TOKENS = 1500
+MIN_CONTENT_TOKENS = 200
+
+# Average characters per token by model family; lower is more conservative
+CHARS_PER_TOKEN = {"llama3": 4.0, "mixtral": 3.6, "mistral": 3.6, "llama2": 3.6, "codellama": 3.6}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+SAFETY_MARGIN = 0.05  # of the context window, for estimation error
+JD_SHARE = 0.45  # of the content budget, before redistributing slack
+
+
+def chars_per_token(model=None):
+    model = (model or "").lower()
+    for family, ratio in CHARS_PER_TOKEN.items():
+        if family in model:
+            return ratio
+    return DEFAULT_CHARS_PER_TOKEN
+
+
+def estimate_tokens(text, model=None):
+    """Rough token count for text under a model's tokenizer."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / chars_per_token(model))
+
+
+def context_window(provider, model=None):
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT.get(provider, 4096))
+
+
+def truncate_to_tokens(text, tokens, model=None):
+    """Cut text to roughly `tokens` tokens, at a word boundary where possible."""
+    if estimate_tokens(text, model) <= tokens:
+        return text
+    limit = max(int(tokens * chars_per_token(model)), 0)
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    if space > limit * 0.8:
+        cut = cut[:space]
+    return cut.rstrip()
+
+
+def split_budget(budget, jd_tokens, background_tokens):
+    """Share `budget` between JD and background; whatever one doesn't need goes to the other."""
+    jd_budget = min(jd_tokens, max(int(budget * JD_SHARE), budget - background_tokens))
+    background_budget = min(background_tokens, budget - jd_budget)
+    jd_budget = min(jd_tokens, budget - background_budget)
+    return jd_budget, background_budget
+
+
+def plan_budget(provider, model, fixed_tokens, jd_tokens, background_tokens, output_tokens=None):
+    """Decide output and content budgets for one request.
+
+    fixed_tokens covers everything that must never be cut: the instruction
+    block, headings and the provider's system prompt or wrapper.
+    """
+    window = context_window(provider, model)
+    usable = int(window * (1 - SAFETY_MARGIN))
+    wanted_output = output_tokens or DEFAULT_OUTPUT_TOKENS.get(provider, 1000)
+
+    # Content shrinks before the output does; the instructions are never cut
+    content = min(max(usable - fixed_tokens - wanted_output, MIN_CONTENT_TOKENS), MAX_CONTENT_TOKENS)
+    jd_budget, background_budget = split_budget(content, jd_tokens, background_tokens)
+    output = min(wanted_output, max(usable - fixed_tokens - jd_budget - background_budget, MIN_OUTPUT_TOKENS))
+
+    return {
+        "provider": provider,
+        "model": model,
+        "context_window": window,
+        "fixed_tokens": fixed_tokens,
+        "jd_budget": jd_budget,
+        "background_budget": background_budget,
+        "max_tokens": output,
+        "fits": fixed_tokens + jd_budget + background_budget + output <= window,
+    }
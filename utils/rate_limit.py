@@ -0,0 +1,167 @@
+"""Client-side rate limiting driven by Groq's x-ratelimit-* headers.
+
+One scheduler per API key is shared by every thread in the process (the
+Streamlit app, batch runs, concurrent get_free_completion calls). Each
+scheduler keeps a request bucket and a token bucket, re-seeded from the
+remaining/reset headers of every response and refilled continuously in
+between. Calls wait for headroom instead of being fired into a 429, and a
+429's retry-after pauses the whole key.
+"""
+import hashlib
+import re
+import threading
+import time
+
+MAX_WAIT = 60  # seconds a call may be held back before giving up
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def parse_duration(value):
+    """Parse Groq reset values such as "2m59.56s", "7.66s" or "120ms" into seconds."""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _UNIT_SECONDS[unit] for number, unit in parts)
+
+
+def _int_header(headers, name):
+    try:
+        return int(float(headers[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class _Bucket:
+    """Token bucket whose level and refill rate are learned from headers."""
+
+    def __init__(self):
+        self.limit = None
+        self.level = None  # unknown until the first response
+        self.rate = 0.0  # units per second
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.level is not None and self.limit is not None:
+            self.level = min(self.limit, self.level + self.rate * (now - self.updated))
+        self.updated = now
+
+    def learn(self, limit, remaining, reset, now):
+        self._refill(now)
+        if limit is not None:
+            self.limit = limit
+        if remaining is not None:
+            self.level = float(remaining)
+            if self.limit is None:
+                self.limit = remaining
+            if reset:
+                # Groq reports the time until the bucket is full again
+                self.rate = max(self.limit - remaining, 0) / reset
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if unknown or available)."""
+        self._refill(now)
+        if self.level is None or self.level >= amount:
+            return 0.0
+        if self.rate <= 0:
+            return MAX_WAIT
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if self.level is not None:
+            self.level -= amount
+
+    def snapshot(self):
+        self._refill(time.monotonic())
+        return {"limit": self.limit, "remaining": None if self.level is None else int(self.level)}
+
+
+class RateLimiter:
+    """Per-key scheduler holding request and token buckets."""
+
+    def __init__(self, max_wait=MAX_WAIT):
+        self.max_wait = max_wait
+        self.requests = _Bucket()
+        self.tokens = _Bucket()
+        self.blocked_until = 0.0
+        self.waited = 0.0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens=0):
+        """Block until one request and `tokens` tokens fit the learned budget."""
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.blocked_until - now,
+                    self.requests.wait_time(1, now),
+                    # never ask for more than a full bucket, or we'd wait forever
+                    self.tokens.wait_time(min(tokens, self.tokens.limit or tokens), now),
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+                if now + wait > deadline:
+                    raise Exception(f"Rate limit reached - try again in {int(wait) + 1}s")
+                self.throttled += 1
+                self.waited += wait
+                self._cond.wait(wait)
+
+    def update(self, headers):
+        """Re-seed both buckets from a response's x-ratelimit-* headers."""
+        now = time.monotonic()
+        with self._cond:
+            self.requests.learn(
+                _int_header(headers, "x-ratelimit-limit-requests"),
+                _int_header(headers, "x-ratelimit-remaining-requests"),
+                parse_duration(headers.get("x-ratelimit-reset-requests")),
+                now,
+            )
+            self.tokens.learn(
+                _int_header(headers, "x-ratelimit-limit-tokens"),
+                _int_header(headers, "x-ratelimit-remaining-tokens"),
+                parse_duration(headers.get("x-ratelimit-reset-tokens")),
+                now,
+            )
+            self._cond.notify_all()
+
+    def penalize(self, retry_after):
+        """Pause every caller on this key after a 429."""
+        delay = parse_duration(retry_after) if retry_after else None
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + (delay or 1.0))
+
+    def snapshot(self):
+        """Current headroom, for display."""
+        with self._cond:
+            return {
+                "requests": self.requests.snapshot(),
+                "tokens": self.tokens.snapshot(),
+                "blocked_for": max(self.blocked_until - time.monotonic(), 0.0),
+                "throttled": self.throttled,
+                "waited": self.waited,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key):
+    """Shared limiter for an API key (keyed on a hash, never the raw key)."""
+    key = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter()
+        return _limiters[key]
@@ -0,0 +1,154 @@
+"""Local relevance index over the candidate's background.
+
+The background (URL text + PDF text + manual notes) is split into chunks
+and indexed with a hashed TF-IDF matrix built in NumPy - no network, no
+model download. Chunks are scored against the job description and the
+best ones are packed into the prompt's background budget, instead of
+whatever happened to come first. Indexes are cached per background so
+generating against several postings reuses them.
+"""
+import hashlib
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.prompt_budget import estimate_tokens
+
+DIMENSIONS = 2 ** 14
+CHUNK_CHARS = 600
+CACHED_INDEXES = 32
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9+#]*")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this
+those through to too under until up very was we were what when where which while who whom why will with
+would you your yours
+""".split())
+
+
+def chunk_text(text, target_chars=CHUNK_CHARS):
+    """Split text into ~target_chars chunks along paragraph, then sentence, boundaries."""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= target_chars:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(s for s in _SENTENCE_END.split(paragraph) if s.strip())
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > target_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+        # Unbroken walls of text (scraped pages) still get cut
+        while len(current) > 2 * target_chars:
+            cut = current.rfind(" ", 0, target_chars) + 1 or target_chars
+            chunks.append(current[:cut].strip())
+            current = current[cut:].strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _term_ids(text):
+    return [zlib.crc32(token.encode("utf-8")) % DIMENSIONS
+            for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _term_counts(texts):
+    """(len(texts), DIMENSIONS) matrix of hashed term counts."""
+    counts = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    rows = []
+    cols = []
+    for row, text in enumerate(texts):
+        ids = _term_ids(text)
+        rows.extend([row] * len(ids))
+        cols.extend(ids)
+    np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), 1.0)
+    return counts
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class BackgroundIndex:
+    """Hashed TF-IDF vectors for the chunks of one background text."""
+
+    def __init__(self, text, target_chars=CHUNK_CHARS):
+        self.chunks = chunk_text(text, target_chars)
+        counts = _term_counts(self.chunks)
+        df = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(self.chunks)) / (1 + df)) + 1).astype(np.float32)
+        self.vectors = _normalize(self._weigh(counts))
+
+    def _weigh(self, counts):
+        # Sublinear term frequency times inverse document frequency
+        tf = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0)
+        return tf * self.idf
+
+    def scores(self, query):
+        """Cosine similarity of every chunk to the query text."""
+        if not self.chunks:
+            return np.zeros(0, dtype=np.float32)
+        q = _normalize(self._weigh(_term_counts([query]))[0])
+        return self.vectors @ q
+
+    def select(self, query, budget_tokens, model=None):
+        """Best-scoring chunks that fit budget_tokens, in their original order."""
+        scores = self.scores(query)
+        # Earlier chunks win ties (they tend to be summaries / headlines)
+        order = np.lexsort((np.arange(len(scores)), -scores))
+        chosen = []
+        used = 0
+        for i in order:
+            cost = estimate_tokens(self.chunks[i], model) + 1
+            if used + cost > budget_tokens:
+                continue
+            chosen.append(int(i))
+            used += cost
+        chosen.sort()
+        return [self.chunks[i] for i in chosen]
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_background_index(text):
+    """Index for a background text, reused across postings (LRU cached)."""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+    index = BackgroundIndex(text)
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def select_relevant_context(background, job_description, budget_tokens, model=None):
+    """Pack the background chunks most relevant to the job into budget_tokens.
+
+    Returns (text, chunks_used, chunks_total).
+    """
+    index = get_background_index(background)
+    chosen = index.select(job_description, budget_tokens, model)
+    return "\n\n".join(chosen), len(chosen), len(index.chunks)
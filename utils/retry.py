@@ -0,0 +1,170 @@
+"""Retry with exponential backoff, jitter and a per-request deadline.
+
+Used by every provider: 429/5xx responses and connection failures are
+retried, honouring the server's Retry-After header or Hugging Face's
+"estimated_time" hint when present, and never waiting past the request's
+deadline budget. Retries are counted per provider.
+
+Provider calls are blocking, so by default a backoff wait sleeps in the
+thread making the request (fine for batch.py). Inside deferred_waits() it
+raises RetryLater instead: the generation service (utils.jobs) gives up the
+job's executor thread and provider slot, waits on its event loop and runs
+the job again, and the retry carries on from the same attempt and deadline.
+"""
+import contextlib
+import contextvars
+import random
+import threading
+import time
+
+from utils.tracing import count
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class RetryPolicy:
+    """How many attempts, how long to back off and the total time budget."""
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=20.0, deadline=90.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def delay(self, attempt, hint=None):
+        """Full-jitter exponential backoff, or the server's hint plus a little jitter."""
+        if hint is not None:
+            return min(hint, self.max_delay) + random.uniform(0, 0.1 * min(hint, self.max_delay) + 0.05)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+# Set by deferred_waits(): {"resume": RetryLater or None}
+_deferral = contextvars.ContextVar("upw_retry_deferral", default=None)
+
+
+class RetryLater(Exception):
+    """A retry the caller waits out itself: run the request again after `delay` seconds."""
+
+    def __init__(self, provider, delay, attempt, started):
+        super().__init__(f"{provider} asked to retry in {delay:.1f}s")
+        self.provider = provider
+        self.delay = delay
+        self.attempt = attempt
+        self.started = started
+
+
+@contextlib.contextmanager
+def deferred_waits(resume=None):
+    """Make send_with_retry raise RetryLater instead of sleeping, in this context and threads bound to it.
+
+    Pass the RetryLater that was caught to resume: the next request to its
+    provider continues with its attempt count and deadline.
+    """
+    token = _deferral.set({"resume": resume})
+    try:
+        yield
+    finally:
+        _deferral.reset(token)
+
+
+def _record(provider, reason, waited=0.0, gave_up=False):
+    with _stats_lock:
+        entry = _stats.setdefault(provider, {"retries": 0, "gave_up": 0, "waited": 0.0, "reasons": {}})
+        if gave_up:
+            entry["gave_up"] += 1
+        else:
+            entry["retries"] += 1
+            entry["waited"] += waited
+            entry["reasons"][reason] = entry["reasons"].get(reason, 0) + 1
+
+
+def retry_stats():
+    """Retries, give-ups and time spent waiting, per provider."""
+    with _stats_lock:
+        return {provider: dict(entry, reasons=dict(entry["reasons"])) for provider, entry in _stats.items()}
+
+
+def _retry_hint(response):
+    """Seconds the server asked us to wait, if it said."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    if response.status_code == 503:
+        # Hugging Face: {"error": "Model ... is currently loading", "estimated_time": 3.2}
+        try:
+            estimated = response.json().get("estimated_time")
+            if estimated is not None:
+                return max(float(estimated), 0.0)
+        except (ValueError, AttributeError):
+            pass
+    return None
+
+
+def _classify(outcome):
+    """Return (reason, hint) if the outcome should be retried, else None."""
+    import requests
+
+    if isinstance(outcome, (requests.ConnectionError, requests.Timeout)):
+        return type(outcome).__name__, None
+    if isinstance(outcome, BaseException):
+        return None
+    if outcome.status_code in RETRY_STATUSES:
+        return f"HTTP {outcome.status_code}", _retry_hint(outcome)
+    return None
+
+
+def _plan(provider, policy, attempt, started, outcome):
+    """Delay before the next attempt, or None to stop retrying."""
+    verdict = _classify(outcome)
+    if verdict is None:
+        return None
+    reason, hint = verdict
+    delay = policy.delay(attempt, hint)
+    if attempt + 1 >= policy.max_attempts or time.monotonic() - started + delay > policy.deadline:
+        _record(provider, reason, gave_up=True)
+        return None
+    if not isinstance(outcome, BaseException):
+        outcome.close()
+    _record(provider, reason, waited=delay)
+    count(retries=1, retry_wait=delay)
+    return delay
+
+
+def send_with_retry(provider, send, policy=None):
+    """Call send() (which returns a response) until it succeeds or retries run out.
+
+    The last response is returned as-is, so callers keep their own
+    raise_for_status/error handling; the last exception is re-raised.
+    Inside deferred_waits(), a wait raises RetryLater instead of sleeping.
+    """
+    policy = policy or DEFAULT_POLICY
+    started = time.monotonic()
+    attempt = 0
+    deferral = _deferral.get()
+    resume = deferral["resume"] if deferral else None
+    if resume is not None and resume.provider == provider:
+        deferral["resume"] = None
+        started, attempt = resume.started, resume.attempt
+    while True:
+        try:
+            outcome = send()
+        except Exception as e:
+            outcome = e
+        delay = _plan(provider, policy, attempt, started, outcome)
+        if delay is None:
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome
+        if deferral is not None:
+            raise RetryLater(provider, delay, attempt + 1, started)
+        time.sleep(delay)
+        attempt += 1
+
@@ -0,0 +1,302 @@
+"""Latency-aware routing and hedged requests across providers.
+
+Rolling time-to-first-token (TTFT), latency and error statistics are kept
+per provider/model. A routed request goes to the best-scoring candidate; if
+no token has arrived within that candidate's p95 TTFT, a hedged duplicate is
+fired at the next candidate and whichever streams first wins, the other is
+cancelled. A circuit breaker takes repeatedly failing candidates out of
+rotation for a cool-down period; after it, a single trial request
+(half-open) decides whether the candidate is back.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+from utils.tracing import bind
+
+WINDOW = 50  # samples kept per provider/model
+MIN_SAMPLES = 5  # before p95 is trusted
+DEFAULT_HEDGE_AFTER = 3.0  # seconds, until we have enough samples
+MIN_HEDGE_AFTER = 0.5
+UNKNOWN_TTFT = 2.0  # optimistic prior so untried candidates get explored
+FAILURE_THRESHOLD = 3  # consecutive failures that open the breaker
+COOL_DOWN = 30.0  # seconds a tripped candidate stays out of rotation
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+class ProviderStats:
+    """Rolling statistics and circuit breaker for one provider/model."""
+
+    def __init__(self):
+        self.ttft = deque(maxlen=WINDOW)
+        self.latency = deque(maxlen=WINDOW)
+        self.outcomes = deque(maxlen=WINDOW)  # True for success
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.half_open = False
+        self.probing = False  # the half-open trial request is in flight
+
+    def available(self, now):
+        """Closed, or cooled down with no trial request in flight."""
+        return now >= self.open_until and not self.probing
+
+    def claim(self, now):
+        """Take the candidate for a request; once cooled down, only one trial request gets it."""
+        if not self.available(now):
+            return False
+        if self.open_until:
+            # Half-open: the trial's outcome closes the breaker or trips it again
+            self.half_open = True
+            self.probing = True
+        return True
+
+    def release(self):
+        """The trial request was cancelled before it told us anything: let the next one try."""
+        self.probing = False
+
+    def success(self, ttft, latency):
+        self.ttft.append(ttft)
+        self.latency.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.half_open = False
+        self.probing = False
+
+    def slower_than(self, seconds):
+        """A cancelled hedge loser: its TTFT was at least this long."""
+        self.ttft.append(seconds)
+
+    def failure(self, now):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.half_open or self.consecutive_failures >= FAILURE_THRESHOLD:
+            self.open_until = now + COOL_DOWN
+            self.half_open = False
+            self.probing = False
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def p50_ttft(self):
+        return _percentile(self.ttft, 50) if self.ttft else UNKNOWN_TTFT
+
+    def hedge_after(self):
+        if len(self.ttft) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_AFTER
+        return max(_percentile(self.ttft, 95), MIN_HEDGE_AFTER)
+
+    def score(self):
+        # Expected wait for a first token, inflated by how often this fails
+        return self.p50_ttft() / max(1.0 - self.error_rate(), 0.05)
+
+    def snapshot(self):
+        now = time.monotonic()
+        if now < self.open_until:
+            circuit = "open"
+        else:
+            circuit = "half-open" if self.open_until else "closed"
+        return {
+            "p50_ttft": round(self.p50_ttft(), 3) if self.ttft else None,
+            "p95_ttft": round(_percentile(self.ttft, 95), 3) if self.ttft else None,
+            "p50_latency": round(_percentile(self.latency, 50), 3) if self.latency else None,
+            "error_rate": round(self.error_rate(), 3),
+            "samples": len(self.outcomes),
+            "circuit": circuit,
+        }
+
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def candidate_name(candidate):
+    """"provider/model" label for a candidate dict."""
+    model = candidate.get("model") or candidate.get("model_name") or "default"
+    return f"{candidate['provider']}/{model}"
+
+
+def _stats_for(name):
+    with _lock:
+        if name not in _stats:
+            _stats[name] = ProviderStats()
+        return _stats[name]
+
+
+def routing_stats():
+    """Snapshot of every provider/model's rolling statistics."""
+    with _lock:
+        names = list(_stats)
+    return {name: _stats_for(name).snapshot() for name in names}
+
+
+def rank_candidates(candidates):
+    """Candidates whose breaker lets them through, best expected TTFT first."""
+    now = time.monotonic()
+    with _lock:
+        ranked = []
+        for order, candidate in enumerate(candidates):
+            stats = _stats.setdefault(candidate_name(candidate), ProviderStats())
+            if stats.available(now):
+                ranked.append((stats.score(), order, candidate))
+    return [candidate for _, _, candidate in sorted(ranked, key=lambda item: item[:2])]
+
+
+class _Attempt(threading.Thread):
+    """Streams one candidate into a shared queue until done or cancelled."""
+
+    def __init__(self, complete, prompt, candidate, seed, events):
+        super().__init__(daemon=True)
+        self.complete = complete
+        self.prompt = prompt
+        self.candidate = candidate
+        self.name_ = candidate_name(candidate)
+        self.seed = seed
+        self.events = events
+        self.cancelled = threading.Event()
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.trial = False  # the half-open breaker's trial request
+        self._attempt = bind(self._stream)  # continues the caller's trace
+
+    def run(self):
+        self._attempt()
+
+    def _stream(self):
+        kwargs = {k: v for k, v in self.candidate.items() if k != "provider"}
+        chunks = None
+        try:
+            chunks = self.complete(self.prompt, self.candidate["provider"], stream=True, seed=self.seed, **kwargs)
+            for chunk in chunks:
+                if self.cancelled.is_set():
+                    self._record_cancelled()
+                    return
+                if self.first_token_at is None:
+                    self.first_token_at = time.monotonic()
+                self.events.put(("token", self, chunk))
+            if not self.cancelled.is_set():
+                self._record(success=True)
+                self.events.put(("done", self, None))
+        except Exception as e:
+            if self.cancelled.is_set():
+                self._record_cancelled()
+            else:
+                self._record(success=False)
+                self.events.put(("error", self, e))
+        finally:
+            if chunks is not None and hasattr(chunks, "close"):
+                chunks.close()
+
+    def _record_cancelled(self):
+        with _lock:
+            stats = _stats.setdefault(self.name_, ProviderStats())
+            if self.trial:
+                stats.release()
+            if self.first_token_at is None:
+                stats.slower_than(time.monotonic() - self.started_at)
+
+    def _record(self, success):
+        now = time.monotonic()
+        with _lock:
+            stats = _stats.setdefault(self.name_, ProviderStats())
+            if success:
+                ttft = (self.first_token_at or now) - self.started_at
+                stats.success(ttft, now - self.started_at)
+            else:
+                stats.failure(now)
+
+
+def route_completion(complete, prompt, candidates, seed=None, hedge=True, route_info=None):
+    """Stream a completion from the fastest available candidate, hedging slow starts.
+
+    `complete` is get_free_completion; each candidate is a dict with a
+    "provider" key plus that provider's keyword arguments. If route_info is
+    a dict it receives the winner and whether a hedge was fired.
+    """
+    pending = rank_candidates(candidates)
+    if not pending:
+        raise Exception("No provider available - all candidates are failing, try again shortly")
+
+    events = queue.Queue()
+    running = []
+    errors = []
+    winner = None
+    finished = False
+    hedged = False
+
+    def launch():
+        # The next candidate that can still be claimed: another request may
+        # have taken a half-open candidate's trial since it was ranked
+        while pending:
+            candidate = pending.pop(0)
+            with _lock:
+                stats = _stats.setdefault(candidate_name(candidate), ProviderStats())
+                trial = bool(stats.open_until)
+                claimed = stats.claim(time.monotonic())
+            if claimed:
+                attempt = _Attempt(complete, prompt, candidate, seed, events)
+                attempt.trial = trial
+                running.append(attempt)
+                attempt.start()
+                return attempt
+        return None
+
+    try:
+        primary = launch()
+        if primary is None:
+            raise Exception("No provider available - all candidates are failing, try again shortly")
+        hedge_at = time.monotonic() + _stats_for(primary.name_).hedge_after()
+
+        # Wait for the first token, hedging or failing over as needed
+        while winner is None:
+            if not running:
+                if not pending:
+                    raise Exception("All providers failed: " + "; ".join(str(e) for e in errors))
+                launch()
+                continue
+            timeout = None
+            if hedge and not hedged and pending:
+                timeout = max(hedge_at - time.monotonic(), 0)
+            try:
+                kind, attempt, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                launch()
+                hedged = True
+                continue
+            if kind == "error":
+                errors.append(payload)
+                running.remove(attempt)
+            elif kind == "done":
+                # Finished without producing any text
+                winner = attempt
+                finished = True
+            else:
+                winner = attempt
+                yield payload
+
+        for attempt in running:
+            if attempt is not winner:
+                attempt.cancelled.set()
+        if isinstance(route_info, dict):
+            route_info.update({"provider": winner.name_, "hedged": hedged,
+                               "ttft": (winner.first_token_at or time.monotonic()) - winner.started_at})
+
+        # Drain the winner's stream; the loser's events are ignored
+        while not finished:
+            kind, attempt, payload = events.get()
+            if attempt is not winner:
+                continue
+            if kind == "token":
+                yield payload
+            elif kind == "done":
+                finished = True
+            else:
+                raise payload
+    finally:
+        for attempt in running:
+            attempt.cancelled.set()
@@ -0,0 +1,87 @@
+"""Fast local scoring of generated proposals, for ranking variants.
+
+A proposal is scored on three things the prompt asks for and Upwork
+enforces, without any model call:
+
+- length: Upwork rejects cover letters over UPWORK_CHAR_LIMIT characters and
+  the prompt asks for at least TARGET_MIN_CHARS
+- banned phrases: the stock openers the system prompt tells the model to avoid
+- keyword coverage: how many of the job description's most frequent terms
+  the proposal picks up
+"""
+import re
+from collections import Counter
+
+UPWORK_CHAR_LIMIT = 5000
+TARGET_MIN_CHARS = 3500
+
+# The "AVOID at all costs" / "NO GENERIC PHRASES" lines of the prompts
+BANNED_PHRASES = ("excited to work", "perfect fit", "extensive experience")
+
+KEYWORDS = 15
+# Words every posting uses that say nothing about this one
+JOB_BOILERPLATE = frozenset("""
+looking need needs needed someone experience experienced project projects work job must able please
+also help well like etc including include includes required requirements ideal candidate freelancer
+""".split())
+
+WEIGHTS = {"length": 0.4, "keywords": 0.4, "banned": 0.2}
+BANNED_PENALTY = 0.5  # per hit, of the banned-phrase component
+
+_TOKEN = re.compile(r"[a-z][a-z0-9+#]*")
+
+
+def _terms(text):
+    # Light stemming so "dashboards" matches "dashboard"
+    return [token[:-1] if len(token) > 4 and token.endswith("s") else token
+            for token in _TOKEN.findall(text.lower())]
+
+
+def jd_keywords(job_description, limit=KEYWORDS):
+    """The job description's most frequent content terms, most frequent first."""
+    from utils.retrieval import STOPWORDS
+
+    counts = Counter(term for term in _terms(job_description)
+                     if len(term) > 2 and term not in STOPWORDS and term not in JOB_BOILERPLATE)
+    return [term for term, _ in counts.most_common(limit)]
+
+
+def length_score(chars):
+    """1.0 inside [TARGET_MIN_CHARS, UPWORK_CHAR_LIMIT], falling off below, 0 over the limit."""
+    if chars > UPWORK_CHAR_LIMIT:
+        return 0.0
+    return min(chars / TARGET_MIN_CHARS, 1.0)
+
+
+def score_proposal(text, job_description=None, keywords=None):
+    """Score one proposal; pass keywords to reuse them across several proposals."""
+    if keywords is None:
+        keywords = jd_keywords(job_description or "")
+    lowered = text.lower()
+    banned = [phrase for phrase in BANNED_PHRASES if phrase in lowered]
+    terms = set(_terms(text))
+    covered = [keyword for keyword in keywords if keyword in terms]
+
+    parts = {
+        "length": length_score(len(text)),
+        "keywords": len(covered) / len(keywords) if keywords else 1.0,
+        "banned": max(1.0 - BANNED_PENALTY * len(banned), 0.0),
+    }
+    return {
+        "score": round(sum(WEIGHTS[name] * value for name, value in parts.items()), 4),
+        "chars": len(text),
+        "over_limit": len(text) > UPWORK_CHAR_LIMIT,
+        "length_score": round(parts["length"], 4),
+        "keyword_coverage": round(parts["keywords"], 4),
+        "missing_keywords": [keyword for keyword in keywords if keyword not in covered],
+        "banned_phrases": banned,
+    }
+
+
+def rank_variants(texts, job_description):
+    """Score texts (None entries are skipped) and return them best first, each with its "index"."""
+    keywords = jd_keywords(job_description)
+    ranked = [dict(score_proposal(text, keywords=keywords), index=index)
+              for index, text in enumerate(texts) if text is not None]
+    ranked.sort(key=lambda entry: (-entry["score"], entry["index"]))
+    return ranked
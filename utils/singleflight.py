@@ -0,0 +1,187 @@
+"""Single-flight coalescing of identical concurrent calls.
+
+When the same URL, PDF or prompt is requested again while the first call is
+still in flight, the later callers wait for that call and share its result
+or its exception instead of repeating the work. Streams are broadcast: one
+thread pulls the provider's stream and every caller iterates its own view
+of the chunks from the start; the upstream request is cancelled only once
+every caller has closed its stream. Nothing is kept after the call ends -
+this is not a cache.
+"""
+import threading
+
+from utils.tracing import annotate, bind
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    """Pulls one stream in a thread and replays it to every subscriber."""
+
+    def __init__(self, group, key, source):
+        self.group = group
+        self.key = key
+        self.source = source
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=bind(self._pump), daemon=True)
+        self.thread.start()
+
+    def _pump(self):
+        chunks = None
+        try:
+            chunks = self.source()
+            for chunk in chunks:
+                if self._abandoned():
+                    break  # everyone hung up: stop the upstream request
+                with self.cond:
+                    self.chunks.append(chunk)
+                    self.cond.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.group._lock:
+                self.group._drop(self.key, self)
+            with self.cond:
+                self.finished = True
+                self.cond.notify_all()
+            if chunks is not None and hasattr(chunks, "close"):
+                chunks.close()
+
+    def _abandoned(self):
+        # Checked under the group's lock so nobody joins a stream being dropped
+        with self.group._lock:
+            with self.cond:
+                if self.subscribers:
+                    return False
+            self.group._drop(self.key, self)
+            return True
+
+    def subscribe(self):
+        # Called with the group's lock held, so a finished broadcast is never joined
+        with self.cond:
+            self.subscribers += 1
+        return _Subscriber(self)
+
+
+class _Subscriber:
+    """One caller's iterator over a broadcast stream."""
+
+    def __init__(self, broadcast):
+        self.broadcast = broadcast
+        self.position = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        broadcast = self.broadcast
+        if self.closed:
+            raise StopIteration
+        with broadcast.cond:
+            while self.position >= len(broadcast.chunks) and not broadcast.finished:
+                broadcast.cond.wait()
+            if self.position < len(broadcast.chunks):
+                chunk = broadcast.chunks[self.position]
+                self.position += 1
+                return chunk
+        self.close()
+        if broadcast.error is not None:
+            raise broadcast.error
+        raise StopIteration
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            with self.broadcast.cond:
+                self.broadcast.subscribers -= 1
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self._stats = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    def do(self, key, func):
+        """Return func(), or the result of an identical call already in flight."""
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["executed"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        annotate(coalesced=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key, func):
+        """Iterate func()'s stream, sharing it with identical streams in flight."""
+        with self._lock:
+            self._stats["calls"] += 1
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast(self, key, func)
+                subscriber = broadcast.subscribe()
+                broadcast.start()
+                self._stats["executed"] += 1
+            else:
+                subscriber = broadcast.subscribe()
+                self._stats["coalesced"] += 1
+        return subscriber
+
+    def _drop(self, key, broadcast):
+        # Called with self._lock held
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls) + len(self._streams))
+
+
+url_flights = SingleFlight("url")
+pdf_flights = SingleFlight("pdf")
+completion_flights = SingleFlight("completion")
+
+
+def singleflight_stats():
+    """Calls, executions and coalesced calls per single-flight group."""
+    return {group.name: group.stats() for group in (url_flights, pdf_flights, completion_flights)}
@@ -0,0 +1,319 @@
+"""Lightweight tracing of the generation pipeline.
+
+Stages are wrapped in spans (`with span("pdf_parse", bytes=n) as s:`) that
+record their duration plus whatever attributes the stage knows - bytes,
+chars, tokens, provider, model, retries. Spans nest through a context
+variable; threads that continue a request's work (job workers, stream pumps,
+hedged attempts) run in a copy of the submitting context so their spans
+join the same trace. When the root span ends the trace is appended to the
+JSONL trace log (UPW_TRACE_LOG, rotated to a single .1 backup past
+UPW_TRACE_LOG_MAX_BYTES) and kept in memory for the in-app panel; spans that
+finish later in background work are appended as they end. Every
+span is also folded into Prometheus-style counters, served as text by
+start_metrics_server() (port UPW_METRICS_PORT).
+"""
+import contextvars
+import functools
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from utils.prompt_budget import chars_per_token
+from utils.url_cache import DEFAULT_CACHE_DIR
+
+TRACE_LOG = os.environ.get("UPW_TRACE_LOG", os.path.join(DEFAULT_CACHE_DIR, "traces.jsonl"))
+TRACE_LOG_MAX_BYTES = int(os.environ.get("UPW_TRACE_LOG_MAX_BYTES", 10 * 1024 * 1024))
+RECENT_TRACES = 50
+METRICS_PORT = os.environ.get("UPW_METRICS_PORT")
+
+# Attributes that are summed per stage into Prometheus counters
+COUNTED = ("bytes", "chars", "tokens", "retries")
+
+_current = contextvars.ContextVar("upw_span", default=None)
+_lock = threading.Lock()
+_write_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_TRACES)
+_stage_totals = {}
+_server = None
+
+
+class _Trace:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.spans = []
+        self.logged = False
+
+
+class Span:
+    """One timed stage of a trace."""
+
+    def __init__(self, name, trace, parent, attrs):
+        self.name = name
+        self.trace = trace
+        self.parent = parent
+        self.id = uuid.uuid4().hex[:16]
+        self.attrs = dict(attrs)
+        self.error = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.children = 0
+        self.discarded = False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **amounts):
+        for name, amount in amounts.items():
+            self.attrs[name] = self.attrs.get(name, 0) + amount
+
+    def discard(self):
+        """Leave this span out of the trace when it ends; a root span takes its trace with it."""
+        self.discarded = True
+
+    def end(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if self.discarded:
+            return
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        record = {
+            "trace": self.trace.id,
+            "span": self.id,
+            "parent": self.parent.id if self.parent else None,
+            "name": self.name,
+            "start": round(self.started_at, 6),
+            "duration": round(self.duration, 6),
+            "error": self.error,
+            **self.attrs,
+        }
+        with _lock:
+            self.trace.spans.append(record)
+            _fold(record)
+            if self.parent is None:
+                self.trace.logged = True
+                _recent.append({"trace": self.trace.id, "start": record["start"], "spans": self.trace.spans})
+                pending = list(self.trace.spans)
+            else:
+                pending = [record] if self.trace.logged else []
+        _write(pending)
+
+
+def _fold(record):
+    # Called with _lock held
+    totals = _stage_totals.setdefault(record["name"], dict({"count": 0, "errors": 0, "seconds": 0.0},
+                                                           **{name: 0 for name in COUNTED}))
+    totals["count"] += 1
+    totals["seconds"] += record["duration"]
+    if record["error"]:
+        totals["errors"] += 1
+    for name in COUNTED:
+        value = record.get(name)
+        if isinstance(value, (int, float)):
+            totals[name] += value
+
+
+def _write(records):
+    if not records:
+        return
+    lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+    try:
+        with _write_lock:
+            os.makedirs(os.path.dirname(TRACE_LOG) or ".", exist_ok=True)
+            if os.path.exists(TRACE_LOG) and os.path.getsize(TRACE_LOG) > TRACE_LOG_MAX_BYTES:
+                os.replace(TRACE_LOG, TRACE_LOG + ".1")
+            with open(TRACE_LOG, "a", encoding="utf-8") as f:
+                f.write(lines)
+    except OSError:
+        pass  # tracing must never break a generation
+
+
+def start_span(name, **attrs):
+    """Open a span under the current one (or a new trace) without making it current."""
+    parent = _current.get()
+    if parent is None:
+        return Span(name, _Trace(), None, attrs)
+    with _lock:
+        parent.children += 1
+    return Span(name, parent.trace, parent, attrs)
+
+
+class span:
+    """Context manager: a span that is current for the code inside it."""
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.span = start_span(self.name, **self.attrs)
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        self.span.end(exc)
+        return False
+
+
+def traced(name):
+    """Decorator: run the function inside a span called name."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def annotate(**attrs):
+    """Set attributes on the current span, if any."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def record_error(error):
+    """Mark the current span failed for an error the stage handles itself."""
+    current = _current.get()
+    if current is not None:
+        current.error = f"{type(error).__name__}: {error}"
+
+
+def count(**amounts):
+    """Add to numeric attributes of the current span, if any."""
+    current = _current.get()
+    if current is not None:
+        current.add(**amounts)
+
+
+def traced_stream(name, open_chunks, **attrs):
+    """Open a chunk stream inside a span that lasts until the stream ends.
+
+    open_chunks() is called with the span current, so threads it starts to
+    feed the stream (a single-flight pump, hedged attempts) continue the span
+    and their requests and retries are attributed to it. Time to first
+    chunk, characters and estimated tokens streamed are recorded.
+    """
+    current = start_span(name, **attrs)
+    token = _current.set(current)
+    try:
+        chunks = open_chunks()
+    except BaseException as e:
+        current.end(e if isinstance(e, Exception) else None)
+        raise
+    finally:
+        _current.reset(token)
+    return _relay(current, chunks)
+
+
+def _relay(current, chunks):
+    # The span is current again whenever the stream is advanced
+    chars = 0
+    error = None
+    try:
+        while True:
+            token = _current.set(current)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                _current.reset(token)
+            if not chars:
+                current.set(ttft=round(time.perf_counter() - current._started, 6))
+            chars += len(chunk)
+            yield chunk
+    except BaseException as e:
+        error = e if isinstance(e, Exception) else None
+        raise
+    finally:
+        current.set(chars=chars, tokens=math.ceil(chars / chars_per_token(current.attrs.get("model"))))
+        if hasattr(chunks, "close"):
+            chunks.close()
+        current.end(error)
+
+
+def bind(func):
+    """func running in a copy of the current context (for handing work to other threads)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def recent_traces(limit=RECENT_TRACES):
+    """The last `limit` traces (spans in start order), newest first."""
+    with _lock:
+        traces = list(_recent)[-limit:][::-1]
+        return [dict(trace, spans=sorted(trace["spans"], key=lambda s: s["start"])) for trace in traces]
+
+
+def stage_totals():
+    with _lock:
+        return {name: dict(totals) for name, totals in _stage_totals.items()}
+
+
+def render_metrics():
+    """Per-stage totals in the Prometheus text exposition format."""
+    totals = stage_totals()
+    lines = [
+        "# HELP upw_stage_seconds_total Time spent in each pipeline stage.",
+        "# TYPE upw_stage_seconds_total counter",
+    ]
+    lines += [f'upw_stage_seconds_total{{stage="{name}"}} {t["seconds"]:.6f}' for name, t in totals.items()]
+    lines += ["# HELP upw_stage_calls_total Spans recorded per stage.", "# TYPE upw_stage_calls_total counter"]
+    lines += [f'upw_stage_calls_total{{stage="{name}"}} {t["count"]}' for name, t in totals.items()]
+    lines += ["# HELP upw_stage_errors_total Failed spans per stage.", "# TYPE upw_stage_errors_total counter"]
+    lines += [f'upw_stage_errors_total{{stage="{name}"}} {t["errors"]}' for name, t in totals.items()]
+    for attr in COUNTED:
+        lines += [f"# HELP upw_stage_{attr}_total Sum of the {attr} attribute per stage.",
+                  f"# TYPE upw_stage_{attr}_total counter"]
+        lines += [f'upw_stage_{attr}_total{{stage="{name}"}} {t[attr]}' for name, t in totals.items()]
+    return "\n".join(lines) + "\n"
+
+
+def _metrics_server(port):
+    """HTTP server for /metrics; http.server is only imported when metrics are turned on."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer(("0.0.0.0", int(port)), MetricsHandler)
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics on the given port (default UPW_METRICS_PORT) once per process.
+
+    Returns the port, or None when no port is configured or it is taken.
+    """
+    global _server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _lock:
+        if _server is None:
+            try:
+                _server = _metrics_server(port)
+            except OSError:
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        return _server.server_port
@@ -0,0 +1,123 @@
+"""Persistent on-disk cache of extracted page text.
+
+Entries keep the cleaned text together with the page's ETag and
+Last-Modified validators so extract_text_from_url can revalidate with a
+conditional GET; a 304 answer skips both the download and the parse.
+Eviction is least-recently-used by total stored bytes.
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "UPW_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "upw-proposal-gen")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("UPW_URL_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """Canonical cache key: lower-cased scheme/host, no default port, fragment or query order."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+class UrlCache:
+    """SQLite-backed store of page text and HTTP validators, LRU by bytes."""
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, "url_cache.sqlite3")
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access)")
+        self._conn.commit()
+
+    def get(self, url):
+        """Return {"text", "etag", "last_modified"} for a URL, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, etag, last_modified FROM pages WHERE url = ?", (normalize_url(url),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"text": row[0], "etag": row[1], "last_modified": row[2]}
+
+    def touch(self, url):
+        """Mark an entry as recently used (e.g. after a 304 revalidation)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET last_access = ? WHERE url = ?", (time.time(), normalize_url(url))
+            )
+            self._conn.commit()
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """Store extracted text and validators, then evict down to max_bytes."""
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), text, etag, last_modified, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for url, size in self._conn.execute("SELECT url, size FROM pages ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            victims.append((url,))
+            total -= size
+        self._conn.executemany("DELETE FROM pages WHERE url = ?", victims)
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages"
+            ).fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_url_cache():
+    """Process-wide URL cache, or None when the cache directory is unusable."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = UrlCache()
+                except (OSError, sqlite3.Error):
+                    return None
+    return _cache